@@ -0,0 +1,98 @@
+#aggregates.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#online rollups of the fleet, used by pdm.py when output_mode='aggregates'. Rather than emitting
+#per-sensor telemetry rows, every timestep's fleet production, devices per state, and busy
+#technicians, and the failures, repairs, and pdm maintenances per issue, are summed into windows
+#of aggregate_window timesteps. Those sums are converted to fleet means when written to
+#output_folder/aggregates_<strategy>.csv, one row per window, so comparing strategies needs
+#neither the telemetry file nor the notebooks' post-processing. Since the window sums add, the
+#shards' aggregates are merged by adding them.
+
+
+#imports
+import numpy as np
+from helper_fns import state_names
+
+#get the run's aggregates, or None when output_mode='rows'
+def initialize_aggregates(params, issue_names):
+    if (params['output_mode'] == 'rows'):
+        return None
+    if (params['output_mode'] != 'aggregates'):
+        raise ValueError("output_mode = " + str(params['output_mode']) + " is not one of ['rows', 'aggregates']")
+    aggregates = {'window':params['aggregate_window'], 'issue_names':issue_names, 'windows':{}}
+    return aggregates
+
+#get the sums of the window that contains time
+def window_sums(aggregates, time):
+    window = aggregates['window']
+    window_start = (time//window)*window
+    sums = aggregates['windows'].get(window_start)
+    if (sums is None):
+        N_issues = len(aggregates['issue_names'])
+        sums = {'N_timesteps':0, 'production':0.0, 'busy_technicians':0,
+            'state_counts':np.zeros(len(state_names), dtype=np.int64),
+            'N_failures':np.zeros(N_issues, dtype=np.int64), 'N_repairs':np.zeros(N_issues, dtype=np.int64),
+            'N_maintenance':np.zeros(N_issues, dtype=np.int64)}
+        aggregates['windows'][window_start] = sums
+    return sums
+
+#add one timestep's fleet production, busy technicians, and devices per state to the rollups
+def add_timestep(aggregates, time, production, busy_technicians, state_counts):
+    sums = window_sums(aggregates, time)
+    sums['N_timesteps'] += 1
+    sums['production'] += production
+    sums['busy_technicians'] += busy_technicians
+    sums['state_counts'] += state_counts
+    return
+
+#count the kind='N_failures', 'N_repairs', or 'N_maintenance' events of issueIDs at time
+def add_issues(aggregates, kind, time, issueIDs):
+    if (len(issueIDs) == 0):
+        return
+    sums = window_sums(aggregates, time)
+    sums[kind] += np.bincount(issueIDs, minlength=len(aggregates['issue_names']))
+    return
+
+#get the issueIDs of the devices that repairs are servicing
+def repair_issueIDs(devices, repairs):
+    return devices['issue'][[repair['deviceID'] for repair in repairs]]
+
+#add shard_aggregates' window sums to aggregates
+def merge_aggregates(aggregates, shard_aggregates):
+    for window_start, shard_sums in shard_aggregates['windows'].iteritems():
+        sums = window_sums(aggregates, window_start)
+        for key in sums.keys():
+            sums[key] += shard_sums[key]
+    return
+
+#write the aggregates to output_folder/aggregates_<strategy>.csv, with the fleet's mean production
+#per device, the mean number of devices per state, technician utilization, and the fatal issues'
+#failures, repairs, and maintenances in each window
+def write_aggregates(params, aggregates):
+    import pandas as pd
+    issues = params['issues']
+    fatal_issues = [issue for issue in aggregates['issue_names'] if (issues[issue]['fatal'] == True)]
+    rows = []
+    for window_start in sorted(aggregates['windows'].keys()):
+        sums = aggregates['windows'][window_start]
+        N_timesteps = sums['N_timesteps']
+        row = {'time':window_start, 'N_timesteps':N_timesteps,
+            'mean_production':sums['production']/(params['N_devices']*N_timesteps),
+            'technician_utilization':float(sums['busy_technicians'])/max(params['N_technicians']*N_timesteps, 1)}
+        for state_name, count in zip(state_names, sums['state_counts']):
+            row['N_' + state_name] = float(count)/N_timesteps
+        for kind in ['N_failures', 'N_repairs', 'N_maintenance']:
+            for issue in fatal_issues:
+                row[kind + '_' + issue] = sums[kind][issues[issue]['ID']]
+        rows += [row]
+    columns = ['time', 'N_timesteps', 'mean_production', 'technician_utilization'] + \
+        ['N_' + state_name for state_name in state_names] + \
+        [kind + '_' + issue for kind in ['N_failures', 'N_repairs', 'N_maintenance'] for issue in fatal_issues]
+    df = pd.DataFrame(rows, columns=columns)
+    file = params['output_folder'] + 'aggregates_' + params['strategy'] + '.csv'
+    df.to_csv(file, index=False)
+    print file + '.shape = ', df.shape
+    return df
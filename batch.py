@@ -0,0 +1,176 @@
+#batch.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#multi-timestep kernel, used by pdm.py when kernel='batch'. Between events, operating devices' sensors
+#random-walk and every device's damage accumulates deterministically along that walk, so simulate_batch
+#advances the fleet up to batch_size timesteps at a time: sensor paths are cumulative sums over a
+#(timesteps, devices, sensors) block of draws, and damage, production, failure checks, and telemetry are
+#computed for the whole block at once. A block ends before the next repair completion or pdm check,
+#and is truncated at the first timestep having a failure, which is then replayed by simulate_timestep.
+#This requires rng='counter', since those draws depend only on the timestep and not on how many
+#draws were made earlier, and then trajectories and outputs are identical to kernel='step'.
+#Blocks grow and shrink with the time between failures, so that little work is discarded.
+
+
+#imports
+import numpy as np
+from simulation import *
+from streams import block_range_draws
+
+#get the timestep that the block starting at time must end before, which is time when the block
+#can't start because failed devices are waiting for idle technicians
+def block_stop_time(sim, time, time_stop):
+    params = sim['params']
+    devices = sim['devices']
+    state = devices['state']
+    if (pool_size(sim['technicians']['idle']) > 0) and np.any(state == FAILED):
+        return time
+    #complete_maintenance releases a device when time > repair_complete_time
+    busy = (state == REPAIR) | (state == MAINTENANCE)
+    if (np.any(busy)):
+        time_stop = min(time_stop, devices['repair_complete_time'][busy].min() + 1)
+    if (params['strategy'] == 'pdm'):
+        pdm_skip_time = params['pdm_skip_time']
+        time_stop = min(time_stop, time + (-time)%pdm_skip_time)
+    return time_stop
+
+#compute the devices' sensor values, damage, and production over the N_times timesteps starting at
+#time, with shapes (N_times, N_devices, N_sensors), (N_issues, N_times, N_devices), and (N_times, N_devices),
+#assuming that no device changes state, and also the index of the first timestep having a failure
+def compute_block(devices, issues, time, N_times, sensor_sigma, damage_engine='numpy'):
+    streams = devices['streams']
+    operating = (devices['state'] == OPERATING)
+    sensor_values = devices['sensors']['values']
+    N_devices, N_sensors = sensor_values.shape
+
+    #random-walk operating devices' sensors, with cumsum adding each timestep's deltas in turn as update_sensors does
+    deltas = sensor_sigma*block_range_draws(streams, 'sensors', 'normal', time, N_times, N_sensors).transpose(0, 2, 1)
+    deltas[:, ~operating, :] = 0.0
+    values = np.cumsum(np.concatenate([sensor_values[np.newaxis], deltas]), axis=0)[1:]
+
+    #accumulate damage due to issues
+    damage_increments, crud_damage = compute_damage_increments(values.reshape(-1, N_sensors), issues, engine=damage_engine)
+    damage = np.empty((len(devices['issue_names']), N_times, N_devices))
+    for issueID, damg in damage_increments:
+        damg = np.concatenate([devices['damage'][issueID][np.newaxis], damg.reshape(N_times, N_devices)])
+        damage[issueID] = np.cumsum(damg, axis=0)[1:]
+
+    #compute production as compute_production does
+    production = 1.0 - crud_damage.reshape(N_times, N_devices)
+    production[production < 0.0] = 0.0
+    production[:, ~operating] = 0.0
+
+    #find the first timestep where check_devices would fail any device
+    uniforms = block_range_draws(streams, 'failures', 'uniform', time, N_times, len(devices['issue_names']))
+    failures = np.zeros((N_times, N_devices), dtype=bool)
+    for issue in issues.keys():
+        if (issues[issue]['fatal']):
+            issueID = issues[issue]['ID']
+            failures |= (uniforms[:, issueID, :] < damage[issueID])
+    failures &= operating
+    N_quiet = N_times
+    failure_times = np.flatnonzero(failures.any(axis=1))
+    if (len(failure_times) > 0):
+        N_quiet = failure_times[0]
+    block = {'values':values, 'damage':damage, 'production':production}
+    return block, N_quiet
+
+#append the sensor telemetry and fleet counts of the block's first N_times timesteps starting at time
+#to telemetry_buffer in the order that generate_telemetry does, and update output_times
+def append_block_telemetry(devices, technicians, block, time, N_times, output_interval, telemetry_buffer):
+    output_times = devices['sensors']['output_times']
+    N_devices, N_sensors = output_times.shape
+    sensor_codes = telemetry_buffer['categories']['sensor']
+    #a sensor reports at the first timestep after its output_time and then every output_interval + 1 timesteps
+    period = output_interval + 1
+    keys = []
+    times = []
+    deviceIDs = []
+    codes = []
+    values = []
+    for sensorID in range(N_sensors):
+        first = np.maximum(output_times[:, sensorID] + 1 - time, 0)
+        N_reports = np.maximum((N_times - first + period - 1)//period, 0)
+        reporting_deviceIDs = np.repeat(devices['IDs'], N_reports)
+        report = np.arange(N_reports.sum()) - np.repeat(np.cumsum(N_reports) - N_reports, N_reports)
+        t = np.repeat(first, N_reports) + report*period
+        reported = (N_reports > 0)
+        output_times[reported, sensorID] = time + first[reported] + (N_reports[reported] - 1)*period + output_interval
+        #each report is a row of the sensor's value followed by a row of the device's production_rate
+        key = (t*(N_sensors + 1) + sensorID)*N_devices + reporting_deviceIDs
+        keys += [np.repeat(key, 2)]
+        times += [np.repeat(t, 2)]
+        deviceIDs += [np.repeat(reporting_deviceIDs, 2)]
+        code = [sensor_codes.index(devices['sensors']['names'][sensorID]), sensor_codes.index('production_rate')]
+        codes += [np.tile(code, len(t))]
+        row_values = np.empty((len(t), 2))
+        row_values[:, 0] = block['values'][t, reporting_deviceIDs, sensorID]
+        row_values[:, 1] = block['production'][t, reporting_deviceIDs]
+        values += [row_values.ravel()]
+    #fleet counts follow each timestep's sensor telemetry, and are constant during the block
+    N_technicians = len(technicians['IDs']) - pool_size(technicians['idle'])
+    state_counts = devices['state_counts']
+    names = ['N_technicians'] + ['N_' + state_name for state_name in state_names]
+    code = [sensor_codes.index(name) for name in names]
+    t = np.repeat(np.arange(N_times), len(names))
+    keys += [(t*(N_sensors + 1) + N_sensors)*N_devices]
+    times += [t]
+    deviceIDs += [np.zeros(len(t), dtype=int) - 1]
+    codes += [np.tile(code, N_times)]
+    values += [np.tile(np.append(N_technicians, state_counts).astype(float), N_times)]
+    #order rows by timestep, sensor, and deviceID, with mergesort keeping each report's rows in order
+    order = np.argsort(np.concatenate(keys), kind='mergesort')
+    rows = {'time':time + np.concatenate(times)[order], 'deviceID':np.concatenate(deviceIDs)[order],
+        'sensor':np.concatenate(codes)[order], 'value':np.concatenate(values)[order]}
+    append_rows(telemetry_buffer, rows)
+    return
+
+#commit the block's first N_times timesteps starting at time to the devices, telemetry, and summary
+def commit_block(sim, block, time, N_times):
+    devices = sim['devices']
+    technicians = sim['technicians']
+    last = N_times - 1
+    devices['sensors']['values'][:] = block['values'][last]
+    devices['damage'][:] = block['damage'][:, last]
+    devices['production_rate'][:] = block['production'][last]
+    aggregates = sim['aggregates']
+    if (aggregates is None):
+        append_block_telemetry(devices, technicians, block, time, N_times, sim['params']['output_interval'],
+            sim['telemetry_buffer'])
+    summary = sim['summary']
+    busy_technicians = len(technicians['IDs']) - pool_size(technicians['idle'])
+    for t, production in enumerate(block['production'][0:N_times]):
+        summary['production'] += production.sum()
+        if (aggregates is not None):
+            add_timestep(aggregates, time + t, production.sum(), busy_technicians, devices['state_counts'])
+    summary['busy_technicians'] += N_times*busy_technicians
+    return
+
+#advance the simulation by a block of timesteps starting at time and ending before time_stop,
+#and return the next timestep to be simulated. When failures are so frequent that blocks are
+#shorter than 2 timesteps, single timesteps are simulated while the block length grows back
+def simulate_batch(sim, time, time_stop):
+    N_times = min(sim['batch_length'], block_stop_time(sim, time, time_stop) - time)
+    if (N_times < 2):
+        if (sim['batch_length'] < 2):
+            sim['batch_length'] += 1
+        simulate_timestep(sim, time)
+        return time + 1
+    params = sim['params']
+    timing = phase_times(sim)
+    clock = start_lap(timing)
+    block, N_quiet = compute_block(sim['devices'], params['issues'], time, N_times, params['sensor_sigma'],
+        damage_engine=params['damage_engine'])
+    clock = lap(timing, 'compute_block', clock)
+    if (N_quiet > 0):
+        commit_block(sim, block, time, N_quiet)
+    clock = lap(timing, 'commit_block', clock)
+    if (N_quiet == N_times):
+        sim['batch_length'] = min(2*sim['batch_length'], params['batch_size'])
+        return time + N_times
+    #replay the timestep having a failure, and size the next block from the time between failures
+    sim['batch_length'] = 2*N_quiet
+    simulate_timestep(sim, time + N_quiet)
+    return time + N_quiet + 1
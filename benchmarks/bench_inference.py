@@ -0,0 +1,66 @@
+#bench_inference.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#benchmark the latency of one pdm_check model evaluation at several fleet sizes, comparing
+#sklearn's predict_proba on the full fleet to the flattened-forest engine on operating devices.
+#small synthetic models are trained here, so this runs without any rtf data. Execute via
+#
+#    $PYTHON_PATH/python benchmarks/bench_inference.py
+
+#imports
+import sys
+import os
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import time as tm
+import numpy as np
+import pandas as pd
+from forest_inference import flatten_forests, predict_forests
+from synthetic import train_synthetic_models
+
+#return the best of N_repeats timings of fn, in msec
+def time_fn(fn, N_repeats):
+    times = []
+    for repeat in range(N_repeats):
+        clock_start = tm.time()
+        fn()
+        times += [(tm.time() - clock_start)*1000.0]
+    return min(times)
+
+#settings
+y_cols = ['jammed_rotor_in_400', 'cracked_valve_in_400', 'broken_gear_in_400']
+n_estimators = 51
+operating_fraction = 0.9
+N_repeats = 3
+models = train_synthetic_models(y_cols, 20000, n_estimators, 17)
+forest = flatten_forests(models, y_cols)
+import multiprocessing
+n_threads = multiprocessing.cpu_count()
+forest_threaded = flatten_forests(models, y_cols, n_threads=n_threads)
+print 'n_estimators = ', n_estimators, '\tforest nodes = ', len(forest['feature']), '\tn_threads = ', n_threads
+
+#time one check at each fleet size
+cols = ['temperature', 'pressure', 'load', 'production_rate'] + ['time_since_' + y_col for y_col in y_cols]
+results = []
+for N_devices in [1000, 10000, 100000]:
+    x = np.random.normal(size=(N_devices, 7))
+    x[:, 4:] = np.random.uniform(0, 5000, size=(N_devices, 3))
+    operating = (np.random.uniform(size=N_devices) < operating_fraction)
+    def sklearn_check():
+        df = pd.DataFrame(x, columns=cols)
+        return [models[y_col].predict_proba(df)[:, 1] for y_col in y_cols]
+    def flat_check():
+        return predict_forests(forest, x[operating])
+    def flat_threaded_check():
+        return predict_forests(forest_threaded, x[operating])
+    sklearn_probs = np.array(sklearn_check())[:, operating]
+    max_diff = np.abs(flat_check() - sklearn_probs).max()
+    sklearn_msec = time_fn(sklearn_check, N_repeats)
+    flat_msec = time_fn(flat_check, N_repeats)
+    flat_threaded_msec = time_fn(flat_threaded_check, N_repeats)
+    results += [{'N_devices':N_devices, 'sklearn_msec':sklearn_msec, 'flat_msec':flat_msec,
+        'flat_threaded_msec':flat_threaded_msec, 'max_prob_diff':max_diff}]
+cols = ['N_devices', 'sklearn_msec', 'flat_msec', 'flat_threaded_msec', 'max_prob_diff']
+results = pd.DataFrame(results)[cols]
+print results.to_string(index=False)
@@ -0,0 +1,299 @@
+#bench_suite.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#scaling benchmarks for the simulator and the data-prep pipeline. This executes whole pdm.py runs
+#over the fleet sizes, technician ratios, and timesteps set in the inputs file, with instrument=True
+#so that every phase of the simulation loop is timed too, benchmarks pdm_check with small synthetic
+#models, and benchmarks prep_rtf_data, prep_rtf_data_streaming, time_to_issue, and time_since_issue
+#on a generated rtf history, so the suite runs offline. Each benchmark's throughput, in device-timesteps
+#and rows per second, and the peak memory of the process that executed it are written to
+#results_folder/results.json and compared to results_folder/baseline.json, with regressions flagged
+#and the exit status set to 1 when any are found. Execute from the repo's folder via
+#
+#    $PYTHON_PATH/python benchmarks/bench_suite.py benchmarks/inputs_bench_suite.py
+#
+#and append --save-baseline to store the results as the baseline that later runs are compared to.
+
+
+#imports
+import sys
+import os
+repo_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_folder)
+import json
+import copy
+import shutil
+import subprocess
+import time as tm
+import numpy as np
+from synthetic import train_synthetic_models, write_synthetic_models, randomize_fleet
+
+#the fields that identify a benchmark, and the fields that it measures
+key_fields = ['benchmark', 'N_devices', 'N_technicians', 'N_timesteps']
+metric_fields = ['seconds', 'device_steps_per_sec', 'rows_per_sec', 'peak_memory_MB']
+
+#make a result record
+def make_result(benchmark, N_devices, N_technicians, N_timesteps, seconds, device_steps=None, rows=None):
+    seconds = max(seconds, 1.0e-9)
+    result = {'benchmark':benchmark, 'N_devices':N_devices, 'N_technicians':N_technicians,
+        'N_timesteps':N_timesteps, 'seconds':seconds, 'device_steps_per_sec':None, 'rows_per_sec':None}
+    if (device_steps is not None):
+        result['device_steps_per_sec'] = device_steps/seconds
+    if (rows is not None):
+        result['rows_per_sec'] = rows/seconds
+    return result
+
+#execute fn(*args), which returns a list of results, in a child process and add that process's
+#peak memory to the results, so that each benchmark's memory is measured separately. The peak
+#includes the child's own children, ie pdm.py runs
+def run_isolated(fn, args):
+    from multiprocessing import Process, Pipe
+    conn, child_conn = Pipe()
+    def target():
+        import resource
+        results = fn(*args)
+        peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)/1024.0
+        for result in results:
+            result['peak_memory_MB'] = peak
+        child_conn.send(results)
+        child_conn.close()
+    child = Process(target=target)
+    child.start()
+    child_conn.close()
+    try:
+        results = conn.recv()
+    except EOFError:
+        raise RuntimeError('benchmark ' + fn.__name__ + str(args) + ' exited unexpectedly')
+    child.join()
+    return results
+
+#get the y_cols of the models that pdm_check uses
+def model_y_cols(inputs):
+    fatal_issues = sorted([issue for issue, d in inputs['issues'].iteritems() if (d['fatal'] == True)])
+    return [issue + '_in_' + str(inputs['pdm_threshold_time']) for issue in fatal_issues]
+
+#execute pdm.py in run_folder, using the base inputs overridden by parameters, and return its wall time
+#and the instruments that it wrote
+def execute_pdm(base_inputs_path, run_folder, parameters):
+    if (os.path.exists(run_folder)):
+        shutil.rmtree(run_folder)
+    os.makedirs(run_folder)
+    with open(base_inputs_path, 'r') as file:
+        inputs = file.read()
+    inputs += '\n\n#benchmark parameters\n'
+    for parameter, value in sorted(parameters.items()):
+        inputs += parameter + ' = ' + repr(value) + '\n'
+    with open(run_folder + 'inputs.py', 'w') as file:
+        file.write(inputs)
+    if (parameters['strategy'] == 'pdm'):
+        namespace = {}
+        execfile(run_folder + 'inputs.py', namespace)
+        write_synthetic_models(train_synthetic_models(model_y_cols(namespace), 20000, 51, 17), run_folder)
+    clock_start = tm.time()
+    with open(run_folder + 'log.txt', 'w') as log:
+        status = subprocess.call([sys.executable, os.path.join(repo_folder, 'pdm.py'), 'inputs.py'], cwd=run_folder,
+            stdout=log, stderr=subprocess.STDOUT)
+    wall_time = tm.time() - clock_start
+    if (status != 0):
+        raise RuntimeError('pdm.py failed with exit status ' + str(status) + ', see ' + run_folder + 'log.txt')
+    with open(run_folder + 'instruments_' + parameters['strategy'] + '.json', 'r') as file:
+        instruments = json.load(file)
+    return wall_time, instruments
+
+#benchmark a whole pdm.py run, its simulation loop and each of that loop's phases, and the writing of its outputs
+def bench_run(base_inputs_path, run_folder, run_parameters, strategy, N_devices, N_technicians, N_timesteps):
+    parameters = dict(run_parameters)
+    parameters.update({'strategy':strategy, 'N_devices':N_devices, 'N_technicians':N_technicians,
+        'N_timesteps':N_timesteps, 'debug':False, 'instrument':True, 'output_folder':'./'})
+    wall_time, instruments = execute_pdm(base_inputs_path, run_folder, parameters)
+    device_steps = N_devices*N_timesteps
+    rows = instruments['telemetry_rows'] + instruments['repairs_rows']
+    results = [make_result('pdm.py ' + strategy, N_devices, N_technicians, N_timesteps, wall_time, device_steps, rows),
+        make_result('simulation ' + strategy, N_devices, N_technicians, N_timesteps, instruments['simulation_time'],
+            device_steps, rows),
+        make_result('write_output_buffers ' + strategy, N_devices, N_technicians, N_timesteps,
+            instruments['write_time'], rows=rows)]
+    for phase, seconds in sorted(instruments['phase_times'].items()):
+        results += [make_result(phase + ' ' + strategy, N_devices, N_technicians, N_timesteps, seconds, device_steps)]
+    shutil.rmtree(run_folder)
+    return results
+
+#benchmark one pdm_check of a fleet of N_devices whose sensors and repair times are randomized,
+#using sklearn and flattened-forest inference, with each timing the best of N_repeats
+def bench_pdm_check(inputs, N_devices, N_technicians, N_repeats):
+    from simulation import sensor_names
+    from helper_fns import initialize_devices, initialize_technicians, pdm_check
+    from forest_inference import flatten_forests
+    issues = inputs['issues']
+    pdm_threshold_time = inputs['pdm_threshold_time']
+    y_cols = model_y_cols(inputs)
+    models = train_synthetic_models(y_cols, 20000, 51, 17)
+    time = 5000
+    devices = initialize_devices(N_devices, sensor_names, issues, inputs['output_interval'], 0)
+    randomize_fleet(devices, time, 17)
+    technicians = initialize_technicians(N_technicians)
+    results = []
+    for inference, forest in [('sklearn', None), ('flat', flatten_forests(models, y_cols))]:
+        times = []
+        for repeat in range(N_repeats):
+            repeat_devices = copy.deepcopy(devices)
+            repeat_technicians = copy.deepcopy(technicians)
+            clock_start = tm.time()
+            pdm_check(repeat_devices, issues, time, repeat_technicians, models, inputs['maintenance_duration'],
+                pdm_threshold_time, inputs['pdm_threshold_probability'], False, forest=forest)
+            times += [tm.time() - clock_start]
+        results += [make_result('pdm_check ' + inference, N_devices, N_technicians, 1, min(times), N_devices)]
+    return results
+
+#benchmark the data-prep functions on the rtf history in history_folder, whose telemetry has N_rows rows
+def bench_data_prep(inputs, history_folder, time_bucket_size, N_devices, N_timesteps, N_rows):
+    from helper_fns import prep_rtf_data, prep_rtf_data_streaming, time_to_issue, time_since_issue
+    issues = inputs['issues']
+    telemetry_file = history_folder + 'telemetry_rtf.csv.gz'
+    repairs_file = history_folder + 'repairs_rtf.csv.gz'
+    N_technicians = inputs['N_technicians']
+    results = []
+    for name, prep in [('prep_rtf_data', prep_rtf_data), ('prep_rtf_data_streaming', prep_rtf_data_streaming)]:
+        clock_start = tm.time()
+        telemetry, repairs, records = prep(time_bucket_size, issues, telemetry_file, repairs_file)
+        results += [make_result(name, N_devices, N_technicians, N_timesteps, tm.time() - clock_start,
+            N_devices*N_timesteps, N_rows)]
+    issue_names = [issue for issue in issues.keys() if (issue != 'crud')]
+    history = records[['deviceID', 'time', 'issue']]
+    for name, fn in [('time_to_issue', time_to_issue), ('time_since_issue', time_since_issue)]:
+        clock_start = tm.time()
+        fn(history, issue_names)
+        results += [make_result(name, N_devices, N_technicians, N_timesteps, tm.time() - clock_start,
+            N_devices*N_timesteps, len(history))]
+    return results
+
+#get the key that identifies result
+def result_key(result):
+    return tuple([result[field] for field in key_fields])
+
+#compare results to baseline, and return the flagged regressions as (result, metric, ratio) tuples,
+#where ratio is the result's throughput or peak memory relative to the baseline's. Throughputs
+#whose baseline took less than min_seconds are too noisy to compare
+def find_regressions(results, baseline, regression_tolerance, min_seconds):
+    baseline = {result_key(result):result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline.get(result_key(result))
+        if (base is None):
+            continue
+        for metric in ['device_steps_per_sec', 'rows_per_sec']:
+            if (base['seconds'] >= min_seconds) and (result[metric] is not None) and (base.get(metric) is not None) and (base[metric] > 0):
+                ratio = result[metric]/base[metric]
+                if (ratio < 1.0 - regression_tolerance):
+                    regressions += [(result, metric, ratio)]
+        if (base.get('peak_memory_MB') is not None) and (base['peak_memory_MB'] > 0):
+            ratio = result['peak_memory_MB']/base['peak_memory_MB']
+            if (ratio > 1.0 + regression_tolerance):
+                regressions += [(result, 'peak_memory_MB', ratio)]
+    return regressions
+
+
+#get commandline arguments
+save_baseline = ('--save-baseline' in sys.argv[1:])
+arguments = [argument for argument in sys.argv[1:] if (argument != '--save-baseline')]
+try:
+    bench_inputs_path = arguments[0]
+except:
+    bench_inputs_path = 'benchmarks/inputs_bench_suite.py'
+
+#start time
+clock_start = tm.time()
+
+#read benchmark parameters
+run_parameters = {}
+strategies = ['rtf']
+regression_tolerance = 0.2
+min_seconds = 0.1
+execfile(bench_inputs_path)
+print 'bench_inputs_path = ', bench_inputs_path
+print 'base_inputs_path = ', base_inputs_path
+print 'fleet_sizes = ', fleet_sizes
+print 'technician_ratios = ', technician_ratios
+print 'step_counts = ', step_counts
+print 'max_device_steps = ', max_device_steps
+print 'strategies = ', strategies
+print 'run_parameters = ', run_parameters
+print 'pdm_check_fleet_sizes = ', pdm_check_fleet_sizes
+print 'N_repeats = ', N_repeats
+print 'history_devices = ', history_devices
+print 'history_steps = ', history_steps
+print 'time_bucket_size = ', time_bucket_size
+print 'results_folder = ', results_folder
+print 'regression_tolerance = ', regression_tolerance
+print 'min_seconds = ', min_seconds
+print 'save_baseline = ', save_baseline
+base_inputs = {}
+execfile(base_inputs_path, base_inputs)
+if (os.path.exists(results_folder) == False):
+    os.makedirs(results_folder)
+
+#benchmark whole pdm.py runs
+results = []
+for strategy in strategies:
+    for N_devices in fleet_sizes:
+        for technician_ratio in technician_ratios:
+            for N_timesteps in step_counts:
+                if (N_devices*N_timesteps > max_device_steps):
+                    continue
+                N_technicians = max(int(round(technician_ratio*N_devices)), 1)
+                print 'benchmarking pdm.py ' + strategy + ' run with N_devices = ', N_devices, '\tN_technicians = ', \
+                    N_technicians, '\tN_timesteps = ', N_timesteps
+                results += run_isolated(bench_run, (base_inputs_path, results_folder + 'run/', run_parameters, strategy,
+                    N_devices, N_technicians, N_timesteps))
+
+#benchmark pdm_check
+for N_devices in pdm_check_fleet_sizes:
+    N_technicians = max(int(round(technician_ratios[0]*N_devices)), 1)
+    print 'benchmarking pdm_check with N_devices = ', N_devices
+    results += run_isolated(bench_pdm_check, (base_inputs, N_devices, N_technicians, N_repeats))
+
+#generate the rtf history that the data-prep functions are benchmarked on
+print 'generating history with N_devices = ', history_devices, '\tN_timesteps = ', history_steps
+history_folder = results_folder + 'history/'
+parameters = dict(run_parameters)
+parameters.update({'strategy':'rtf', 'N_devices':history_devices, 'N_technicians':max(history_devices/10, 1),
+    'N_timesteps':history_steps, 'debug':False, 'instrument':True, 'output_folder':'./'})
+wall_time, instruments = execute_pdm(base_inputs_path, history_folder, parameters)
+history_inputs = {}
+execfile(history_folder + 'inputs.py', history_inputs)
+print 'benchmarking data prep...'
+results += run_isolated(bench_data_prep, (history_inputs, history_folder, time_bucket_size, history_devices, history_steps,
+    instruments['telemetry_rows']))
+shutil.rmtree(history_folder)
+
+#write results, and compare them to the baseline
+import pandas as pd
+results_file = results_folder + 'results.json'
+with open(results_file, 'w') as file:
+    json.dump(results, file, indent=4, sort_keys=True)
+print results_file + ' = '
+print pd.DataFrame(results)[key_fields + metric_fields].to_string(index=False)
+baseline_file = results_folder + 'baseline.json'
+N_regressions = 0
+if (save_baseline):
+    shutil.copyfile(results_file, baseline_file)
+    print 'baseline saved to ' + baseline_file
+elif (os.path.exists(baseline_file)):
+    with open(baseline_file, 'r') as file:
+        baseline = json.load(file)
+    regressions = find_regressions(results, baseline, regression_tolerance, min_seconds)
+    N_regressions = len(regressions)
+    print 'comparing to ' + baseline_file + ', ' + str(N_regressions) + ' regressions found'
+    for result, metric, ratio in regressions:
+        print 'REGRESSION: ', [result[field] for field in key_fields], metric, ' = ', result[metric], \
+            '\t(' + str(round(ratio, 3)) + 'x baseline)'
+else:
+    print baseline_file + ' does not exist, rerun with --save-baseline to store one'
+
+#done
+print 'execution time (min) = ', (tm.time() - clock_start)/60.0
+if (N_regressions > 0):
+    sys.exit(1)
@@ -0,0 +1,144 @@
+#check_labels.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#checks that helper_fns.py's vectorized time_to_issue and time_since_issue label a small simulated rtf
+#run's records exactly as the original per-device loops, which are kept below as the reference. This
+#executes a pdm.py run of N_devices devices and N_timesteps timesteps, prepares its records with
+#prep_rtf_data, relabels them with both implementations, and compares their row order, index, and
+#columns, with the loops' None labels compared as nan. The exit status is 1 when any differ. The
+#vectorized labels are float64 with nan where the loops' were an object mix of ints and None. Execute
+#from the repo's folder via
+#
+#    $PYTHON_PATH/python benchmarks/check_labels.py [N_devices] [N_timesteps]
+
+
+#imports
+import sys
+import os
+repo_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, repo_folder)
+import shutil
+import subprocess
+import numpy as np
+import pandas as pd
+
+#the original time_to_issue, which back-fills each issue's times across each device's records in turn
+def loop_time_to_issue(records, issue_names):
+    df = records
+    df_list = []
+    deviceIDs = df.deviceID.unique()
+    for deviceID in deviceIDs:
+        df = records
+        df = df[df.deviceID == deviceID].copy().reset_index(drop=True).sort_values('time')
+        for issue in issue_names:
+            col = 'time_til_' + issue
+            df[col] = None
+            idx = (df.issue == issue)
+            issue_times = df[idx].time.sort_index(ascending=False)
+            if (len(issue_times) > 0):
+                for idx, issue_time in issue_times.iteritems():
+                    df.loc[0:idx, col] = issue_time
+                df[col] -= df.time
+        df_list += [df]
+    df = pd.concat(df_list)
+    return df
+
+#the original time_since_issue, which forward-fills each issue's times across each device's records in turn
+def loop_time_since_issue(records, issue_names):
+    df = records
+    df_list = []
+    deviceIDs = df.deviceID.unique()
+    for deviceID in deviceIDs:
+        df = records
+        df = df[df.deviceID == deviceID].copy().reset_index(drop=True).sort_values('time')
+        for issue in issue_names:
+            col = 'time_since_' + issue
+            df[col] = None
+            idx = (df.issue == issue)
+            issue_times = df[idx].time.sort_index(ascending=True)
+            if (len(issue_times) > 0):
+                for idx, issue_time in issue_times.iteritems():
+                    df.loc[idx:, col] = -issue_time
+                df[col] += df.time
+        df_list += [df]
+    df = pd.concat(df_list)
+    return df
+
+#get the names of the columns of labeled records that differ from those of reference_records
+def differing_columns(labeled_records, reference_records):
+    if (list(labeled_records.columns) != list(reference_records.columns)) or \
+        (len(labeled_records) != len(reference_records)) or \
+        (labeled_records.index.values != reference_records.index.values).any():
+        return ['columns, length, or index']
+    differing = []
+    for col in reference_records.columns:
+        values = labeled_records[col].values
+        reference = reference_records[col].values
+        if (col.startswith('time_til_')) or (col.startswith('time_since_')):
+            values = values.astype(float)
+            reference = pd.Series(reference).astype(float).values
+        same = (values == reference)
+        if (values.dtype.kind == 'f') and (reference.dtype.kind == 'f'):
+            same |= (np.isnan(values) & np.isnan(reference))
+        if (same.all() == False):
+            differing += [col]
+    return differing
+
+
+#get commandline arguments
+try:
+    N_devices = int(sys.argv[1])
+except:
+    N_devices = 200
+try:
+    N_timesteps = int(sys.argv[2])
+except:
+    N_timesteps = 2000
+
+#execute a small rtf run in run_folder
+run_folder = os.path.join(repo_folder, 'benchmarks', 'check_labels') + '/'
+if (os.path.exists(run_folder)):
+    shutil.rmtree(run_folder)
+os.makedirs(run_folder)
+with open(os.path.join(repo_folder, 'inputs_rtf.py'), 'r') as file:
+    inputs = file.read()
+inputs += '\n\n#check_labels parameters\n'
+parameters = {'strategy':'rtf', 'N_devices':N_devices, 'N_technicians':max(N_devices/10, 1), 'N_timesteps':N_timesteps,
+    'debug':False, 'output_folder':'./'}
+for parameter, value in sorted(parameters.items()):
+    inputs += parameter + ' = ' + repr(value) + '\n'
+with open(run_folder + 'inputs.py', 'w') as file:
+    file.write(inputs)
+print 'executing an rtf run with N_devices = ', N_devices, '\tN_timesteps = ', N_timesteps
+with open(run_folder + 'log.txt', 'w') as log:
+    status = subprocess.call([sys.executable, os.path.join(repo_folder, 'pdm.py'), 'inputs.py'], cwd=run_folder,
+        stdout=log, stderr=subprocess.STDOUT)
+if (status != 0):
+    raise RuntimeError('pdm.py failed with exit status ' + str(status) + ', see ' + run_folder + 'log.txt')
+
+#prepare the run's records, and relabel them with both implementations
+from helper_fns import prep_rtf_data, time_to_issue, time_since_issue
+namespace = {}
+execfile(run_folder + 'inputs.py', namespace)
+issues = namespace['issues']
+telemetry, repairs, records = prep_rtf_data(20, issues, run_folder + 'telemetry_rtf.csv.gz', run_folder + 'repairs_rtf.csv.gz')
+issue_names = [issue for issue in issues.keys() if (issue != 'crud')]
+cols = [col for col in records.columns if not (col.startswith('time_til_') or col.startswith('time_since_'))]
+#the records are labeled in the order that merge_telemetry_repairs returns them
+unlabeled = records[cols].sort_values(['time_bucket', 'deviceID'], kind='mergesort').reset_index(drop=True)
+labeled = time_since_issue(time_to_issue(unlabeled, issue_names), issue_names)
+reference = loop_time_since_issue(loop_time_to_issue(unlabeled, issue_names), issue_names)
+shutil.rmtree(run_folder)
+
+#compare the labels
+differing = differing_columns(labeled, reference)
+print 'records.shape = ', labeled.shape
+for issue in issue_names:
+    for col in ['time_til_' + issue, 'time_since_' + issue]:
+        print col + ' labeled = ', int(labeled[col].notna().sum()), '\tnan = ', int(labeled[col].isna().sum())
+if (len(differing) > 0):
+    print 'labels differ from the per-device loops in ', differing
+    sys.exit(1)
+print 'labels match the per-device loops'
@@ -0,0 +1,43 @@
+#inputs_bench_suite.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#input parameters for bench_suite.py
+
+#inputs file whose parameters are used by every pdm.py run, except those being benchmarked
+base_inputs_path = 'inputs_rtf.py'
+
+#the pdm.py runs span these fleet sizes, technicians per device, and timesteps, with runs having
+#more than max_device_steps device-timesteps skipped
+fleet_sizes = [1000, 10000, 100000, 1000000]
+technician_ratios = [0.05, 0.1]
+step_counts = [100, 1000]
+max_device_steps = 1.0e8
+
+#strategies of the pdm.py runs, with strategy='pdm' runs using small synthetic models
+strategies = ['rtf', 'pdm']
+
+#other parameters that every pdm.py run uses, eg {'kernel':'batch', 'rng':'counter'}
+run_parameters = {}
+
+#fleet sizes that one pdm_check is benchmarked at, using the best of N_repeats
+pdm_check_fleet_sizes = [1000, 10000, 100000, 1000000]
+N_repeats = 3
+
+#the data-prep functions are benchmarked on the history of an rtf run having history_devices
+#devices and history_steps timesteps, bucketed into time_bucket_size timesteps
+history_devices = 1000
+history_steps = 10000
+time_bucket_size = 20
+
+#folder that the runs, results.json, and baseline.json are stored in
+results_folder = 'benchmarks/results/'
+
+#a benchmark whose throughput drops by more than regression_tolerance, or whose peak memory grows
+#by more than regression_tolerance, relative to the baseline is flagged as a regression
+regression_tolerance = 0.2
+
+#throughputs are only compared when the baseline's benchmark took at least min_seconds, since
+#shorter timings are too noisy
+min_seconds = 0.1
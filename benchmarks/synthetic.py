@@ -0,0 +1,41 @@
+#synthetic.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#small synthetic pdm models and fleets, so that the benchmarks run without any rtf data
+
+
+#imports
+import numpy as np
+
+#train one synthetic model per fatal issue on random pdm-like features
+def train_synthetic_models(y_cols, N_samples, n_estimators, rn_seed):
+    from sklearn.ensemble import RandomForestClassifier
+    np.random.seed(rn_seed)
+    models = {}
+    for idx, y_col in enumerate(y_cols):
+        x = np.random.normal(size=(N_samples, 7))
+        x[:, 4:] = np.random.uniform(0, 5000, size=(N_samples, 3))
+        y = ((x[:, idx] + 0.3*np.random.normal(size=N_samples)) > 1.0).astype(int)
+        models[y_col] = RandomForestClassifier(n_estimators=n_estimators, random_state=rn_seed).fit(x, y)
+    return models
+
+#write models to folder + <y_col>_model.pkl, which is where pdm.py loads them from
+def write_synthetic_models(models, folder):
+    import pickle as pkl
+    for y_col, model in models.iteritems():
+        with open(folder + y_col + '_model.pkl', 'wb') as file:
+            pkl.dump(model, file)
+    return
+
+#randomize devices' sensors, production_rate, and the times of their last repairs, so that a
+#fleet that was just initialized looks like one that has been operating until time
+def randomize_fleet(devices, time, rn_seed):
+    np.random.seed(rn_seed)
+    values = devices['sensors']['values']
+    values[:] = np.random.normal(scale=0.5, size=values.shape)
+    devices['production_rate'][:] = np.random.uniform(0.5, 1.0, size=len(devices['IDs']))
+    repair_time = devices['repair_time']
+    repair_time[:] = np.random.randint(0, time, size=repair_time.shape)
+    return
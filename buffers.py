@@ -0,0 +1,271 @@
+#buffers.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#preallocated column buffers that pdm.py uses to accumulate telemetry and repairs,
+#a full buffer is spilled to an on-disk log that is read back via np.memmap
+
+
+#imports
+import os
+import numpy as np
+import pandas as pd
+
+#telemetry and repairs columns and their dtypes
+telemetry_columns = [('time', np.int32), ('deviceID', np.int32), ('sensor', np.uint8), ('value', np.float64)]
+repairs_columns = [('time', np.int32), ('deviceID', np.int32), ('issue', np.int16), ('technicianID', np.int32),
+    ('temperature', np.float64), ('pressure', np.float64), ('load', np.float64), ('production_rate', np.float64)]
+
+#file extensions of the csv outputs, per output_codec
+csv_extensions = {'gzip':'.csv.gz', 'zstd':'.csv.zst', 'none':'.csv'}
+
+#names of the telemetry sensor codes, followed by the fleet-wide counts that are reported every timestep
+def telemetry_sensor_names(sensor_names, state_names):
+    return list(sensor_names) + ['production_rate', 'N_technicians'] + ['N_' + state_name for state_name in state_names]
+
+#create buffer that holds buffer_size rows, with categories[column] = list of names that column's codes refer to
+def make_buffer(columns, buffer_size, spill_path, categories):
+    buffer = {'columns':columns, 'buffer_size':buffer_size, 'spill_path':spill_path, 'categories':categories}
+    buffer['arrays'] = {column:np.zeros(buffer_size, dtype=dtype) for column, dtype in columns}
+    buffer['N_rows'] = 0
+    buffer['N_spilled'] = 0
+    buffer['on_spill'] = None
+    buffer['on_append'] = []
+    #remove any spill files left over from an earlier run
+    delete_spill_files(buffer)
+    return buffer
+
+#number of rows held by buffer, both in memory and spilled to disk
+def buffer_length(buffer):
+    return buffer['N_spilled'] + buffer['N_rows']
+
+#append rows to buffer, where rows[column] is an array or a scalar that is broadcast over all rows,
+#first passing them to each of buffer's on_append functions, which stream them to subscribers or label
+#them as training records
+def append_rows(buffer, rows):
+    N = max([np.size(value) for value in rows.values()])
+    for on_append in buffer['on_append']:
+        on_append(buffer, rows, N)
+    arrays = buffer['arrays']
+    start = 0
+    while (start < N):
+        N_rows = buffer['N_rows']
+        N_copy = min(buffer['buffer_size'] - N_rows, N - start)
+        for column, dtype in buffer['columns']:
+            value = rows[column]
+            if (np.ndim(value) == 0):
+                arrays[column][N_rows:N_rows + N_copy] = value
+            else:
+                arrays[column][N_rows:N_rows + N_copy] = value[start:start + N_copy]
+        buffer['N_rows'] += N_copy
+        start += N_copy
+        if (buffer['N_rows'] == buffer['buffer_size']):
+            spill_buffer(buffer)
+    return
+
+#append a list of record dicts to buffer, with categorical columns converted to codes
+def append_records(buffer, records):
+    if (len(records) == 0):
+        return
+    rows = {}
+    for column, dtype in buffer['columns']:
+        values = [record[column] for record in records]
+        if (column in buffer['categories']):
+            names = buffer['categories'][column]
+            values = [names.index(value) for value in values]
+        rows[column] = np.array(values, dtype=dtype)
+    append_rows(buffer, rows)
+    return
+
+#append buffer's in-memory rows to its on-disk spill files, and pass the range of spilled rows to
+#buffer's on_spill function when a background writer is streaming the buffer to its output file
+def spill_buffer(buffer):
+    N_rows = buffer['N_rows']
+    if (N_rows == 0):
+        return
+    for column, dtype in buffer['columns']:
+        with open(buffer['spill_path'] + '.' + column, 'ab') as file:
+            buffer['arrays'][column][0:N_rows].tofile(file)
+    buffer['N_spilled'] += N_rows
+    buffer['N_rows'] = 0
+    if (buffer['on_spill'] is not None):
+        buffer['on_spill'](buffer, buffer['N_spilled'] - N_rows, buffer['N_spilled'])
+    return
+
+#delete buffer's spill files
+def delete_spill_files(buffer):
+    for column, dtype in buffer['columns']:
+        file = buffer['spill_path'] + '.' + column
+        if (os.path.exists(file)):
+            os.remove(file)
+    return
+
+#get buffer's column arrays as a list of segments, the memory-mapped spilled rows then the in-memory rows
+def buffer_segments(buffer):
+    segments = []
+    if (buffer['N_spilled'] > 0):
+        segment = {}
+        for column, dtype in buffer['columns']:
+            file = buffer['spill_path'] + '.' + column
+            segment[column] = np.memmap(file, dtype=dtype, mode='r', shape=(buffer['N_spilled'],))
+        segments += [segment]
+    if (buffer['N_rows'] > 0):
+        segments += [{column:buffer['arrays'][column][0:buffer['N_rows']] for column, dtype in buffer['columns']}]
+    return segments
+
+#convert column arrays to dataframe, with categorical columns decoded
+def columns_to_dataframe(buffer, arrays):
+    df = pd.DataFrame()
+    for column, dtype in buffer['columns']:
+        if (column in buffer['categories']):
+            df[column] = pd.Categorical.from_codes(arrays[column], buffer['categories'][column])
+        else:
+            df[column] = np.asarray(arrays[column])
+    return df
+
+#iterate over buffer's rows in dataframes of at most chunk_size rows
+def iterate_chunks(buffer, chunk_size):
+    for segment in buffer_segments(buffer):
+        N = len(segment[buffer['columns'][0][0]])
+        for start in range(0, N, chunk_size):
+            arrays = {column:segment[column][start:start + chunk_size] for column in segment.keys()}
+            yield columns_to_dataframe(buffer, arrays)
+
+#get the compress and finish functions that compress chunks of csv text with codec at level, with
+#each gzip chunk a complete gzip member and each zstd chunk a flushed block of one zstd frame, so that
+#a file whose chunks are still being appended can be read up to its last chunk. The zstandard
+#package is only needed when codec='zstd'
+def csv_compressor(codec, level):
+    if (codec == 'gzip'):
+        import zlib
+        def compress(text):
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            return compressor.compress(text) + compressor.flush()
+        return compress, lambda: ''
+    if (codec == 'zstd'):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("output_codec = 'zstd' requires the zstandard package")
+        compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        compress = lambda text: compressor.compress(text) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return compress, compressor.flush
+    if (codec == 'none'):
+        return lambda text: text, lambda: ''
+    raise ValueError("output_codec = " + str(codec) + " is not one of " + str(sorted(csv_extensions.keys())))
+
+#get the path of the repairs or telemetry output that pdm.py writes, a parquet dataset or a csv file
+#whose extension depends upon output_codec
+def output_file(params, kind):
+    path = params['output_folder'] + kind + '_' + params['strategy']
+    if (params['output_format'] == 'parquet'):
+        return path + '.parquet'
+    return path + csv_extensions[params['output_codec']]
+
+#open a csv output for pd.read_csv(..., compression='infer'), which reads gzipped and uncompressed
+#files itself but needs zstd files decompressed
+def open_csv_output(file):
+    if (file.endswith('.zst')):
+        import zstandard
+        return zstandard.ZstdDecompressor().stream_reader(open(file, 'rb'))
+    return file
+
+#convert a dataframe to the text of a pipe-separated csv file
+def dataframe_to_csv(df):
+    return df.to_csv(None, header=False, index=False, sep='|')
+
+#write buffer to pipe-separated csv file compressed with codec at level, one chunk at a time so that
+#memory use stays bounded
+def write_buffer_csv(buffer, file, chunk_size, codec='gzip', level=9):
+    compress, finish = csv_compressor(codec, level)
+    with open(file, 'wb') as output:
+        for df in iterate_chunks(buffer, chunk_size):
+            output.write(compress(dataframe_to_csv(df)))
+        output.write(finish())
+    return
+
+#append a chunk of rows to the parquet dataset at path, partitioned by time into partitions that span
+#partition_size timesteps and are named after their starting times, with categorical columns
+#dictionary-encoded and the files compressed with codec
+def write_parquet_chunk(df, path, partition_size, codec):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    df['time_partition'] = (df.time.values//partition_size)*partition_size
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pq.write_to_dataset(table, path, partition_cols=['time_partition'], compression=codec)
+    return
+
+#write buffer to a parquet dataset at path that is partitioned by time, one chunk at a time
+def write_buffer_parquet(buffer, path, chunk_size, partition_size, codec='gzip'):
+    import shutil
+    if (os.path.exists(path)):
+        shutil.rmtree(path)
+    for df in iterate_chunks(buffer, chunk_size):
+        write_parquet_chunk(df, path, partition_size, codec)
+    return
+
+#get starting times of the parquet dataset's partitions that overlap time_range=(time_min, time_max), sorted by time
+def select_partitions(path, time_range):
+    partition_times = sorted([int(name.split('=')[1]) for name in os.listdir(path) if name.startswith('time_partition=')])
+    if (time_range is None):
+        return partition_times
+    time_min, time_max = time_range
+    #a partition spans the times between its starting time and the next partition's starting time
+    next_times = partition_times[1:] + [np.inf]
+    return [t for t, t_next in zip(partition_times, next_times) if (t <= time_max) and (t_next > time_min)]
+
+#read columns from parquet dataset at path, reading only those partitions that overlap time_range=(time_min, time_max)
+def read_parquet(path, columns, time_range):
+    import pyarrow.parquet as pq
+    filters = None
+    if (time_range is not None):
+        keep_times = [str(t) for t in select_partitions(path, time_range)]
+        filters = [('time_partition', 'in', set(keep_times))]
+    dataset = pq.ParquetDataset(path, filters=filters)
+    df = dataset.read(columns=columns).to_pandas()
+    if (time_range is not None):
+        time_min, time_max = time_range
+        df = df[(df.time >= time_min) & (df.time <= time_max)]
+    return df.reset_index(drop=True)
+
+#iterate over the parquet dataset's partitions in time order, yielding one dataframe per partition
+def iterate_parquet_partitions(path, columns, time_range):
+    import pyarrow.parquet as pq
+    for partition_time in select_partitions(path, time_range):
+        partition_path = os.path.join(path, 'time_partition=' + str(partition_time))
+        df = pq.ParquetDataset(partition_path).read(columns=columns).to_pandas()
+        if (time_range is not None):
+            time_min, time_max = time_range
+            df = df[(df.time >= time_min) & (df.time <= time_max)]
+        yield df
+
+#get a buffer that reads the N_spilled rows that another process spilled to spill_path
+def open_spilled_buffer(columns, spill_path, categories, N_spilled):
+    buffer = {'columns':columns, 'buffer_size':0, 'spill_path':spill_path, 'categories':categories}
+    buffer['arrays'] = {}
+    buffer['N_rows'] = 0
+    buffer['N_spilled'] = N_spilled
+    buffer['on_spill'] = None
+    buffer['on_append'] = []
+    return buffer
+
+#get a buffer that continues appending to the spill files of a checkpointed buffer, whose first
+#N_spilled rows were spilled when the checkpoint was written, and drop any rows spilled after that
+def reopen_buffer(columns, buffer_size, spill_path, categories, N_spilled):
+    buffer = {'columns':columns, 'buffer_size':buffer_size, 'spill_path':spill_path, 'categories':categories}
+    buffer['arrays'] = {column:np.zeros(buffer_size, dtype=dtype) for column, dtype in columns}
+    buffer['N_rows'] = 0
+    buffer['N_spilled'] = N_spilled
+    buffer['on_spill'] = None
+    buffer['on_append'] = []
+    for column, dtype in columns:
+        file = spill_path + '.' + column
+        size = N_spilled*np.dtype(dtype).itemsize
+        if (os.path.exists(file) == False) and (size == 0):
+            continue
+        if (os.path.exists(file) == False) or (os.path.getsize(file) < size):
+            raise IOError(file + ' holds fewer than the ' + str(N_spilled) + ' rows that were checkpointed')
+        with open(file, 'r+b') as spill:
+            spill.truncate(size)
+    return buffer
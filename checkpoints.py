@@ -0,0 +1,153 @@
+#checkpoints.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#checkpoints of the simulation's state, used by pdm.py when checkpoint_interval > 0. Every
+#checkpoint_interval timesteps the devices, technicians, dispatch queue, pdm scoring scheduler, training
+#records' labeler, scheduled events, summary, and the state of np.random are pickled to
+#output_folder/checkpoint_<strategy>.pkl, after the output buffers are spilled so that the checkpoint
+#only needs to record how many rows they hold. A run that was interrupted is continued from its last
+#checkpoint via
+#
+#    python pdm.py inputs_rtf.py --resume
+#
+#which truncates the spill files back to the checkpoint's rows, so the resumed run's outputs are
+#identical to those of an uninterrupted run. A pdm run can also be warm-started from an rtf run's
+#final checkpoint via warm_start, so that the pdm run starts from a fleet that is already in its
+#steady state rather than from zeroed sensors and damage.
+
+
+#imports
+import os
+import numpy as np
+import cPickle as pickle
+from simulation import *
+from labeling import training_columns
+
+#the device arrays that a warm start copies from the checkpointed fleet
+warm_start_keys = ['state', 'issue', 'technicianID', 'fail_time', 'repair_start_time', 'repair_complete_time',
+    'production_rate', 'production_rate_fail_time', 'repair_time', 'damage']
+
+#the params that a resumed run may change, all others must be those of the checkpointed run
+resume_params = ['debug', 'N_timesteps', 'checkpoint_interval', 'pdm_threads', 'instrument', 'progress_interval',
+    'profile_file', 'output_writer', 'output_codec', 'output_level', 'writer_queue_size', 'stream_address',
+    'stream_format', 'stream_rate', 'stream_queue_size', 'stream_policy', 'stream_subscribers', 'damage_engine']
+
+#path to the checkpoint file of the run that params describes
+def checkpoint_path(params):
+    return params['output_folder'] + 'checkpoint_' + params['strategy'] + '.pkl'
+
+#write sim's state at time, which is the next timestep to be simulated, to path. The checkpoint
+#is written to a temporary file that then replaces path, so an interrupted write leaves the
+#previous checkpoint intact
+def save_checkpoint(sim, time, path):
+    for kind in ['repairs_buffer', 'telemetry_buffer']:
+        spill_buffer(sim[kind])
+    #the labeler's training buffer is saved as its number of rows, like the output buffers
+    labeler = sim['labeler']
+    if (labeler is not None):
+        spill_buffer(labeler['buffer'])
+        labeler = labeler.copy()
+        labeler['buffer'] = labeler['buffer']['N_spilled']
+    #the streams' pregenerated draws are not saved, they are regenerated as needed
+    devices = sim['devices'].copy()
+    if (devices['streams'] is not None):
+        devices['streams'] = devices['streams'].copy()
+        devices['streams']['blocks'] = {}
+    state = {'time':time, 'params':sim['params'], 'devices':devices, 'technicians':sim['technicians'],
+        'dispatch':sim['dispatch'], 'scoring':sim['scoring'], 'labeler':labeler, 'events':sim['events'], 'summary':sim['summary'],
+        'aggregates':sim['aggregates'], 'batch_length':sim['batch_length'], 'time_start':sim['time_start'],
+        'rng_state':np.random.get_state(),
+        'N_spilled':{kind:sim[kind]['N_spilled'] for kind in ['repairs_buffer', 'telemetry_buffer']}}
+    with open(path + '.tmp', 'wb') as file:
+        pickle.dump(state, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(path + '.tmp', path)
+    return
+
+#read the checkpoint at path
+def load_checkpoint(path):
+    with open(path, 'rb') as file:
+        state = pickle.load(file)
+    return state
+
+#restore the simulation from the checkpoint at path, and return sim and the next timestep to be simulated.
+#The buffers continue appending to the spill files in output_folder
+def resume_simulation(params, path):
+    state = load_checkpoint(path)
+    changed = [name for name in sorted(params.keys())
+        if (name not in resume_params) and (state['params'].get(name) != params[name])]
+    if (len(changed) > 0):
+        raise ValueError('can not resume ' + path + ' since these params differ from the checkpointed run: ' + str(changed))
+    np.random.set_state(state['rng_state'])
+    sim = {'params':params}
+    for key in ['devices', 'technicians', 'dispatch', 'scoring', 'events', 'summary', 'aggregates', 'batch_length',
+        'time_start']:
+        sim[key] = state[key]
+    sim['models'] = sim['forest'] = None
+    sim['instruments'] = initialize_instruments(params)
+    sim['stream'] = None
+    buffer_size = params['buffer_size']
+    strategy = params['strategy']
+    spill_prefix = params['output_folder']
+    categories = {'sensor':telemetry_sensor_names(sensor_names, state_names)}
+    sim['telemetry_buffer'] = reopen_buffer(telemetry_columns, buffer_size, spill_prefix + 'telemetry_' + strategy + '.spill',
+        categories, state['N_spilled']['telemetry_buffer'])
+    categories = {'issue':sim['devices']['issue_names']}
+    sim['repairs_buffer'] = reopen_buffer(repairs_columns, buffer_size, spill_prefix + 'repairs_' + strategy + '.spill',
+        categories, state['N_spilled']['repairs_buffer'])
+    sim['labeler'] = labeler = state['labeler']
+    if (labeler is not None):
+        categories = {'issue':sim['devices']['issue_names'] + ['none']}
+        labeler['buffer'] = reopen_buffer(training_columns(params['issues']), buffer_size,
+            spill_prefix + 'training_' + strategy + '.spill', categories, labeler['buffer'])
+    return sim, state['time']
+
+#copy the fleet and technicians of the checkpoint at path into the freshly initialized sim, which
+#then starts at the checkpoint's time rather than at time_start. sim keeps its own random
+#streams, outputs, and summary, its dispatch queue is rebuilt from the failed devices in order of
+#failure, and its event kernel draws new failure thresholds
+def warm_start_simulation(sim, path):
+    state = load_checkpoint(path)
+    devices = sim['devices']
+    checkpointed_devices = state['devices']
+    if (checkpointed_devices['damage'].shape != devices['damage'].shape) or \
+        (checkpointed_devices['issue_names'] != devices['issue_names']) or \
+        (len(state['technicians']['IDs']) != len(sim['technicians']['IDs'])):
+        raise ValueError('can not warm start from ' + path + ' since its N_devices, issues, or N_technicians differ')
+    sim['time_start'] = time = state['time']
+    for key in warm_start_keys:
+        devices[key][:] = checkpointed_devices[key]
+    for key in ['values', 'output_times']:
+        devices['sensors'][key][:] = checkpointed_devices['sensors'][key]
+    devices['sensors']['wheel'] = None
+    devices['state_counts'][:] = np.bincount(devices['state'], minlength=len(state_names))
+    sim['technicians'] = state['technicians']
+    dispatch = sim['dispatch']
+    if (dispatch['policy'] != 'random'):
+        failed_deviceIDs = devices['IDs'][devices['state'] == FAILED]
+        order = np.argsort(devices['fail_time'][failed_deviceIDs], kind='mergesort')
+        enqueue_devices(dispatch, devices, failed_deviceIDs[order])
+    if (sim['scoring'] is not None):
+        sim['scoring'] = initialize_scoring(sim['params'], len(devices['IDs']), devices['sensors']['values'].shape[1], time)
+    if (sim['events'] is not None):
+        sim['events'] = events = initialize_events(devices, sim['params']['issues'], time)
+        busy = (devices['state'] == REPAIR) | (devices['state'] == MAINTENANCE)
+        for deviceID in devices['IDs'][busy]:
+            schedule_event(events, 'repair', devices['repair_complete_time'][deviceID] + 1, deviceID)
+    return
+
+#advance the simulation from time until time_stop, checkpointing to path every checkpoint_interval
+#timesteps and when done, or without checkpoints when checkpoint_interval <= 0
+def simulate_with_checkpoints(sim, time, time_stop, checkpoint_interval, path):
+    if (checkpoint_interval <= 0):
+        if (time < time_stop):
+            simulate_times(sim, range(time, time_stop))
+        return
+    while (time < time_stop):
+        time_next = min(time + checkpoint_interval, time_stop)
+        simulate_times(sim, range(time, time_next))
+        time = time_next
+        save_checkpoint(sim, time, path)
+        print 'checkpoint written at time = ', time
+    return
@@ -0,0 +1,291 @@
+#damage.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#the issues' damage laws. Each issue in the inputs file may declare the damage that it does per timestep
+#as an expression, eg 'damage':'coefficient*x**2', along with an optional 'gate' condition, eg
+#'gate':'x >= 0', outside of which the issue does no damage. Expressions may use the sensors x, y, z
+#(or temperature, pressure, load), the derived quantities rho = sqrt(x**2 + y**2), r = sqrt(rho**2 + z**2),
+#phi = arctan2(y, x), theta = arctan2(z, rho), the issue's coefficient, numbers, the operators
+#+ - * / ** and comparisons, and the functions in damage_functions. Issues that declare no damage law
+#use their entry in default_damage_laws. All the issues' laws are compiled into one kernel, a list of
+#numpy ufunc calls that write into preallocated buffers, so a timestep's damage allocates no arrays
+#and only computes the derived quantities that some law uses. With damage_engine='numexpr' the laws
+#are evaluated by the optional numexpr package instead.
+
+
+#imports
+import ast
+import numpy as np
+
+#damage laws of the issues that don't declare theirs, as (damage, gate) expressions
+default_damage_laws = {
+    'crud':         ('coefficient*r', None),
+    'jammed_rotor': ('coefficient*x**2', 'x >= 0'),
+    'cracked_valve':('coefficient*y**2', 'y >= 0'),
+    'broken_gear':  ('coefficient*rho*z', 'z >= 0'),
+}
+
+#columns of the sensor values that expressions may refer to, and the derived quantities
+sensor_columns = {'x':0, 'y':1, 'z':2, 'temperature':0, 'pressure':1, 'load':2}
+derived_names = ['rho2', 'rho', 'r', 'phi', 'theta']
+
+#functions that expressions may call
+damage_functions = {'sqrt':np.sqrt, 'exp':np.exp, 'log':np.log, 'abs':np.absolute, 'sin':np.sin, 'cos':np.cos,
+    'tanh':np.tanh, 'arctan2':np.arctan2, 'maximum':np.maximum, 'minimum':np.minimum}
+
+#ufuncs of the expressions' operators
+binary_ufuncs = {ast.Add:np.add, ast.Sub:np.subtract, ast.Mult:np.multiply, ast.Div:np.true_divide,
+    ast.Pow:np.power}
+compare_ufuncs = {ast.Lt:np.less, ast.LtE:np.less_equal, ast.Gt:np.greater, ast.GtE:np.greater_equal,
+    ast.Eq:np.equal, ast.NotEq:np.not_equal}
+bool_ufuncs = {ast.And:np.logical_and, ast.Or:np.logical_or}
+
+#get each issue's (damage, gate) expressions, in issues order
+def damage_laws(issues):
+    laws = []
+    for issue in issues.keys():
+        if ('damage' in issues[issue]):
+            law = (issues[issue]['damage'], issues[issue].get('gate'))
+        elif (issue in default_damage_laws):
+            law = default_damage_laws[issue]
+        else:
+            raise ValueError('issue ' + issue + " declares no 'damage' expression and has no default damage law")
+        laws += [(issue, issues[issue]['ID'], issues[issue]['coefficient'], law[0], law[1])]
+    return laws
+
+#compile the issues' damage laws into a kernel, which holds the program of ufunc calls, the registers
+#that those calls write into, and each issue's output buffer
+def compile_damage_kernel(issues):
+    kernel = {'program':[], 'registers':{'f':[], 'b':[]}, 'free':{'f':[], 'b':[]}, 'derived':set(), 'outputs':[],
+        'size':0, 'crud_output':None, 'laws':damage_laws(issues)}
+    for issue, issueID, coefficient, damage, gate in kernel['laws']:
+        output = ('output', len(kernel['outputs']))
+        kernel['outputs'] += [issueID]
+        operand = compile_node(kernel, parse_expression(damage, issue), coefficient)
+        if (operand[0] in ['f', 'b']) and (kernel['program'][-1][2] == operand):
+            #the law's last ufunc call writes straight into the issue's output
+            ufunc, operands, out = kernel['program'][-1]
+            kernel['program'][-1] = (ufunc, operands, output)
+        else:
+            emit(kernel, np.copyto, [operand], output)
+        release(kernel, operand)
+        if (gate is not None):
+            #zero the damage wherever the gate is closed
+            condition = compile_node(kernel, parse_expression(gate, issue), coefficient)
+            if (condition[0] != 'b'):
+                raise ValueError('gate of issue ' + issue + ' is not a condition: ' + gate)
+            emit(kernel, np.logical_not, [condition], condition)
+            emit(kernel, zero_where, [condition], output)
+            release(kernel, condition)
+        if (issue == 'crud'):
+            kernel['crud_output'] = output
+    return kernel
+
+#parse expression into its syntax tree
+def parse_expression(expression, issue):
+    try:
+        return ast.parse(expression.strip(), mode='eval').body
+    except SyntaxError:
+        raise ValueError('can not parse damage expression of issue ' + issue + ': ' + expression)
+
+#append the ufunc call that writes ufunc(*operands) into the out operand to kernel's program
+def emit(kernel, ufunc, operands, out):
+    kernel['program'] += [(ufunc, operands, out)]
+    return
+
+#get a free float 'f' or boolean 'b' register
+def allocate(kernel, kind):
+    if (len(kernel['free'][kind]) > 0):
+        return kernel['free'][kind].pop()
+    kernel['registers'][kind] += [None]
+    return (kind, len(kernel['registers'][kind]) - 1)
+
+#free operand if it is a register
+def release(kernel, operand):
+    if (operand[0] in ['f', 'b']) and (operand not in kernel['free'][operand[0]]):
+        kernel['free'][operand[0]] += [operand]
+    return
+
+#compile the syntax tree node into kernel's program, and return the operand that holds its value,
+#either ('const', value), ('input', name), or a register
+def compile_node(kernel, node, coefficient):
+    if (isinstance(node, ast.Num)):
+        return ('const', float(node.n))
+    if (isinstance(node, ast.Name)):
+        if (node.id == 'coefficient'):
+            return ('const', coefficient)
+        if (node.id in sensor_columns):
+            return ('input', node.id)
+        if (node.id in derived_names):
+            kernel['derived'].add(node.id)
+            return ('input', node.id)
+        raise ValueError('unknown name in damage expression: ' + node.id)
+    if (isinstance(node, ast.UnaryOp)):
+        operand = compile_node(kernel, node.operand, coefficient)
+        if (isinstance(node.op, ast.UAdd)):
+            return operand
+        if (isinstance(node.op, ast.USub)):
+            return apply_ufunc(kernel, np.negative, [operand], 'f')
+        if (isinstance(node.op, ast.Not)):
+            return apply_ufunc(kernel, np.logical_not, [operand], 'b')
+    if (isinstance(node, ast.BinOp)) and (type(node.op) in binary_ufuncs):
+        left = compile_node(kernel, node.left, coefficient)
+        #numpy computes array**2 and array**0.5 via square and sqrt, which the kernel does too
+        if (isinstance(node.op, ast.Pow)) and (isinstance(node.right, ast.Num)) and (node.right.n in [2, 0.5]):
+            ufunc = {2:np.square, 0.5:np.sqrt}[node.right.n]
+            return apply_ufunc(kernel, ufunc, [left], 'f')
+        right = compile_node(kernel, node.right, coefficient)
+        return apply_ufunc(kernel, binary_ufuncs[type(node.op)], [left, right], 'f')
+    if (isinstance(node, ast.Compare)):
+        #a chained comparison a < b < c is (a < b) and (b < c)
+        operands = [compile_node(kernel, node.left, coefficient)] + \
+            [compile_node(kernel, comparator, coefficient) for comparator in node.comparators]
+        conditions = [(compare_ufuncs[type(op)], operands[i], operands[i + 1]) for i, op in enumerate(node.ops)]
+        result = None
+        for ufunc, left, right in conditions:
+            condition = apply_ufunc(kernel, ufunc, [left, right], 'b', release_operands=False)
+            if (result is not None):
+                condition = apply_ufunc(kernel, np.logical_and, [result, condition], 'b')
+            result = condition
+        for operand in operands:
+            release(kernel, operand)
+        return result
+    if (isinstance(node, ast.BoolOp)):
+        result = compile_node(kernel, node.values[0], coefficient)
+        for value in node.values[1:]:
+            result = apply_ufunc(kernel, bool_ufuncs[type(node.op)], [result, compile_node(kernel, value, coefficient)], 'b')
+        return result
+    if (isinstance(node, ast.Call)) and (isinstance(node.func, ast.Name)) and (node.func.id in damage_functions):
+        operands = [compile_node(kernel, arg, coefficient) for arg in node.args]
+        return apply_ufunc(kernel, damage_functions[node.func.id], operands, 'f')
+    raise ValueError('unsupported damage expression: ' + ast.dump(node))
+
+#emit ufunc(*operands) into a register of kind, reusing an operand's register when possible, or fold
+#the call into a constant when all operands are constants
+def apply_ufunc(kernel, ufunc, operands, kind, release_operands=True):
+    if all([operand[0] == 'const' for operand in operands]):
+        return ('const', ufunc(*[operand[1] for operand in operands]))
+    if (release_operands):
+        for operand in operands:
+            release(kernel, operand)
+    out = allocate(kernel, kind)
+    emit(kernel, ufunc, operands, out)
+    return out
+
+#zero the values of out where condition holds
+def zero_where(condition, out):
+    np.copyto(out, 0.0, where=condition)
+    return
+
+#allocate the kernel's buffers for at least N devices
+def size_kernel(kernel, N):
+    if (kernel['size'] >= N):
+        return
+    for kind, dtype in [('f', np.float64), ('b', bool)]:
+        kernel['registers'][kind] = [np.empty(N, dtype=dtype) for register in kernel['registers'][kind]]
+    kernel['derived_arrays'] = {name:np.empty(N) for name in derived_names}
+    kernel['output_arrays'] = [np.empty(N) for issueID in kernel['outputs']]
+    kernel['size'] = N
+    return
+
+#compute the derived quantities that the laws use into the kernel's buffers
+def compute_derived(kernel, sensor_values, N):
+    derived = kernel['derived']
+    arrays = {name:array[0:N] for name, array in kernel['derived_arrays'].iteritems()}
+    x = sensor_values[:, 0]
+    y = sensor_values[:, 1]
+    z = sensor_values[:, 2]
+    if (len(derived & set(['rho2', 'rho', 'r', 'theta'])) > 0):
+        rho2 = arrays['rho2']
+        scratch = arrays['r']
+        np.square(x, out=rho2)
+        np.square(y, out=scratch)
+        np.add(rho2, scratch, out=rho2)
+    if ('r' in derived):
+        np.square(z, out=arrays['r'])
+        np.add(rho2, arrays['r'], out=arrays['r'])
+        np.sqrt(arrays['r'], out=arrays['r'])
+    if (len(derived & set(['rho', 'theta'])) > 0):
+        np.sqrt(rho2, out=arrays['rho'])
+    if ('phi' in derived):
+        np.arctan2(y, x, out=arrays['phi'])
+    if ('theta' in derived):
+        np.arctan2(z, arrays['rho'], out=arrays['theta'])
+    arrays.update({name:sensor_values[:, column] for name, column in sensor_columns.iteritems()})
+    return arrays
+
+#execute the kernel's program on sensor_values, returning the (issueID, damage increment) pairs in
+#issues order, and the crud damage, noting that those arrays are overwritten by the kernel's next run
+def run_damage_kernel(kernel, sensor_values):
+    N = len(sensor_values)
+    size_kernel(kernel, N)
+    inputs = compute_derived(kernel, sensor_values, N)
+    registers = {'f':[array[0:N] for array in kernel['registers']['f']],
+        'b':[array[0:N] for array in kernel['registers']['b']]}
+    outputs = [array[0:N] for array in kernel['output_arrays']]
+    def value(operand):
+        if (operand[0] == 'const'):
+            return operand[1]
+        if (operand[0] == 'input'):
+            return inputs[operand[1]]
+        if (operand[0] == 'output'):
+            return outputs[operand[1]]
+        return registers[operand[0]][operand[1]]
+    for ufunc, operands, out in kernel['program']:
+        if (ufunc is np.copyto):
+            np.copyto(value(out), value(operands[0]))
+        elif (ufunc is zero_where):
+            zero_where(value(operands[0]), value(out))
+        else:
+            ufunc(*[value(operand) for operand in operands], out=value(out))
+    crud_damage = np.zeros(N)
+    if (kernel['crud_output'] is not None):
+        crud_damage = value(kernel['crud_output'])
+    return zip(kernel['outputs'], outputs), crud_damage
+
+#evaluate the issues' damage laws with numexpr, which allocates its results but evaluates each law in
+#one multithreaded pass
+def run_numexpr_laws(laws, sensor_values):
+    try:
+        import numexpr as ne
+    except ImportError:
+        raise ImportError("damage_engine = 'numexpr' requires the numexpr package")
+    x = sensor_values[:, 0]
+    y = sensor_values[:, 1]
+    z = sensor_values[:, 2]
+    variables = {'x':x, 'y':y, 'z':z, 'temperature':x, 'pressure':y, 'load':z}
+    variables['rho2'] = ne.evaluate('x**2 + y**2', local_dict=variables)
+    variables['rho'] = ne.evaluate('sqrt(rho2)', local_dict=variables)
+    variables['r'] = ne.evaluate('sqrt(rho2 + z**2)', local_dict=variables)
+    variables['phi'] = ne.evaluate('arctan2(y, x)', local_dict=variables)
+    variables['theta'] = ne.evaluate('arctan2(z, rho)', local_dict=variables)
+    damage_increments = []
+    crud_damage = np.zeros(len(sensor_values))
+    for issue, issueID, coefficient, damage, gate in laws:
+        variables['coefficient'] = coefficient
+        if (gate is None):
+            damg = ne.evaluate(damage, local_dict=variables)
+        else:
+            damg = ne.evaluate('where(' + gate + ', ' + damage + ', 0.0)', local_dict=variables)
+        damage_increments += [(issueID, damg)]
+        if (issue == 'crud'):
+            crud_damage = damg
+    return damage_increments, crud_damage
+
+#the compiled kernels of the issues' damage laws, keyed by those laws
+damage_kernels = {}
+
+#compute the damage that sensor_values do to devices in one timestep with the kernel compiled from
+#issues' damage laws, or with numexpr when engine='numexpr'
+def evaluate_damage(sensor_values, issues, engine='numpy'):
+    laws = tuple(damage_laws(issues))
+    if (engine == 'numexpr'):
+        return run_numexpr_laws(laws, sensor_values)
+    if (engine != 'numpy'):
+        raise ValueError("damage_engine = " + str(engine) + " is not one of ['numpy', 'numexpr']")
+    kernel = damage_kernels.get(laws)
+    if (kernel is None):
+        kernel = damage_kernels[laws] = compile_damage_kernel(issues)
+    return run_damage_kernel(kernel, sensor_values)
@@ -0,0 +1,95 @@
+#dispatch.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#the pool of idle technicians and the queue of failed devices that are waiting for service,
+#which let helper_fns.py dispatch a technician in O(1) rather than by scanning all devices
+#and technicians. The dispatch policy is one of:
+#    random   = devices and technicians are shuffled every timestep, as pdm.py has always done,
+#               so runs are reproducible with earlier versions of this code
+#    oldest   = failed devices are serviced in order of failure, and pdm maintenance goes
+#               first to the devices whose last repair is oldest
+#    priority = failed devices that lost the most production are serviced first, and pdm
+#               maintenance goes first to the devices having the highest predicted risk
+
+
+#imports
+import heapq
+from collections import deque
+import numpy as np
+
+#dispatch policies
+dispatch_policies = ['random', 'oldest', 'priority']
+
+#create pool containing IDs, which supports O(1) add and remove
+def make_pool(IDs):
+    members = [int(ID) for ID in IDs]
+    position = [-1]*(max(members + [-1]) + 1)
+    for idx, ID in enumerate(members):
+        position[ID] = idx
+    pool = {'members':members, 'position':position}
+    return pool
+
+#number of IDs in pool
+def pool_size(pool):
+    return len(pool['members'])
+
+#add ID to pool
+def pool_add(pool, ID):
+    pool['position'][ID] = len(pool['members'])
+    pool['members'].append(ID)
+    return
+
+#remove ID from pool by moving the last member into its slot
+def pool_remove(pool, ID):
+    members = pool['members']
+    position = pool['position']
+    idx = position[ID]
+    last_ID = members.pop()
+    if (last_ID != ID):
+        members[idx] = last_ID
+        position[last_ID] = idx
+    position[ID] = -1
+    return
+
+#initialize the dispatcher's queue of devices waiting for service
+def initialize_dispatch(policy):
+    if (policy not in dispatch_policies):
+        raise ValueError('dispatch_policy = ' + str(policy) + ' is not one of ' + str(dispatch_policies))
+    if (policy == 'priority'):
+        waiting = []
+    else:
+        waiting = deque()
+    dispatch = {'policy':policy, 'waiting':waiting}
+    return dispatch
+
+#add failed deviceIDs to the queue of devices waiting for service
+def enqueue_devices(dispatch, devices, deviceIDs):
+    waiting = dispatch['waiting']
+    if (dispatch['policy'] == 'priority'):
+        for deviceID in deviceIDs:
+            priority = (-devices['production_rate_fail_time'][deviceID], devices['fail_time'][deviceID], deviceID)
+            heapq.heappush(waiting, priority)
+    else:
+        waiting.extend(deviceIDs)
+    return
+
+#number of devices waiting for service
+def N_waiting(dispatch):
+    return len(dispatch['waiting'])
+
+#remove and return the next device to be serviced
+def dequeue_device(dispatch):
+    if (dispatch['policy'] == 'priority'):
+        priority = heapq.heappop(dispatch['waiting'])
+        return priority[-1]
+    return dispatch['waiting'].popleft()
+
+#order the deviceIDs that pdm flagged as at risk of the issue whose probabilities are y_col_prob
+def order_at_risk(dispatch, devices, deviceIDs, y_col_prob, issueID):
+    if (dispatch['policy'] == 'priority'):
+        order = np.argsort(-y_col_prob[deviceIDs], kind='mergesort')
+    else:
+        order = np.argsort(devices['repair_time'][issueID, deviceIDs], kind='mergesort')
+    return deviceIDs[order]
@@ -0,0 +1,127 @@
+#events.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#event-driven simulation kernel, used by pdm.py when kernel='event'. Repair completions and
+#sensor outputs are scheduled on heaps and only the events that are due are processed, rather than
+#scanning every device every timestep. Failures are sampled via cumulative hazard: check_devices fails
+#an operating device with probability p = that issue's damage each timestep, so instead each device
+#accumulates its damage as hazard while operating, and fails when that hazard crosses a threshold that
+#was drawn from an exponential distribution when the device was last repaired. That is statistically
+#equivalent to check_devices' uniform draws to order p**2 (and p is ~1e-4 when devices typically fail),
+#but needs one random number per device and issue per repair rather than one per timestep. Failures
+#can't be scheduled ahead of time since the hazard depends on the device's future random walk, so
+#threshold crossings are found with one vectorized comparison per timestep.
+
+
+#imports
+import heapq
+import numpy as np
+from helper_fns import *
+
+#initialize each device's cumulative hazard and failure threshold for each issue, and schedule
+#sensor outputs by grouping each sensor's deviceIDs by the time that they next report
+def initialize_events(devices, issues, time_start):
+    N_issues, N_devices = devices['damage'].shape
+    devices['hazard'] = np.zeros((N_issues, N_devices))
+    devices['hazard_threshold'] = draw_hazard_thresholds(devices, devices['IDs'][np.newaxis, :],
+        np.arange(N_issues)[:, np.newaxis], time_start - 1)
+    events = {'repair':[], 'telemetry':[], 'N_scheduled':0}
+    #generate_telemetry reports a sensor when time > output_time
+    due_times = np.maximum(devices['sensors']['output_times'] + 1, time_start)
+    for due_time in np.unique(due_times):
+        batch = [devices['IDs'][due_times[:, sensorID] == due_time] for sensorID in devices['sensors']['IDs']]
+        schedule_event(events, 'telemetry', due_time, batch)
+    return events
+
+#draw exponentially-distributed failure thresholds for the issueIDs of deviceIDs that were repaired at time,
+#from the counter-based streams when the devices use them, or else from np.random
+def draw_hazard_thresholds(devices, deviceIDs, issueIDs, time):
+    streams = devices['streams']
+    if (streams is None):
+        return np.random.exponential(size=np.broadcast(deviceIDs, issueIDs).shape)
+    N_issues = len(devices['issue_names'])
+    uniforms = stream_uniforms(streams, 'hazard', deviceIDs, time, lane=issueIDs, N_lanes=N_issues)
+    return -np.log1p(-uniforms)
+
+#push an event onto the kind heap, with N_scheduled breaking ties in the order events were scheduled
+def schedule_event(events, kind, time, payload):
+    heapq.heappush(events[kind], (time, events['N_scheduled'], payload))
+    events['N_scheduled'] += 1
+    return
+
+#pop the kind events that are due at time
+def pop_due_events(events, kind, time):
+    heap = events[kind]
+    payloads = []
+    while (len(heap) > 0) and (heap[0][0] <= time):
+        payloads += [heapq.heappop(heap)[2]]
+    return payloads
+
+#random-walk sensors on operating devices, drawing np.random numbers only for those devices
+def update_operating_sensors(devices, sensor_sigma, time):
+    idx = (devices['state'] == OPERATING)
+    sensor_values = devices['sensors']['values']
+    streams = devices['streams']
+    if (streams is None):
+        size = (np.count_nonzero(idx), sensor_values.shape[1])
+        sensor_values[idx] += np.random.normal(loc=0.0, scale=sensor_sigma, size=size)
+    else:
+        normals = block_draws(streams, 'sensors', 'normal', time, sensor_values.shape[1])
+        sensor_values[idx] += sensor_sigma*normals[idx]
+    return
+
+#accumulate operating devices' hazard due to each fatal issue, and fail those devices whose hazard
+#crosses their threshold, returning the failed deviceIDs after adding them to the dispatch queue
+def check_hazards(devices, issues, time, debug, dispatch=None):
+    operating = (devices['state'] == OPERATING)
+    failed_deviceIDs = []
+    for issue in issues.keys():
+        if (issues[issue]['fatal']):
+            issueID = issues[issue]['ID']
+            issue_damage = devices['damage'][issueID]
+            hazard = devices['hazard'][issueID]
+            hazard += issue_damage*operating
+            #check_devices always fails a device whose damage is at least 1
+            idx = operating & ((hazard >= devices['hazard_threshold'][issueID]) | (issue_damage >= 1.0))
+            failed_deviceIDs += [fail_devices(devices, idx, issueID, time, debug)]
+            operating &= ~idx
+    failed_deviceIDs = np.concatenate(failed_deviceIDs + [np.zeros(0, dtype=int)])
+    if (dispatch is not None) and (dispatch['policy'] != 'random'):
+        enqueue_devices(dispatch, devices, failed_deviceIDs)
+    return failed_deviceIDs
+
+#schedule the completion of repairs, noting that complete_maintenance releases a device when time > repair_complete_time
+def schedule_repairs(events, devices, repairs):
+    for repair in repairs:
+        deviceID = repair['deviceID']
+        schedule_event(events, 'repair', devices['repair_complete_time'][deviceID] + 1, deviceID)
+    return
+
+#release the devices whose repairs are due, and draw new failure thresholds for the repaired issues
+def complete_due_repairs(events, devices, issues, technicians, time, debug):
+    deviceIDs = np.sort(np.array(pop_due_events(events, 'repair', time), dtype=int))
+    if (len(deviceIDs) == 0):
+        return deviceIDs
+    issueIDs = devices['issue'][deviceIDs]
+    release_devices(devices, issues, technicians, deviceIDs, time, debug)
+    devices['hazard'][issueIDs, deviceIDs] = 0.0
+    devices['hazard_threshold'][issueIDs, deviceIDs] = draw_hazard_thresholds(devices, deviceIDs, issueIDs, time)
+    return deviceIDs
+
+#append the sensor telemetry that is due to telemetry_buffer and reschedule those sensors' next output,
+#then append the fleet counts
+def generate_due_telemetry(events, devices, technicians, time, output_interval, telemetry_buffer):
+    batches = pop_due_events(events, 'telemetry', time)
+    if (len(batches) > 0):
+        output_times = devices['sensors']['output_times']
+        batch = []
+        for sensorID in devices['sensors']['IDs']:
+            deviceIDs = np.sort(np.concatenate([b[sensorID] for b in batches]))
+            append_sensor_telemetry(devices, sensorID, deviceIDs, time, telemetry_buffer)
+            output_times[deviceIDs, sensorID] = time + output_interval
+            batch += [deviceIDs]
+        schedule_event(events, 'telemetry', time + output_interval + 1, batch)
+    append_fleet_counts(devices, technicians, time, telemetry_buffer)
+    return
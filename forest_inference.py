@@ -0,0 +1,211 @@
+#forest_inference.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#batch inference for the RandomForestClassifier pdm models: the models' trees are flattened
+#into contiguous node arrays whose leaves store pre-normalized class1 probabilities, and all
+#models are scored in one call. The node arrays can also be stored in a forest artifact, a folder
+#of .npy files that pdm_inference='mmap' memory-maps rather than unpickling the models, so that
+#every simulator process scoring the same models shares one page-cached copy of their arrays.
+
+
+#imports
+import os
+import json
+import numpy as np
+
+#version of the forest artifact's layout, and the node arrays that it stores
+artifact_version = 1
+artifact_arrays = ['roots', 'feature', 'threshold', 'children', 'is_leaf', 'leaf_prob']
+
+#flatten the fitted models[y_col] forests into one set of node arrays, with each leaf storing
+#the class1 probability that pdm_check uses. The trees' compiled apply() methods are also kept,
+#and are used to find leaves since that is much faster than walking the node arrays with numpy.
+#Trees are walked on n_threads threads, noting that apply() releases the GIL.
+def flatten_forests(models, y_cols, n_threads=1):
+    features = []
+    thresholds = []
+    lefts = []
+    rights = []
+    leaf_probs = []
+    roots = []
+    trees = []
+    tree_starts = []
+    tree_stops = []
+    N_nodes = 0
+    N_trees = 0
+    for y_col in y_cols:
+        model = models[y_col]
+        class1 = model.classes_[1]
+        tree_starts += [N_trees]
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            nodeIDs = np.arange(tree.node_count)
+            is_leaf = (tree.children_left == -1)
+            #leaves point back at themselves and test feature 0, so that traversal stays put once a leaf is reached
+            features += [np.where(is_leaf, 0, tree.feature)]
+            thresholds += [tree.threshold]
+            lefts += [np.where(is_leaf, nodeIDs, tree.children_left) + N_nodes]
+            rights += [np.where(is_leaf, nodeIDs, tree.children_right) + N_nodes]
+            #normalize leaf values the same way that DecisionTreeClassifier.predict_proba does
+            value = tree.value[:, 0, :]
+            normalizer = value.sum(axis=1)
+            normalizer[normalizer == 0.0] = 1.0
+            leaf_probs += [value[:, class1]/normalizer]
+            roots += [N_nodes]
+            trees += [tree]
+            N_nodes += tree.node_count
+            N_trees += 1
+        tree_stops += [N_trees]
+    forest = {'y_cols':list(y_cols), 'roots':np.array(roots, dtype=np.int64),
+        'tree_starts':tree_starts, 'tree_stops':tree_stops, 'trees':trees, 'n_threads':n_threads}
+    forest['feature'] = np.concatenate(features).astype(np.int64)
+    forest['threshold'] = np.concatenate(thresholds).astype(np.float64)
+    forest['left'] = np.concatenate(lefts).astype(np.int64)
+    forest['right'] = np.concatenate(rights).astype(np.int64)
+    forest['is_leaf'] = (forest['left'] == np.arange(N_nodes))
+    #each node's left and right children, interleaved
+    forest['children'] = np.column_stack([forest['left'], forest['right']]).ravel()
+    forest['leaf_prob'] = np.concatenate(leaf_probs).astype(np.float64)
+    return forest
+
+#walk every (tree, sample) pair from its root to its leaf using the node arrays, returning
+#leaf node IDs with shape (N_trees, N_samples)
+def walk_node_arrays(forest, x):
+    N_samples, N_features = x.shape
+    roots = forest['roots']
+    N_trees = len(roots)
+    nodes = np.repeat(roots, N_samples)
+    offsets = np.tile(np.arange(N_samples)*N_features, N_trees)
+    active = np.arange(len(nodes))
+    x = x.ravel()
+    feature = forest['feature']
+    threshold = forest['threshold']
+    children = forest['children']
+    is_leaf = forest['is_leaf']
+    while (len(active) > 0):
+        active_nodes = nodes.take(active)
+        go_right = ~(x.take(offsets.take(active) + feature.take(active_nodes)) <= threshold.take(active_nodes))
+        next_nodes = children.take(2*active_nodes + go_right)
+        nodes[active] = next_nodes
+        active = active[~is_leaf.take(next_nodes)]
+    return nodes.reshape(N_trees, N_samples)
+
+#find the leaf node IDs of every (tree, sample) pair, with shape (N_trees, N_samples)
+def find_leaves(forest, x):
+    trees = forest.get('trees')
+    if (trees is None):
+        return walk_node_arrays(forest, x)
+    roots = forest['roots']
+    leaves = np.empty((len(trees), len(x)), dtype=np.int64)
+    def apply_tree(treeID):
+        leaves[treeID] = trees[treeID].apply(x) + roots[treeID]
+    treeIDs = range(len(trees))
+    if (forest['n_threads'] > 1):
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(forest['n_threads'])
+        pool.map(apply_tree, treeIDs)
+        pool.close()
+    else:
+        for treeID in treeIDs:
+            apply_tree(treeID)
+    return leaves
+
+#predict every model's class1 probability for features x, returning array with shape (N_models, N_samples).
+#x is cast to float32 as sklearn does, and tree probabilities are summed in tree order then divided
+#by the number of trees as RandomForestClassifier.predict_proba does, so results agree with sklearn
+def predict_forests(forest, x, chunk_size=100000):
+    x = np.ascontiguousarray(x, dtype=np.float32)
+    N_samples = len(x)
+    N_models = len(forest['y_cols'])
+    probs = np.zeros((N_models, N_samples))
+    for start in range(0, N_samples, chunk_size):
+        x_chunk = x[start:start + chunk_size]
+        leaf_prob = forest['leaf_prob'][find_leaves(forest, x_chunk)]
+        for idx in range(N_models):
+            tree_start = forest['tree_starts'][idx]
+            tree_stop = forest['tree_stops'][idx]
+            prob = np.zeros(len(x_chunk))
+            for treeID in range(tree_start, tree_stop):
+                prob += leaf_prob[treeID]
+            prob /= (tree_stop - tree_start)
+            probs[idx, start:start + len(x_chunk)] = prob
+    return probs
+
+#the folder of the forest artifact of model_folder's models for pdm_threshold_time
+def forest_artifact_folder(model_folder, pdm_threshold_time):
+    return model_folder + 'forest_in_' + str(pdm_threshold_time) + '/'
+
+#sizes and modification times of the model files, which identify the models an artifact was built from
+def model_files_stats(model_files):
+    return sorted([[os.path.basename(file), os.path.getsize(file), int(os.path.getmtime(file))] for file in model_files])
+
+#write forest's node arrays to the artifact folder, along with the y_cols, tree ranges, and model_files'
+#stats. The artifact is written to a temporary folder that then replaces folder, so that an interrupted
+#write leaves no partial artifact
+def write_forest_artifact(forest, folder, model_files):
+    import shutil
+    folder = folder.rstrip('/')
+    temporary_folder = folder + '.tmp'
+    if (os.path.exists(temporary_folder)):
+        shutil.rmtree(temporary_folder)
+    os.makedirs(temporary_folder)
+    for name in artifact_arrays:
+        np.save(os.path.join(temporary_folder, name + '.npy'), forest[name])
+    description = {'artifact_version':artifact_version, 'y_cols':forest['y_cols'], 'tree_starts':forest['tree_starts'],
+        'tree_stops':forest['tree_stops'], 'model_files':model_files_stats(model_files)}
+    with open(os.path.join(temporary_folder, 'forest.json'), 'w') as file:
+        json.dump(description, file, indent=4)
+    if (os.path.exists(folder)):
+        shutil.rmtree(folder)
+    os.rename(temporary_folder, folder)
+    return
+
+#read the artifact's description, or None when folder holds no artifact of the y_cols models, in any order,
+#built from model_files
+def read_forest_description(folder, y_cols, model_files):
+    try:
+        with open(os.path.join(folder, 'forest.json'), 'r') as file:
+            description = json.load(file)
+    except (IOError, ValueError):
+        return None
+    if (description['artifact_version'] != artifact_version) or (sorted(description['y_cols']) != sorted(y_cols)) or \
+        (description['model_files'] != model_files_stats(model_files)):
+        return None
+    return description
+
+#memory-map the forest artifact in folder, returning a forest that predict_forests scores by walking
+#its node arrays, with those arrays' pages shared by every process that maps them
+def read_forest_artifact(folder, description, n_threads=1):
+    forest = {'y_cols':[str(y_col) for y_col in description['y_cols']], 'tree_starts':description['tree_starts'],
+        'tree_stops':description['tree_stops'], 'trees':None, 'n_threads':n_threads}
+    for name in artifact_arrays:
+        forest[name] = np.asarray(np.load(os.path.join(folder, name + '.npy'), mmap_mode='r'))
+    return forest
+
+#get the memory-mapped forest of the y_cols models in model_folder for pdm_threshold_time, first
+#building its artifact from the pickled models when it is missing or older than those models. Concurrent
+#runs take turns via a lock file, so only the first builds the artifact and the others map it, noting that
+#a mapped artifact stays valid even if it is later rebuilt
+def load_forest_artifact(model_folder, y_cols, pdm_threshold_time, n_threads=1):
+    import fcntl
+    import pickle as pkl
+    folder = forest_artifact_folder(model_folder, pdm_threshold_time)
+    model_files = [model_folder + y_col + '_model.pkl' for y_col in y_cols]
+    with open(folder.rstrip('/') + '.lock', 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        description = read_forest_description(folder, y_cols, model_files)
+        if (description is None):
+            print 'building forest artifact ' + folder + ' ...'
+            models = {}
+            for y_col, model_file in zip(y_cols, model_files):
+                with open(model_file, 'rb') as file:
+                    models[y_col] = pkl.load(file)
+            write_forest_artifact(flatten_forests(models, y_cols), folder, model_files)
+            del models
+            description = read_forest_description(folder, y_cols, model_files)
+        print 'memory-mapping forest artifact ' + folder
+        forest = read_forest_artifact(folder, description, n_threads)
+        fcntl.flock(lock, fcntl.LOCK_UN)
+    return forest
@@ -10,306 +10,541 @@
 #imports
 import numpy as np
 import pandas as pd
+from buffers import append_rows, read_parquet, iterate_parquet_partitions, open_csv_output
+from forest_inference import predict_forests
+from dispatch import *
+from streams import block_draws, stream_uniforms, random_order
+from damage import evaluate_damage
+from scoring import due_deviceIDs, schedule_rescores, count_scorings
+
+#device state codes
+OPERATING, FAILED, REPAIR, MAINTENANCE = 0, 1, 2, 3
+state_names = ['operating', 'failed', 'repair', 'maintenance']
+
+#initialize the fleet's struct-of-arrays state, one array element per device, with random numbers
+#drawn from the counter-based streams when given, or else from np.random
+def initialize_devices(N_devices, sensor_names, issues, output_interval, time_start, streams=None):
+    N_sensors = len(sensor_names)
+    values = np.zeros((N_devices, N_sensors))
+    sensors = {'names':sensor_names, 'IDs':np.arange(N_sensors), 'values':values}
+    #initialize time of each sensor's next output
+    if (streams is None):
+        output_times = np.random.uniform(low=0, high=output_interval, size=values.shape).astype(int)
+    else:
+        uniforms = stream_uniforms(streams, 'output_times', np.arange(N_devices)[:, np.newaxis], 0,
+            lane=np.arange(N_sensors), N_lanes=N_sensors)
+        output_times = (output_interval*uniforms).astype(int)
+    sensors['output_times'] = output_times
+    #the timing wheel of sensor outputs is built from output_times when telemetry is first generated
+    sensors['wheel'] = None
+    devices = {'IDs':np.arange(N_devices), 'sensors':sensors, 'streams':streams}
+    #issue names indexed by issueID, a device's issue code is -1 when it has no issue
+    N_issues = len(issues)
+    issue_names = [None]*N_issues
+    for issue in issues.keys():
+        issue_names[issues[issue]['ID']] = issue
+    devices['issue_names'] = issue_names
+    devices['state'] = np.zeros(N_devices, dtype=np.int8) + OPERATING
+    #number of devices in each state, kept current by set_state
+    devices['state_counts'] = np.bincount(devices['state'], minlength=len(state_names))
+    devices['issue'] = np.zeros(N_devices, dtype=np.int16) - 1
+    devices['technicianID'] = np.zeros(N_devices, dtype=np.int32) - 1
+    devices['fail_time'] = np.zeros(N_devices, dtype=np.int32) - 1
+    devices['repair_start_time'] = np.zeros(N_devices, dtype=np.int32) - 1
+    devices['repair_complete_time'] = np.zeros(N_devices, dtype=np.int32) - 1
+    devices['production_rate'] = np.zeros(N_devices)
+    devices['production_rate_fail_time'] = np.zeros(N_devices)
+    #time of each device's most recent repair, per issue
+    devices['repair_time'] = np.zeros((N_issues, N_devices), dtype=np.int32) + (time_start - 1)
+    #initialize damage due to issues
+    devices['damage'] = np.zeros((N_issues, N_devices))
+    return devices
+
+#initialize technicians, location = deviceID being serviced or -1 when idle
+def initialize_technicians(N_technicians):
+    technicians = {'IDs':np.arange(N_technicians)}
+    technicians['location'] = np.zeros(N_technicians, dtype=np.int32) - 1
+    technicians['idle'] = make_pool(technicians['IDs'])
+    return technicians
 
 #random-walk sensors on operating devices
-def update_sensors(devices, sensor_sigma):
+def update_sensors(devices, sensor_sigma, time):
     sensor_values = devices['sensors']['values']
     size = sensor_values.shape
-    delta_values = np.random.normal(loc=0.0, scale=sensor_sigma, size=size)
-    devicesIDs = devices['IDs']
-    for deviceID in devicesIDs:
-        if (devices[deviceID]['state'] == 'operating'):
-            sensor_values[deviceID] += delta_values[deviceID]
+    if (devices['streams'] is None):
+        delta_values = np.random.normal(loc=0.0, scale=sensor_sigma, size=size)
+    else:
+        delta_values = sensor_sigma*block_draws(devices['streams'], 'sensors', 'normal', time, size[1])
+    idx = (devices['state'] == OPERATING)
+    sensor_values[idx] += delta_values[idx]
     return
 
-#compute derived quantities from sensor_values
-def sensor_derived_data(sensor_values):
-    x = sensor_values[:,0]
-    y = sensor_values[:,1]
-    z = sensor_values[:,2]
-    rho2 = x**2 + y**2
-    r = np.sqrt(rho2 + z**2)
-    rho = np.sqrt(rho2)
-    phi = np.arctan2(y, x)
-    theta = np.arctan2(z, rho)
-    return x, y, z, r, rho, phi, theta
-
 #increment devices' damage due to issues
-def update_damage(devices, issues):
-    sensor_values = devices['sensors']['values']
-    x, y, z, r, rho, phi, theta = sensor_derived_data(sensor_values)
+def update_damage(devices, issues, engine='numpy'):
     damage = devices['damage']
-    for issue in issues.keys():
-        issueID = issues[issue]['ID']
-        coefficient = issues[issue]['coefficient']
-        if (issue == 'crud'):
-            damg = coefficient*r
-            crud_damage = damg
-        if (issue == 'jammed_rotor'):
-            damg = coefficient*(x**2)
-            damg[x < 0] = 0.0
-        if (issue == 'cracked_valve'):
-            damg = coefficient*(y**2)
-            damg[y < 0] = 0.0
-        if (issue == 'broken_gear'):
-            damg = coefficient*rho*z
-            damg[z < 0] = 0.0
+    damage_increments, crud_damage = compute_damage_increments(devices['sensors']['values'], issues, engine=engine)
+    for issueID, damg in damage_increments:
         damage[issueID] += damg
     return crud_damage
 
+#compute the damage that sensor_values do to devices in one timestep, returning a list of
+#(issueID, damage increment) pairs in issues order, and the crud damage, with the issues' damage laws
+#evaluated by damage.py's fused kernel or by numexpr, so those arrays are only valid until the next call
+def compute_damage_increments(sensor_values, issues, engine='numpy'):
+    return evaluate_damage(sensor_values, issues, engine=engine)
+
 #compute production rate = 1-crud_damage or zero if device is not operating
 def compute_production(devices, issues, crud_damage):
     production_rate = 1.0 - crud_damage
     production_rate[production_rate < 0.0] = 0.0
-    deviceIDs = devices['IDs']
-    for deviceID in deviceIDs:
-        if (devices[deviceID]['state'] == 'operating'):
-            devices[deviceID]['production_rate'] = production_rate[deviceID]
-        else:
-            devices[deviceID]['production_rate'] = 0.0
+    production_rate[devices['state'] != OPERATING] = 0.0
+    devices['production_rate'][:] = production_rate
     return
 
-#check for device failures and update status, noting that crud doesn't fail a device
-def check_devices(devices, issues, time, debug):
+#check for device failures and update status, noting that crud doesn't fail a device,
+#and return the failed deviceIDs after adding them to the dispatch queue
+def check_devices(devices, issues, time, debug, dispatch=None):
+    deviceIDs = devices['IDs']
+    N_devices = len(deviceIDs)
+    state = devices['state']
+    streams = devices['streams']
+    if (streams is not None):
+        ran_nums = block_draws(streams, 'failures', 'uniform', time, len(issues))
+    failed_deviceIDs = []
     for issue in issues.keys():
         issueID = issues[issue]['ID']
         issue_damage = devices['damage'][issueID]
         fatal = issues[issue]['fatal']
-        deviceIDs = devices['IDs']
-        N_devices = len(deviceIDs)
-        sensor_names = devices['sensors']['IDs']
-        sensorIDs = devices['sensors']['names']
         if (fatal):
-            ran_num = np.random.uniform(size=N_devices)
-            idx = (ran_num < issue_damage)
-            for deviceID in deviceIDs[idx]:
-                if (devices[deviceID]['state'] == 'operating'):
-                    devices[deviceID]['state'] = 'failed'
-                    devices[deviceID]['issue'] = issue
-                    devices[deviceID]['fail_time'] = time
-                    devices[deviceID]['production_rate_fail_time'] = devices[deviceID]['production_rate']
-                    if (debug):
-                        print 'DEVICE  FAILURE    :    time = ', time, 'deviceID = ', deviceID#, '\tissue = ', issue
+            if (streams is None):
+                ran_num = np.random.uniform(size=N_devices)
+            else:
+                ran_num = ran_nums[:, issueID]
+            idx = (ran_num < issue_damage) & (state == OPERATING)
+            failed_deviceIDs += [fail_devices(devices, idx, issueID, time, debug)]
+    failed_deviceIDs = np.concatenate(failed_deviceIDs + [np.zeros(0, dtype=int)])
+    if (dispatch is not None) and (dispatch['policy'] != 'random'):
+        enqueue_devices(dispatch, devices, failed_deviceIDs)
+    return failed_deviceIDs
+
+#set the state of the devices selected by idx, which is a deviceID, deviceIDs, or a boolean mask,
+#and move them between the state_counts
+def set_state(devices, idx, state):
+    old_states = np.atleast_1d(devices['state'][idx])
+    state_counts = devices['state_counts']
+    state_counts -= np.bincount(old_states, minlength=len(state_names))
+    state_counts[state] += len(old_states)
+    devices['state'][idx] = state
     return
 
-#send first available technician to service failed deviceIDs
-def service_failed_devices(devices, technicians, time, repair_duration, debug):
-    random_deviceIDs = devices['IDs'].copy()
-    np.random.shuffle(random_deviceIDs)
-    random_technicianIDs = technicians['IDs'].copy()
-    np.random.shuffle(random_technicianIDs)
+#flag the devices selected by idx as failed due to issueID, and return their deviceIDs
+def fail_devices(devices, idx, issueID, time, debug):
+    set_state(devices, idx, FAILED)
+    devices['issue'][idx] = issueID
+    devices['fail_time'][idx] = time
+    devices['production_rate_fail_time'][idx] = devices['production_rate'][idx]
+    deviceIDs = devices['IDs'][idx]
+    if (debug):
+        for deviceID in deviceIDs:
+            print 'DEVICE  FAILURE    :    time = ', time, 'deviceID = ', deviceID#, '\tissue = ', issue
+    return deviceIDs
+
+#send first available technician to service failed deviceIDs, taking them from the dispatch queue
+#unless the dispatch policy is random
+def service_failed_devices(devices, technicians, time, repair_duration, debug, dispatch=None):
+    if (dispatch is not None) and (dispatch['policy'] != 'random'):
+        return dispatch_failed_devices(dispatch, devices, technicians, time, repair_duration, debug)
+    random_deviceIDs = shuffled_IDs(devices, devices['IDs'], 'dispatch', time)
+    random_technicianIDs = shuffled_IDs(devices, technicians['IDs'], 'technicians', time)
+    #pair failed devices with idle technicians, both in shuffled order
+    failed_deviceIDs = random_deviceIDs[devices['state'][random_deviceIDs] == FAILED]
+    idle_technicianIDs = random_technicianIDs[technicians['location'][random_technicianIDs] == -1]
     repairs = []
-    for deviceID in random_deviceIDs:
-        if (devices[deviceID]['state'] == 'failed'):
-            issue = devices[deviceID]['issue']
-            for technicianID in random_technicianIDs:
-                if (technicians[technicianID]['location'] == -1):
-                    repair_maintenance = 'repair'
-                    repair = service_deviceID(deviceID, issue, technicianID, devices, technicians, time, repair_duration, 
-                        repair_maintenance, debug)
-                    repairs += [repair]
-                    if (debug):
-                        print 'FAILURE MAINTENANCE:    time = ', time, 'deviceID = ', deviceID, '\tissue = ', issue, \
-                            '\ttechnicianID = ', technicianID, '\trepair_complete_time = ', devices[deviceID]['repair_complete_time']
-                    break
+    for deviceID, technicianID in zip(failed_deviceIDs, idle_technicianIDs):
+        issue = devices['issue_names'][devices['issue'][deviceID]]
+        repair_maintenance = 'repair'
+        repair = service_deviceID(deviceID, issue, technicianID, devices, technicians, time, repair_duration, 
+            repair_maintenance, debug)
+        repairs += [repair]
+        if (debug):
+            print 'FAILURE MAINTENANCE:    time = ', time, 'deviceID = ', deviceID, '\tissue = ', issue, \
+                '\ttechnicianID = ', technicianID, '\trepair_complete_time = ', devices['repair_complete_time'][deviceID]
+    return repairs
+
+#get a copy of IDs in random order, drawn from the purpose streams at time when the devices use
+#counter-based streams, or else shuffled via np.random
+def shuffled_IDs(devices, IDs, purpose, time):
+    if (devices['streams'] is None):
+        IDs = IDs.copy()
+        np.random.shuffle(IDs)
+        return IDs
+    return random_order(devices['streams'], purpose, IDs, time)
+
+#pair queued failed devices with idle technicians until either runs out
+def dispatch_failed_devices(dispatch, devices, technicians, time, repair_duration, debug):
+    repairs = []
+    idle = technicians['idle']
+    while (N_waiting(dispatch) > 0) and (pool_size(idle) > 0):
+        deviceID = dequeue_device(dispatch)
+        technicianID = idle['members'][-1]
+        issue = devices['issue_names'][devices['issue'][deviceID]]
+        repair_maintenance = 'repair'
+        repair = service_deviceID(deviceID, issue, technicianID, devices, technicians, time, repair_duration, 
+            repair_maintenance, debug)
+        repairs += [repair]
+        if (debug):
+            print 'FAILURE MAINTENANCE:    time = ', time, 'deviceID = ', deviceID, '\tissue = ', issue, \
+                '\ttechnicianID = ', technicianID, '\trepair_complete_time = ', devices['repair_complete_time'][deviceID]
     return repairs
 
 #send technician to repair/maintain deviceID
 def service_deviceID(deviceID, issue, technicianID, devices, technicians, time, repair_duration, repair_maintenance, debug):
-    technicians[technicianID]['location'] = deviceID
-    devices[deviceID]['state'] = repair_maintenance
-    devices[deviceID]['technicianID'] = technicianID
-    devices[deviceID]['repair_start_time'] = time
-    devices[deviceID]['repair_complete_time'] = time + repair_duration
+    technicians['location'][technicianID] = deviceID
+    pool_remove(technicians['idle'], technicianID)
+    set_state(devices, deviceID, state_names.index(repair_maintenance))
+    devices['technicianID'][deviceID] = technicianID
+    devices['repair_start_time'][deviceID] = time
+    devices['repair_complete_time'][deviceID] = time + repair_duration
     repair = {'time':time, 'deviceID':deviceID, 'issue':issue, 'technicianID':technicianID, 
-        'production_rate':devices[deviceID]['production_rate_fail_time']}
+        'production_rate':devices['production_rate_fail_time'][deviceID]}
     sensor_names = devices['sensors']['names']
     sensor_values = devices['sensors']['values'][deviceID]
     for idx in range(len(sensor_names)):
         repair[sensor_names[idx]] = sensor_values[idx]
     return repair
 
+#the sensors whose values are the pdm models' first features, in the order that build_models.ipynb fits them
+model_sensor_names = ['load', 'pressure', 'temperature']
+
+#get the names of the pdm models' feature columns, which are the sensors, production_rate, and the time since
+#each fatal issue, along with those fatal issues. pdm.py's feature builders and train_models.py both order
+#the features and the fatal issues this way, so models score the features that they were fit on
+def model_feature_columns(issues):
+    fatal_issues = [issue for issue in issues.keys() if (issues[issue]['fatal'] == True)]
+    x_cols = model_sensor_names + ['production_rate'] + ['time_since_' + issue for issue in fatal_issues]
+    return x_cols, fatal_issues
+
 #generate array of features used by pdm models
 def get_model_features(devices, issues, time):
+    x_cols, fatal_issues = model_feature_columns(issues)
     x = pd.DataFrame(devices['sensors']['values'], columns=devices['sensors']['names'])
-    deviceIDs = devices['IDs']
-    production_rate = np.array([devices[deviceID]['production_rate'] for deviceID in deviceIDs])
-    x['production_rate'] = production_rate
-    fatal_issues = [issue for issue in issues.keys() if (issues[issue]['fatal'] == True)]
-    N_devices = len(deviceIDs)
+    x['production_rate'] = devices['production_rate'].copy()
     for issue in fatal_issues:
-        times_since_issue = np.zeros(N_devices)
-        for deviceID in deviceIDs:
-            times_since_issue[deviceID] = time - devices[deviceID][issue + '_repair_time']
+        issueID = issues[issue]['ID']
+        times_since_issue = (time - devices['repair_time'][issueID]).astype(float)
         x_col = 'time_since_' + issue
         x[x_col] = times_since_issue
+    return x[x_cols], fatal_issues
+
+#generate features used by pdm models for the given deviceIDs as a float array, with columns ordered as in get_model_features
+def get_model_feature_matrix(devices, issues, time, deviceIDs):
+    x_cols, fatal_issues = model_feature_columns(issues)
+    sensorIDs = [devices['sensors']['names'].index(sensor_name) for sensor_name in model_sensor_names]
+    N_sensors = len(sensorIDs)
+    x = np.empty((len(deviceIDs), len(x_cols)))
+    x[:, 0:N_sensors] = devices['sensors']['values'][deviceIDs][:, sensorIDs]
+    x[:, N_sensors] = devices['production_rate'][deviceIDs]
+    for idx, issue in enumerate(fatal_issues):
+        issueID = issues[issue]['ID']
+        x[:, N_sensors + 1 + idx] = time - devices['repair_time'][issueID, deviceIDs]
     return x, fatal_issues
 
-#send into maintenance those deviceIDs that are predicted to suffer failure soon enough
-def pdm_check(devices, issues, time, technicians, models, maintenance_duration, pdm_threshold_time, pdm_threshold_probability, debug):
-    #get features used to predict each device's log(time-to-next-failure)
-    x, fatal_issues = get_model_features(devices, issues, time)
-    y_pred = pd.DataFrame()
+#predict each fatal issue's probability for all devices, using the flattened forest when available
+#and otherwise the sklearn models, with the forest only scoring operating devices
+def predict_fatal_issues(devices, issues, time, models, pdm_threshold_time, forest):
+    probs = {}
+    if (forest is None):
+        x, fatal_issues = get_model_features(devices, issues, time)
+        for issue in fatal_issues:
+            y_col = issue + '_in_' + str(pdm_threshold_time)
+            model = models[y_col]
+            class1 = model.classes_[1]
+            probs[issue] = model.predict_proba(x)[:, class1]
+    else:
+        deviceIDs = devices['IDs'][devices['state'] == OPERATING]
+        x, fatal_issues = get_model_feature_matrix(devices, issues, time, deviceIDs)
+        y_col_probs = predict_forests(forest, x)
+        for issue in fatal_issues:
+            y_col = issue + '_in_' + str(pdm_threshold_time)
+            probs[issue] = np.zeros(len(devices['IDs']))
+            probs[issue][deviceIDs] = y_col_probs[forest['y_cols'].index(y_col)]
+    return probs, fatal_issues
+
+#predict each fatal issue's probability for all devices from scoring's cached probabilities, after
+#rescoring the operating devices that are due, and count the scorings done and saved into summary
+def predict_due_issues(scoring, summary, devices, issues, time, models, pdm_threshold_time, forest):
+    operating = (devices['state'] == OPERATING)
+    deviceIDs = due_deviceIDs(scoring, devices['IDs'], operating, devices['repair_time'], time)
+    fatal_issues = [issue for issue in issues.keys() if (issues[issue]['fatal'] == True)]
+    y_cols = [issue + '_in_' + str(pdm_threshold_time) for issue in fatal_issues]
+    if (len(deviceIDs) > 0):
+        if (forest is None):
+            x, fatal_issues = get_model_features(devices, issues, time)
+            x = x.iloc[deviceIDs]
+            due_probs = np.array([models[y_col].predict_proba(x)[:, models[y_col].classes_[1]] for y_col in y_cols])
+            N_trees = [len(models[y_col].estimators_) for y_col in y_cols]
+        else:
+            x, fatal_issues = get_model_feature_matrix(devices, issues, time, deviceIDs)
+            y_col_probs = predict_forests(forest, x)
+            due_probs = np.array([y_col_probs[forest['y_cols'].index(y_col)] for y_col in y_cols])
+            N_trees = [forest['tree_stops'][idx] - forest['tree_starts'][idx] for idx in
+                [forest['y_cols'].index(y_col) for y_col in y_cols]]
+        schedule_rescores(scoring, deviceIDs, due_probs, devices['sensors']['values'][deviceIDs], devices['repair_time'], time,
+            N_trees)
+    #the scorings saved are counted against full rescoring of the operating devices, whichever the inference
+    N_full = operating.sum()
+    full_probs = None
+    if (scoring['audit']):
+        full, fatal_issues = predict_fatal_issues(devices, issues, time, models, pdm_threshold_time, forest)
+        full_probs = np.array([full[issue] for issue in fatal_issues])
+    count_scorings(summary, len(deviceIDs), N_full, scoring['probs'], full_probs, operating, scoring['threshold'])
+    probs = {issue:scoring['probs'][idx] for idx, issue in enumerate(fatal_issues)}
+    return probs, fatal_issues
+
+#send into maintenance those deviceIDs that are predicted to suffer failure soon enough, with the
+#adaptive scoring scheduler's cached probabilities when scoring is given
+def pdm_check(devices, issues, time, technicians, models, maintenance_duration, pdm_threshold_time, pdm_threshold_probability, debug,
+        forest=None, dispatch=None, scoring=None, summary=None):
+    #get each device's probability of suffering each fatal issue within pdm_threshold_time
+    if (scoring is None):
+        probs, fatal_issues = predict_fatal_issues(devices, issues, time, models, pdm_threshold_time, forest)
+    else:
+        probs, fatal_issues = predict_due_issues(scoring, summary, devices, issues, time, models, pdm_threshold_time, forest)
     repairs = []
-    random_technicianIDs = technicians['IDs'].copy()
-    np.random.shuffle(random_technicianIDs)
-    random_deviceIDs = devices['IDs'].copy()
-    np.random.shuffle(random_deviceIDs)
+    random_order = (dispatch is None) or (dispatch['policy'] == 'random')
+    if (random_order):
+        random_technicianIDs = shuffled_IDs(devices, technicians['IDs'], 'maintenance_technicians', time)
+        random_deviceIDs = shuffled_IDs(devices, devices['IDs'], 'maintenance', time)
     for issue in fatal_issues:
-        y_col = issue + '_in_' + str(pdm_threshold_time)
-        model = models[y_col]
-        class1 = model.classes_[1]
-        y_col_prob = model.predict_proba(x)
-        for deviceID in random_deviceIDs:
-            if (devices[deviceID]['state'] == 'operating'):
-                if (y_col_prob[deviceID][class1] > pdm_threshold_probability):
-                    for technicianID in random_technicianIDs:
-                        if (technicians[technicianID]['location'] == -1):
-                            repair_maintenance = 'maintenance'
-                            devices[deviceID]['issue'] = issue
-                            repair = service_deviceID(deviceID, issue, technicianID, devices, technicians, time, maintenance_duration, 
-                                repair_maintenance, debug)
-                            repairs += [repair]
-                            if (debug):
-                                print 'prevent MAINTENANCE:    time = ', time, 'deviceID = ', deviceID, '\tissue = ', issue, \
-                                    '\ttechnicianID = ', technicianID, '\trepair_complete_time = ', \
-                                    devices[deviceID]['repair_complete_time'], '\t****'
-                            break
+        y_col_prob = probs[issue]
+        if (random_order):
+            #pair at-risk operating devices with idle technicians, both in shuffled order
+            idx = (devices['state'][random_deviceIDs] == OPERATING) & (y_col_prob[random_deviceIDs] > pdm_threshold_probability)
+            at_risk_deviceIDs = random_deviceIDs[idx]
+            idle_technicianIDs = random_technicianIDs[technicians['location'][random_technicianIDs] == -1]
+        else:
+            #pair at-risk operating devices, in order of dispatch priority, with technicians from the idle pool
+            idx = (devices['state'] == OPERATING) & (y_col_prob > pdm_threshold_probability)
+            at_risk_deviceIDs = order_at_risk(dispatch, devices, devices['IDs'][idx], y_col_prob, issues[issue]['ID'])
+            idle_technicianIDs = technicians['idle']['members'][::-1]
+        for deviceID, technicianID in zip(at_risk_deviceIDs, idle_technicianIDs):
+            repair_maintenance = 'maintenance'
+            devices['issue'][deviceID] = issues[issue]['ID']
+            repair = service_deviceID(deviceID, issue, technicianID, devices, technicians, time, maintenance_duration, 
+                repair_maintenance, debug)
+            repairs += [repair]
+            if (debug):
+                print 'prevent MAINTENANCE:    time = ', time, 'deviceID = ', deviceID, '\tissue = ', issue, \
+                    '\ttechnicianID = ', technicianID, '\trepair_complete_time = ', \
+                    devices['repair_complete_time'][deviceID], '\t****'
     return repairs
 
 #when maintenance is complete, set device's sensors=0, set device's crud & issue damage=0, and release devices & technicians 
 def complete_maintenance(devices, issues, technicians, time, debug):
-    deviceIDs = devices['IDs']
-    for deviceID in deviceIDs:
-        if ((devices[deviceID]['state'] == 'repair') or (devices[deviceID]['state'] == 'maintenance')):
-            if (time > devices[deviceID]['repair_complete_time']):
-                devices['sensors']['values'][deviceID, :] = 0.0
-                issue = 'crud'
-                issueID = issues[issue]['ID']
-                devices['damage'][issueID, deviceID] = 0.0
-                issue = devices[deviceID]['issue']
-                issueID = issues[issue]['ID']
-                devices['damage'][issueID, deviceID] = 0.0
-                technicianID = devices[deviceID]['technicianID']
-                technicians[technicianID]['location'] = -1
-                devices[deviceID]['state'] = 'operating'
-                devices[deviceID]['issue'] = 'none'
-                devices[deviceID]['technicianID'] = -1
-                devices[deviceID]['fail_time'] = -1
-                devices[deviceID]['repair_start_time'] = -1
-                devices[deviceID]['repair_complete_time'] = -1
-                devices[deviceID][issue + '_repair_time'] = time
-                devices[deviceID]['production_rate_fail_time'] = 0.0
-                if (debug):
-                    print 'REPAIR  COMPLETE   :    time = ', time, 'deviceID = ', deviceID, '\ttechnicianID = ', technicianID
-    return
+    state = devices['state']
+    idx = ((state == REPAIR) | (state == MAINTENANCE)) & (time > devices['repair_complete_time'])
+    deviceIDs = devices['IDs'][idx]
+    release_devices(devices, issues, technicians, deviceIDs, time, debug)
+    return deviceIDs
 
-#generate sensor telemetry update output_times
-def generate_telemetry(devices, technicians, time, output_interval):
-    telemetrys = []
-    deviceIDs = devices['IDs']
-    sensorIDs = devices['sensors']['IDs']
-    sensor_names = devices['sensors']['names']
-    sensor_values = devices['sensors']['values']
-    sensor_output_times = devices['sensors']['output_times']
-    for sensorID in sensorIDs:
-        sensor_name = sensor_names[sensorID]
-        sensor_value = sensor_values[:, sensorID]
-        sensor_output_time = sensor_output_times[:, sensorID]
-        for deviceID in deviceIDs[time > sensor_output_time]:
-            #report deviceID's sensor value
-            telemetry = {'time':time, 'deviceID':deviceID, 'sensor':sensor_name, 'value':sensor_value[deviceID]}
-            telemetrys += [telemetry]
-            #report deviceID's production_rate
-            telemetry = {'time':time, 'deviceID':deviceID, 'sensor':'production_rate', 'value':devices[deviceID]['production_rate']}
-            telemetrys += [telemetry]
-            sensor_output_time[deviceID] = time + output_interval
-    #report number of technicians that are servicing devices
-    N_technicians = 0.0
-    technicianIDs = technicians['IDs']
+#reset the repaired deviceIDs' sensors and damage, and release those devices & their technicians
+def release_devices(devices, issues, technicians, deviceIDs, time, debug):
+    if (len(deviceIDs) == 0):
+        return
+    devices['sensors']['values'][deviceIDs, :] = 0.0
+    issueID = issues['crud']['ID']
+    devices['damage'][issueID, deviceIDs] = 0.0
+    issueIDs = devices['issue'][deviceIDs]
+    devices['damage'][issueIDs, deviceIDs] = 0.0
+    technicianIDs = devices['technicianID'][deviceIDs]
+    technicians['location'][technicianIDs] = -1
     for technicianID in technicianIDs:
-        if (technicians[technicianID]['location'] != -1):
-            N_technicians += 1.0
-    telemetrys += [{'time':time, 'deviceID':-1, 'sensor':'N_technicians', 'value':N_technicians}]
-    #report number of devices that are operating, failed, and repaired
-    N_operating = 0.0
-    N_failed = 0.0
-    N_repair = 0.0
-    N_maintenance = 0.0
-    for deviceID in deviceIDs:
-        if (devices[deviceID]['state'] == 'operating'):
-            N_operating += 1.0
-        if (devices[deviceID]['state'] == 'failed'):
-            N_failed += 1.0
-        if (devices[deviceID]['state'] == 'repair'):
-            N_repair += 1.0
-        if (devices[deviceID]['state'] == 'maintenance'):
-            N_maintenance += 1.0
-    telemetrys += [{'time':time, 'deviceID':-1, 'sensor':'N_operating', 'value':N_operating}]
-    telemetrys += [{'time':time, 'deviceID':-1, 'sensor':'N_failed', 'value':N_failed}]
-    telemetrys += [{'time':time, 'deviceID':-1, 'sensor':'N_repair', 'value':N_repair}]
-    telemetrys += [{'time':time, 'deviceID':-1, 'sensor':'N_maintenance', 'value':N_maintenance}]
-    return telemetrys
-
-#compute time until device experiences next issue
+        pool_add(technicians['idle'], technicianID)
+    devices['repair_time'][issueIDs, deviceIDs] = time
+    set_state(devices, deviceIDs, OPERATING)
+    devices['issue'][deviceIDs] = -1
+    devices['technicianID'][deviceIDs] = -1
+    devices['fail_time'][deviceIDs] = -1
+    devices['repair_start_time'][deviceIDs] = -1
+    devices['repair_complete_time'][deviceIDs] = -1
+    devices['production_rate_fail_time'][deviceIDs] = 0.0
+    if (debug):
+        for deviceID, technicianID in zip(deviceIDs, technicianIDs):
+            print 'REPAIR  COMPLETE   :    time = ', time, 'deviceID = ', deviceID, '\ttechnicianID = ', technicianID
+    return
+
+#schedule sensor outputs on a timing wheel. generate_telemetry reports a sensor when time > output_time
+#and then sets output_time = time + output_interval, so every sensor reports once per period of
+#output_interval + 1 timesteps, always in the same slot = time % period. Slot k of sensorID's wheel
+#holds the deviceIDs order[sensorID][starts[sensorID][k]:starts[sensorID][k+1]], in deviceID order,
+#whose first report is the one that is due at time or after
+def make_output_wheel(output_times, time, output_interval):
+    period = output_interval + 1
+    due_times = np.maximum(output_times + 1, time)
+    wheel = {'period':period, 'orders':[], 'starts':[]}
+    for sensorID in range(output_times.shape[1]):
+        slots = due_times[:, sensorID]%period
+        wheel['orders'] += [np.argsort(slots, kind='mergesort')]
+        wheel['starts'] += [np.append(0, np.cumsum(np.bincount(slots, minlength=period)))]
+    return wheel
+
+#append the sensor telemetry that is due at time, followed by the fleet counts, to telemetry_buffer in
+#one batch, and update the reporting sensors' output_times. Only the due sensors are visited, via the
+#timing wheel that is built when telemetry is first generated
+def generate_telemetry(devices, technicians, time, output_interval, telemetry_buffer):
+    sensors = devices['sensors']
+    if (sensors.get('wheel') is None):
+        sensors['wheel'] = make_output_wheel(sensors['output_times'], time, output_interval)
+    wheel = sensors['wheel']
+    slot = time%wheel['period']
+    batches = []
+    for sensorID in sensors['IDs']:
+        starts = wheel['starts'][sensorID]
+        reporting_deviceIDs = wheel['orders'][sensorID][starts[slot]:starts[slot + 1]]
+        batches += [sensor_telemetry_rows(devices, sensorID, reporting_deviceIDs, telemetry_buffer)]
+        sensors['output_times'][reporting_deviceIDs, sensorID] = time + output_interval
+    batches += [fleet_count_rows(devices, technicians, telemetry_buffer)]
+    rows = {'time':time}
+    for column in ['deviceID', 'sensor', 'value']:
+        rows[column] = np.concatenate([batch[column] for batch in batches])
+    append_rows(telemetry_buffer, rows)
+    return
+
+#get the telemetry rows of each reporting deviceID's sensor value followed by its production_rate
+def sensor_telemetry_rows(devices, sensorID, reporting_deviceIDs, telemetry_buffer):
+    N = len(reporting_deviceIDs)
+    sensor_name = devices['sensors']['names'][sensorID]
+    sensor_codes = telemetry_buffer['categories']['sensor']
+    codes = np.array([sensor_codes.index(sensor_name), sensor_codes.index('production_rate')])
+    values = np.empty((N, 2))
+    values[:, 0] = devices['sensors']['values'][reporting_deviceIDs, sensorID]
+    values[:, 1] = devices['production_rate'][reporting_deviceIDs]
+    return {'deviceID':np.repeat(reporting_deviceIDs, 2), 'sensor':np.tile(codes, N), 'value':values.ravel()}
+
+#append each reporting deviceID's sensor value followed by its production_rate to telemetry_buffer
+def append_sensor_telemetry(devices, sensorID, reporting_deviceIDs, time, telemetry_buffer):
+    if (len(reporting_deviceIDs) == 0):
+        return
+    rows = sensor_telemetry_rows(devices, sensorID, reporting_deviceIDs, telemetry_buffer)
+    rows['time'] = time
+    append_rows(telemetry_buffer, rows)
+    return
+
+#get the telemetry rows of the number of technicians that are servicing devices, and the number of
+#devices that are operating, failed, and repaired
+def fleet_count_rows(devices, technicians, telemetry_buffer):
+    sensor_codes = telemetry_buffer['categories']['sensor']
+    N_technicians = len(technicians['IDs']) - pool_size(technicians['idle'])
+    state_counts = devices['state_counts']
+    names = ['N_technicians'] + ['N_' + state_name for state_name in state_names]
+    codes = np.array([sensor_codes.index(name) for name in names])
+    values = np.append(N_technicians, state_counts).astype(float)
+    return {'deviceID':np.full(len(codes), -1), 'sensor':codes, 'value':values}
+
+#append number of technicians that are servicing devices, and number of devices that are operating, failed, and repaired
+def append_fleet_counts(devices, technicians, time, telemetry_buffer):
+    rows = fleet_count_rows(devices, technicians, telemetry_buffer)
+    rows['time'] = time
+    append_rows(telemetry_buffer, rows)
+    return
+
+#sort records by deviceID and time, with devices kept in order of first appearance, and
+#index each device's records 0,1,2...
+def sort_device_records(records):
+    device_codes = pd.factorize(records.deviceID)[0]
+    order = np.lexsort((records.time.values, device_codes))
+    df = records.iloc[order].copy()
+    device_codes = device_codes[order]
+    df.index = pd.Series(device_codes).groupby(device_codes).cumcount().values
+    return df, device_codes
+
+#compute time until device experiences next issue, as float64 time_til_<issue> columns that are nan when the
+#device has no later issue, where the per-device loops that this replaced returned objects with None
 def time_to_issue(records, issue_names):
-    df = records
-    df_list = []
-    deviceIDs = df.deviceID.unique()
-    for deviceID in deviceIDs:
-        df = records
-        df = df[df.deviceID == deviceID].copy().reset_index(drop=True).sort_values('time')
-        for issue in issue_names:
-            col = 'time_til_' + issue
-            df[col] = None
-            idx = (df.issue == issue)
-            issue_times = df[idx].time.sort_index(ascending=False)
-            if (len(issue_times) > 0):
-                for idx, issue_time in issue_times.iteritems():
-                    df.loc[0:idx, col] = issue_time
-                df[col] -= df.time
-                #df[col] = df[col].fillna(df[col].median().astype(int))
-        df_list += [df]
-    df = pd.concat(df_list)
-    #cols = [col for col in df.columns if (col.startswith('time_til_'))]
-    #for col in cols:
-    #    idx = df[col].isnull()
-    #    df.loc[idx, col] = df[~idx][col].max()
+    df, device_codes = sort_device_records(records)
+    times = df.time.values
+    for issue in issue_names:
+        #backfill each issue's time across the device's earlier records
+        issue_times = pd.Series(np.where(df.issue.values == issue, times, np.nan))
+        next_issue_times = issue_times.groupby(device_codes).bfill().values
+        df['time_til_' + issue] = next_issue_times - times
     return df
 
-#compute time since device's previous issue
+#compute time since device's previous issue, as float64 time_since_<issue> columns that are nan when the
+#device has no earlier issue, where the per-device loops that this replaced returned objects with None
 def time_since_issue(records, issue_names):
-    df = records
-    df_list = []
-    deviceIDs = df.deviceID.unique()
-    for deviceID in deviceIDs:
-        df = records
-        df = df[df.deviceID == deviceID].copy().reset_index(drop=True).sort_values('time')
-        for issue in issue_names:
-            col = 'time_since_' + issue
-            df[col] = None
-            idx = (df.issue == issue)
-            issue_times = df[idx].time.sort_index(ascending=True)
-            if (len(issue_times) > 0):
-                for idx, issue_time in issue_times.iteritems():
-                    df.loc[idx:, col] = -issue_time
-                df[col] += df.time
-                #df[col] = df[col].fillna(df[col].median().astype(int))
-        df_list += [df]
-    df = pd.concat(df_list)
-    #cols = [col for col in df.columns if (col.startswith('time_since_'))]
-    #for col in cols:
-    #    idx = df[col].isnull()
-    #    df.loc[idx, col] = df[~idx][col].max()
+    df, device_codes = sort_device_records(records)
+    times = df.time.values
+    for issue in issue_names:
+        #forward-fill each issue's time across the device's later records
+        issue_times = pd.Series(np.where(df.issue.values == issue, times, np.nan))
+        previous_issue_times = issue_times.groupby(device_codes).ffill().values
+        df['time_since_' + issue] = times - previous_issue_times
+    return df
+
+#read the telemetry or repairs written by pdm.py, either a parquet dataset or a csv file that is gzipped,
+#zstd-compressed, or uncompressed
+def read_output_file(file, cols, time_range):
+    if (file.endswith('.parquet')):
+        df = read_parquet(file, cols, time_range)
+        for col in ['sensor', 'issue']:
+            if (col in df.columns):
+                df[col] = df[col].astype(str)
+    else:
+        df = pd.read_csv(open_csv_output(file), header=None, sep='|', compression='infer', names=cols)
+        if (time_range is not None):
+            time_min, time_max = time_range
+            df = df[(df.time >= time_min) & (df.time <= time_max)].reset_index(drop=True)
+    return df
+
+#read device repairs logs and add time_bucket column
+def read_repairs(repairs_file, time_bucket_size, time_range):
+    cols = ['time', 'deviceID', 'issue', 'technicianID', 'temperature', 'pressure', 'load', 'production_rate']
+    df = read_output_file(repairs_file, cols, time_range)
+    df['time_bucket'] = (df.time/time_bucket_size).astype(int)
+    sensor_names = ['temperature', 'pressure', 'load']
+    cols = ['time_bucket', 'deviceID', 'technicianID', 'issue', 'production_rate'] + sensor_names
+    df = df[cols]
+    cols = {sensor_name:sensor_name + '_fail' for sensor_name in sensor_names}
+    cols['production_rate'] = 'production_rate_fail'
+    df = df.rename(columns=cols)
+    return df
+
+#merge bucketed telemetry and repairs
+def merge_telemetry_repairs(telemetry_pivot, repairs):
+    df = telemetry_pivot.merge(repairs, on=['time_bucket', 'deviceID'], how='left', sort=True).reset_index(drop=True)
     return df
 
-#prep rtf data for models
-def prep_rtf_data(time_bucket_size, issues, telemetry_file, repairs_file):
+#flag records without repairs, and compute time to next issue and time since previous issue
+def label_records(telemetry_repairs, issues):
+    df = telemetry_repairs
+    df.issue = df.issue.astype(str)
+    df.loc[df.issue == 'nan', 'issue'] = 'none'
+    df.loc[df.technicianID.isna(), 'technicianID'] = -1.0
+    df.technicianID = df.technicianID.astype(int)
+    telemetry_repairs = df
+    
+    #get issue_names with crud dropped
+    issue_names = issues.keys()
+    issue_names.remove('crud')
+    print 'issue_names = ', issue_names
+    
+    #compute time for each device to hit next issue
+    print 'computing time to next issue...'
+    records_time = time_to_issue(telemetry_repairs, issue_names)
+    
+    #compute time since each device's previous issue
+    print 'computing time since previous issue...'
+    records = time_since_issue(records_time, issue_names)
+    return records
+
+#prep rtf data for models, using only the data within time_range=(time_min, time_max) when provided
+def prep_rtf_data(time_bucket_size, issues, telemetry_file, repairs_file, time_range=None):
     
     #read device telemetry and add time_bucket column
     print 'reading ' + telemetry_file + ' ...'
-    df = pd.read_csv(telemetry_file, header=None, sep='|', compression='gzip', \
-        names=['time', 'deviceID', 'sensor', 'value'])
+    cols = ['time', 'deviceID', 'sensor', 'value']
+    df = read_output_file(telemetry_file, cols, time_range)
     df['time_bucket'] = (df.time/time_bucket_size).astype(int)
     telemetry = df
     
@@ -326,38 +561,106 @@ def prep_rtf_data(time_bucket_size, issues, telemetry_file, repairs_file):
     
     #read device repairs logs
     print 'reading ' + repairs_file + ' ...'
-    df = pd.read_csv(repairs_file, header=None, sep='|', compression='gzip', \
-        names=['time', 'deviceID', 'issue', 'technicianID', 'temperature', 'pressure', 'load', 'production_rate'])
-    df['time_bucket'] = (df.time/time_bucket_size).astype(int)
-    sensor_names = ['temperature', 'pressure', 'load']
-    cols = ['time_bucket', 'deviceID', 'technicianID', 'issue', 'production_rate'] + sensor_names
-    df = df[cols]
-    cols = {sensor_name:sensor_name + '_fail' for sensor_name in sensor_names}
-    cols['production_rate'] = 'production_rate_fail'
-    df = df.rename(columns=cols)
-    repairs = df
+    repairs = read_repairs(repairs_file, time_bucket_size, time_range)
     
     #merge telemetry and repairs
     print 'merging telemetry and repairs...'
-    df = telemetry_pivot.merge(repairs, on=['time_bucket', 'deviceID'], how='left', sort=True).reset_index(drop=True)
-    df.issue = df.issue.astype(str)
-    df.loc[df.issue == 'nan', 'issue'] = 'none'
-    df.loc[df.technicianID.isna(), 'technicianID'] = -1.0
-    df.technicianID = df.technicianID.astype(int)
-    telemetry_repairs = df
+    telemetry_repairs = merge_telemetry_repairs(telemetry_pivot, repairs)
     
-    #get issue_names with crud dropped
-    issue_names = issues.keys()
-    issue_names.remove('crud')
-    print 'issue_names = ', issue_names
+    #compute time to next issue and time since previous issue
+    records = label_records(telemetry_repairs, issues)
     
-    #compute time for each device to hit next issue, takes a minute...
-    print 'computing time to next issue...'
-    records_time = time_to_issue(telemetry_repairs, issue_names)
+    #done
+    return telemetry, repairs, records
+
+#iterate over telemetry in time order, in chunks of at most chunk_rows rows
+def iterate_telemetry(telemetry_file, chunk_rows, time_range):
+    cols = ['time', 'deviceID', 'sensor', 'value']
+    if (telemetry_file.endswith('.parquet')):
+        #a parquet partition's files are not stored in time order, so each partition is sorted after it is read
+        for df in iterate_parquet_partitions(telemetry_file, cols, time_range):
+            df = df.sort_values('time', kind='mergesort')
+            df['sensor'] = df.sensor.astype(str)
+            for start in range(0, len(df), chunk_rows):
+                yield df.iloc[start:start + chunk_rows]
+    else:
+        for df in pd.read_csv(open_csv_output(telemetry_file), header=None, sep='|', compression='infer', names=cols,
+                chunksize=chunk_rows):
+            if (time_range is not None):
+                time_min, time_max = time_range
+                df = df[(df.time >= time_min) & (df.time <= time_max)]
+            yield df
+
+#convert closed buckets' partial sums & counts to the bucket-averaged telemetry that prep_rtf_data gets from pivot_table
+def close_buckets(partials, time_bucket_size, sensor_names):
+    df = partials.copy()
+    df['value'] = df['sum']/df['count']
+    df = df.set_index(['deviceID', 'time_bucket', 'sensor'])['value'].unstack('sensor').reset_index()
+    for sensor_name in sensor_names:
+        if (sensor_name not in df.columns):
+            df[sensor_name] = np.nan
+    df['time'] = df.time_bucket*time_bucket_size
+    df.columns.name = None
+    cols = ['deviceID', 'time_bucket', 'time'] + sensor_names
+    return df[cols]
+
+#streaming version of prep_rtf_data that reads telemetry in chunks sized to fit within memory_budget (MB),
+#keeping only the partial sums & counts of each open (deviceID, time_bucket) and merging in the repairs
+#as buckets close. The returned telemetry is the bucket-averaged telemetry, since the raw telemetry
+#is never held in memory all at once.
+def prep_rtf_data_streaming(time_bucket_size, issues, telemetry_file, repairs_file, time_range=None, memory_budget=256):
+    import time as tm
     
-    #compute time for each device to hit next issue, takes a minute...
-    print 'computing time since previous issue...'
-    records = time_since_issue(records_time, issue_names)
+    #roughly 200 bytes per telemetry row once read by pandas and grouped
+    chunk_rows = max(int(memory_budget*(1024**2)/200), 1000)
+    sensor_names = ['load', 'pressure', 'temperature', 'production_rate']
+    print 'chunk_rows = ', chunk_rows
+    
+    #read device repairs logs, which are small
+    print 'reading ' + repairs_file + ' ...'
+    repairs = read_repairs(repairs_file, time_bucket_size, time_range)
+    
+    #accumulate each (deviceID, time_bucket, sensor)'s partial sum and count, and close all buckets
+    #that are earlier than the latest bucket seen so far
+    print 'streaming ' + telemetry_file + ' ...'
+    clock_start = tm.time()
+    N_read = 0
+    open_partials = None
+    telemetry_pieces = []
+    records_pieces = []
+    cols = ['deviceID', 'time_bucket', 'sensor']
+    for df in iterate_telemetry(telemetry_file, chunk_rows, time_range):
+        N_read += len(df)
+        df = df[(df.deviceID > -1) & df.sensor.isin(sensor_names)]
+        if (len(df) == 0):
+            continue
+        df = df.assign(time_bucket=(df.time.values/time_bucket_size).astype(int))
+        partials = df.groupby(cols)['value'].agg(['sum', 'count']).reset_index()
+        if (open_partials is not None):
+            partials = pd.concat([open_partials, partials]).groupby(cols)[['sum', 'count']].sum().reset_index()
+        last_bucket = partials.time_bucket.max()
+        idx = (partials.time_bucket < last_bucket)
+        open_partials = partials[~idx]
+        if (idx.any()):
+            telemetry_pivot = close_buckets(partials[idx], time_bucket_size, sensor_names)
+            telemetry_pieces += [telemetry_pivot]
+            idx = (repairs.time_bucket >= telemetry_pivot.time_bucket.min()) & (repairs.time_bucket < last_bucket)
+            records_pieces += [merge_telemetry_repairs(telemetry_pivot, repairs[idx])]
+        rate = N_read/max(tm.time() - clock_start, 1.0e-6)
+        print '    rows read = ', N_read, '\trows/sec = ', int(rate), '\tbuckets closed through = ', last_bucket - 1
+    
+    #close the last bucket
+    if (open_partials is not None) and (len(open_partials) > 0):
+        telemetry_pivot = close_buckets(open_partials, time_bucket_size, sensor_names)
+        telemetry_pieces += [telemetry_pivot]
+        idx = (repairs.time_bucket >= telemetry_pivot.time_bucket.min())
+        records_pieces += [merge_telemetry_repairs(telemetry_pivot, repairs[idx])]
+    telemetry = pd.concat(telemetry_pieces).reset_index(drop=True)
+    telemetry_repairs = pd.concat(records_pieces).reset_index(drop=True)
+    print 'streamed rows = ', N_read, '\texecution time (sec) = ', tm.time() - clock_start
+    
+    #compute time to next issue and time since previous issue
+    records = label_records(telemetry_repairs, issues)
     
     #done
     return telemetry, repairs, records
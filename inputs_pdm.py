@@ -48,10 +48,120 @@ maintenance_duration = repair_duration/4
 #random number seed
 rn_seed = 17 + 1
 
-#issue data
+#issue data. Each issue's damage per timestep is its damage expression over the sensors x, y, z and
+#the derived rho, r, phi, theta, and is zero wherever its gate condition is false, see damage.py
 issues = {
-    'crud':         {'ID':0, 'coefficient':0.100000,   'fatal':False},
-    'jammed_rotor': {'ID':1, 'coefficient':0.000080,   'fatal':True },
-    'cracked_valve':{'ID':2, 'coefficient':0.000010,   'fatal':True },
-    'broken_gear':  {'ID':3, 'coefficient':0.000002,   'fatal':True },
+    'crud':         {'ID':0, 'coefficient':0.100000,   'fatal':False, 'damage':'coefficient*r'},
+    'jammed_rotor': {'ID':1, 'coefficient':0.000080,   'fatal':True,  'damage':'coefficient*x**2',  'gate':'x >= 0'},
+    'cracked_valve':{'ID':2, 'coefficient':0.000010,   'fatal':True,  'damage':'coefficient*y**2',  'gate':'y >= 0'},
+    'broken_gear':  {'ID':3, 'coefficient':0.000002,   'fatal':True,  'damage':'coefficient*rho*z', 'gate':'z >= 0'},
 }
+
+#number of telemetry or repairs rows held in memory before they are spilled to disk
+buffer_size = 1000000
+
+#output file format = csv or parquet, with parquet output partitioned into partition_size timesteps
+output_format = 'csv'
+partition_size = 5000
+
+#pdm model inference = flat (flattened forests that only score operating devices) or sklearn,
+#with flat inference walking the trees on pdm_threads threads, or mmap (flat inference on the forests'
+#artifact in model_folder, which is memory-mapped so that concurrent runs share one copy of the forests)
+pdm_inference = 'flat'
+pdm_threads = 1
+
+#folder that strategy=pdm loads the <issue>_in_<pdm_threshold_time>_model.pkl models from, eg the
+#models/version_<k>/n_estimators=<n>/ folder that train_models.py writes
+model_folder = './'
+
+#order in which technicians are dispatched = random (reproduces earlier runs), oldest (oldest failure first),
+#or priority (largest lost production first, and highest predicted risk first for pdm maintenance)
+dispatch_policy = 'random'
+
+#simulation kernel = step (visits every device every timestep) or event (schedules repairs and
+#sensor outputs on heaps and samples failures via cumulative hazard, statistically equivalent to step)
+#or batch (advances the fleet up to batch_size timesteps at a time between events, identical to
+#step but requires rng='counter')
+kernel = 'step'
+batch_size = 100
+
+#number of worker processes that the fleet is sharded across, with the shards sharing technicians
+#every shard_sync timesteps, see shards.py for how sharded results relate to N_shards=1 runs
+N_shards = 1
+shard_sync = 1
+
+#folder that the repairs, telemetry, and summary outputs are written to
+output_folder = 'data/'
+
+#random numbers are drawn from = global (the np.random stream seeded by rn_seed, reproduces earlier runs)
+#or counter (independent per-device streams that don't depend on fleet size or sharding), with
+#counter streams pregenerating about rng_block_size draws at a time
+rng = 'global'
+rng_block_size = 1000000
+
+#checkpoint the simulation to output_folder every checkpoint_interval timesteps and when done, or
+#never when 0, with an interrupted run continued via 'python pdm.py <inputs> --resume'.
+#warm_start = path to an earlier run's checkpoint, eg 'data/checkpoint_rtf.pkl', that this run
+#continues from with its own strategy and seed, or None to start from zeroed sensors and damage
+checkpoint_interval = 0
+warm_start = None
+
+#instrument=True times each phase of the simulation loop and prints a table of those times when done,
+#progress_interval > 0 prints a progress line every progress_interval timesteps, and
+#profile_file = path that a cProfile of the run is written to, eg 'data/pdm.prof', or None
+instrument = False
+progress_interval = 0
+profile_file = None
+
+#output_mode = rows (telemetry rows for every sensor output, plus the repairs log) or aggregates
+#(no telemetry, just the repairs log and the fleet's production, devices per state, technician
+#utilization, and failures, repairs, and maintenances per issue, rolled up every aggregate_window timesteps)
+output_mode = 'rows'
+aggregate_window = 100
+
+#output_writer = serial (the outputs are written after the simulation is done) or background (a
+#writer process compresses and writes each buffer's worth of rows while the simulation produces the
+#next, with at most writer_queue_size buffers waiting to be written). csv outputs are compressed with
+#output_codec = gzip (.csv.gz), zstd (.csv.zst, needs the zstandard package), or none (.csv), at
+#compression level output_level, while parquet outputs use output_codec but not output_level
+output_writer = 'serial'
+output_codec = 'gzip'
+output_level = 9
+writer_queue_size = 4
+
+#stream_address = None, or host:port or the path of a unix socket that the telemetry and repairs are
+#published to as they are generated, as newline-delimited json records or stream_format = binary frames.
+#Each subscriber queues at most stream_queue_size batches of rows, with stream_policy = drop (a slow
+#subscriber misses batches) or block (the simulation waits for slow subscribers). stream_rate > 0 paces
+#the simulation to publish at most stream_rate rows per second, and the simulation starts once
+#stream_subscribers subscribers have connected
+stream_address = None
+stream_format = 'json'
+stream_rate = 0
+stream_queue_size = 1000
+stream_policy = 'drop'
+stream_subscribers = 0
+
+#damage_engine = numpy evaluates the issues' damage laws with a compiled kernel of in-place numpy ufuncs,
+#or numexpr with the optional numexpr package
+damage_engine = 'numpy'
+
+#pdm_scoring = full rescores every device at every pdm check, or adaptive rescores only the devices
+#that are due, with each device's next rescore coming sooner the nearer its risk is to
+#pdm_threshold_probability and the faster its risk and sensors drift, scaled by pdm_rescore_safety and
+#pdm_drift_limit, and at most pdm_max_skip_time timesteps later. Forests with few trees move their
+#risk in coarse jumps, so they get fewer skipped scorings. pdm_scoring_audit = True also rescores
+#every device to count the at-risk decisions that differ from full rescoring, see scoring.py
+pdm_scoring = 'full'
+pdm_max_skip_time = 50
+pdm_rescore_safety = 0.25
+pdm_drift_limit = 0.1
+pdm_scoring_audit = False
+
+#training_rows = True also labels the models' training records as the run proceeds, averaging every
+#device's telemetry over time_bucket_size timesteps and writing the labeled records to
+#output_folder/training_<strategy>.csv.gz for train_models.py's training_file, with the time_til_<issue>
+#labels that exceed training_horizon timesteps left nan, see labeling.py. Requires N_shards = 1
+training_rows = False
+time_bucket_size = 20
+training_horizon = 1000
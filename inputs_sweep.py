@@ -0,0 +1,23 @@
+#inputs_sweep.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#input parameters for sweep.py
+
+#inputs file whose parameters are used by every run, except those being swept
+base_inputs_path = 'inputs_pdm.py'
+
+#values of the swept parameters, the sweep executes every combination of these values
+sweep_parameters = {
+    'N_technicians':[50, 100, 150],
+    'pdm_threshold_probability':[0.5, 0.75],
+    'pdm_skip_time':[5, 10],
+    'rn_seed':[1, 2, 3],
+}
+
+#folder that the runs are stored in, one subfolder per run, along with the results.csv table
+sweep_folder = 'simulations/sweep/'
+
+#number of runs executed at a time
+N_processes = 4
@@ -0,0 +1,38 @@
+#inputs_train.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#input parameters for train_models.py
+
+#inputs file whose issues and rn_seed are used
+base_inputs_path = 'inputs_pdm.py'
+
+#telemetry and repairs of the rtf run that the models are trained on, bucketed into time_bucket_size timesteps
+telemetry_file = 'data/telemetry_rtf.csv.gz'
+repairs_file = 'data/repairs_rtf.csv.gz'
+time_bucket_size = 20
+
+#folder that the prepared rtf data is cached in, holding at most prep_cache_size MB, or None to
+#prepare the rtf data every time
+prep_cache_folder = 'data/prep_cache/'
+prep_cache_size = 10240
+
+#the records that an rtf run with training_rows=True labeled as it ran, which are used instead of preparing
+#telemetry_file and repairs_file when set. Their time_til_<issue> labels are only known up to that run's
+#training_horizon, which must be at least the largest of pdm_threshold_times
+#training_file = 'data/training_rtf.csv.gz'
+
+#every fatal issue's model is trained for each of these pdm_threshold_times and forest sizes
+pdm_threshold_times = [400]
+n_estimators_grid = [51]
+
+#fraction of the records that are held out to compute the models' test metrics
+test_size = 0.33
+
+#folder that each execution writes its version_<k>/ of the models into
+model_folder = 'models/'
+
+#number of models fit at a time, and the cores that each fit builds its trees on
+N_processes = 4
+n_jobs = 1
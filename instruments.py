@@ -0,0 +1,149 @@
+#instruments.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#instrumentation of the simulation loop. When instrument=True the wall time spent in each phase of
+#simulate_timestep (and in the batch kernel's blocks) is accumulated, and a table of those phases is
+#printed when the run is done. When progress_interval > 0 a progress line reporting the timesteps
+#and telemetry rows simulated per second and the buffers' memory is printed every progress_interval
+#timesteps. When both are off sim['instruments'] is None, and the loop only pays for one
+#comparison per phase.
+
+
+#imports
+import time as tm
+import numpy as np
+from buffers import buffer_length
+
+#get the run's instruments, or None when instrumentation is off
+def initialize_instruments(params):
+    if (params['instrument'] == False) and (params['progress_interval'] <= 0):
+        return None
+    instruments = {'clock_start':tm.time(), 'N_timesteps':0, 'progress_interval':params['progress_interval'],
+        'phase_times':None}
+    if (params['instrument']):
+        instruments['phase_times'] = {}
+    return instruments
+
+#get sim's phase_times dict, which is None when phases aren't timed
+def phase_times(sim):
+    instruments = sim['instruments']
+    if (instruments is None):
+        return None
+    return instruments['phase_times']
+
+#start timing phases, returning the clock that lap() measures the first phase from
+def start_lap(phase_times):
+    if (phase_times is None):
+        return None
+    return tm.time()
+
+#add the time since clock to phase's time, and return the clock that the next phase is measured from
+def lap(phase_times, phase, clock):
+    if (phase_times is None):
+        return None
+    now = tm.time()
+    phase_times[phase] = phase_times.get(phase, 0.0) + (now - clock)
+    return now
+
+#bytes of buffer's rows, those held in memory and those spilled to disk, and bytes allocated in memory
+def buffer_bytes(buffer):
+    row_bytes = sum([np.dtype(dtype).itemsize for column, dtype in buffer['columns']])
+    allocated = sum([array.nbytes for array in buffer['arrays'].values()])
+    return buffer['N_rows']*row_bytes, buffer['N_spilled']*row_bytes, allocated
+
+#count the timesteps from time to time_next that were just simulated, and print a progress line
+#whenever a multiple of progress_interval timesteps has been passed
+def report_progress(sim, time, time_next):
+    instruments = sim['instruments']
+    if (instruments is None):
+        return
+    instruments['N_timesteps'] += time_next - time
+    progress_interval = instruments['progress_interval']
+    if (progress_interval <= 0) or (time_next//progress_interval == time//progress_interval):
+        return
+    params = sim['params']
+    elapsed = max(tm.time() - instruments['clock_start'], 1.0e-9)
+    N_done = time_next - sim['time_start']
+    telemetry_buffer = sim['telemetry_buffer']
+    N_telemetry = telemetry_buffer['N_spilled'] + telemetry_buffer['N_rows']
+    in_memory = 0
+    spilled = 0
+    for buffer in [sim['telemetry_buffer'], sim['repairs_buffer']]:
+        memory_bytes, spilled_bytes, allocated = buffer_bytes(buffer)
+        in_memory += memory_bytes
+        spilled += spilled_bytes
+    print 'time = ', time_next, '(' + str(int(100*N_done/params['N_timesteps'])) + '%)', \
+        '\telapsed (min) = ', round(elapsed/60.0, 2), \
+        '\ttimesteps/sec = ', round(instruments['N_timesteps']/elapsed, 1), \
+        '\ttelemetry rows/sec = ', int(N_telemetry/elapsed), \
+        '\tbuffers (MB) = ', round(in_memory/1024.0**2, 1), 'in memory', round(spilled/1024.0**2, 1), 'spilled'
+    return
+
+#print the table of time spent per phase, the telemetry rows emitted per second, and the buffers'
+#memory, preceded by title
+def print_instruments(sim, title=''):
+    instruments = sim['instruments']
+    if (instruments is None):
+        return
+    elapsed = max(tm.time() - instruments['clock_start'], 1.0e-9)
+    N_timesteps = max(instruments['N_timesteps'], 1)
+    phase_times = instruments['phase_times']
+    if (phase_times is not None):
+        total = max(sum(phase_times.values()), 1.0e-9)
+        print title + 'phase                    time (sec)   fraction   usec/timestep'
+        for phase in sorted(phase_times.keys(), key=lambda phase: -phase_times[phase]):
+            print title + '%-24s %10.3f %10.3f %15.1f' % (phase, phase_times[phase], phase_times[phase]/total,
+                1.0e6*phase_times[phase]/N_timesteps)
+        print title + '%-24s %10.3f %10.3f %15.1f' % ('total', total, 1.0, 1.0e6*total/N_timesteps)
+    for kind in ['telemetry_buffer', 'repairs_buffer']:
+        buffer = sim[kind]
+        memory_bytes, spilled_bytes, allocated = buffer_bytes(buffer)
+        print title + kind + ' rows = ', buffer['N_spilled'] + buffer['N_rows'], \
+            '\trows/sec = ', int((buffer['N_spilled'] + buffer['N_rows'])/elapsed), \
+            '\tin memory (MB) = ', round(memory_bytes/1024.0**2, 2), \
+            '\tallocated (MB) = ', round(allocated/1024.0**2, 2), \
+            '\tspilled (MB) = ', round(spilled_bytes/1024.0**2, 2)
+    return
+
+#peak resident memory of this process in MB, noting that linux reports ru_maxrss in KB
+def peak_memory():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024.0
+
+#resident memory of this process in MB, and the part of it that is file-backed pages, such as those of
+#shared libraries and memory-mapped forest artifacts, which every process mapping the same files shares.
+#These are read from /proc/self/status on linux, and are nan elsewhere
+def resident_memory():
+    memory = {'VmRSS:':np.nan, 'RssFile:':np.nan}
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                fields = line.split()
+                if (len(fields) > 1) and (fields[0] in memory):
+                    memory[fields[0]] = int(fields[1])/1024.0
+    except IOError:
+        pass
+    return memory['VmRSS:'], memory['RssFile:']
+
+#write the run's instruments to output_folder/instruments_<strategy>.json, ie the time spent per
+#phase, the timesteps simulated, the rows emitted, the time spent simulating and writing outputs,
+#and peak and resident memory
+def write_instruments(sim, simulation_time, write_time):
+    import json
+    instruments = sim['instruments']
+    if (instruments is None):
+        return
+    params = sim['params']
+    metrics = {'N_devices':params['N_devices'], 'N_technicians':params['N_technicians'],
+        'N_timesteps':instruments['N_timesteps'], 'phase_times':instruments['phase_times'],
+        'simulation_time':simulation_time, 'write_time':write_time,
+        'telemetry_rows':buffer_length(sim['telemetry_buffer']), 'repairs_rows':buffer_length(sim['repairs_buffer']),
+        'peak_memory_MB':peak_memory()}
+    metrics['resident_memory_MB'], metrics['file_backed_memory_MB'] = resident_memory()
+    file = params['output_folder'] + 'instruments_' + params['strategy'] + '.json'
+    with open(file, 'w') as output:
+        json.dump(metrics, output, indent=4, sort_keys=True)
+    print file + ' written, peak memory (MB) = ', metrics['peak_memory_MB']
+    return metrics
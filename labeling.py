@@ -0,0 +1,255 @@
+#labeling.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#online labeling of the models' training records, used by pdm.py when training_rows=True. Rather than
+#having prep_rtf_data re-read the run's telemetry and repairs, pivot the telemetry into time buckets,
+#merge in the repairs, and back-fill the time_til_<issue> labels after the run, the labeler watches the
+#rows appended to the telemetry and repairs buffers while the run proceeds. It averages every device's
+#sensor readings over the current time bucket, and when that bucket closes it appends each device's
+#record, with its time_since_<issue> features, to the device's ring buffer of records awaiting labels.
+#A repair of an issue labels that device's buffered records with their time until that issue. A record
+#leaves the ring once all of its labels are known, or once it is training_horizon timesteps old, when
+#any label that is still unknown exceeds the horizon and is left nan, and finished records are appended
+#to the training buffer that is written to output_folder/training_<strategy>.csv.gz. read_training_rows()
+#reads them back as the records dataframe that prep_rtf_data returns. Those records agree with
+#prep_rtf_data's up to the rounding of telemetry values in the csv, except that time_til_<issue> is nan
+#rather than its value when that exceeds training_horizon, so models trained for a pdm_threshold_time
+#<= training_horizon see the same labels.
+
+
+#imports
+import numpy as np
+from buffers import make_buffer, append_rows
+
+#the bucket-averaged features, and the repairs' sensor readings that are merged into a record as <name>_fail
+feature_names = ['load', 'pressure', 'temperature', 'production_rate']
+fail_names = ['production_rate', 'temperature', 'pressure', 'load']
+
+#the issues that records are labeled with, which are all but crud in issues order as in label_records
+def label_issue_names(issues):
+    return [issue for issue in issues.keys() if (issue != 'crud')]
+
+#columns of the training records, in the order of prep_rtf_data's records
+def training_columns(issues):
+    issue_names = label_issue_names(issues)
+    columns = [('deviceID', np.int32), ('time_bucket', np.int32), ('time', np.int32)] + \
+        [(name, np.float64) for name in feature_names] + [('technicianID', np.int32), ('issue', np.int16)] + \
+        [(name + '_fail', np.float64) for name in fail_names] + \
+        [('time_til_' + issue, np.float64) for issue in issue_names] + \
+        [('time_since_' + issue, np.float64) for issue in issue_names]
+    return columns
+
+#get the labeler of N_devices devices whose telemetry uses sensor_codes, with its training buffer
+#spilling to spill_prefix + 'training_<strategy>.spill', or None when training_rows is off
+def initialize_labeler(params, N_devices, issue_names, sensor_codes, spill_prefix):
+    if (params['training_rows'] == False):
+        return None
+    if (params['output_mode'] != 'rows'):
+        raise ValueError("training_rows requires output_mode = 'rows'")
+    issues = params['issues']
+    label_issues = label_issue_names(issues)
+    columns = training_columns(issues)
+    bucket_size = params['time_bucket_size']
+    horizon = params['training_horizon']
+    #each record is held as a row of floats whose fields are the training columns other than deviceID
+    fields = [column for column, dtype in columns[1:]]
+    capacity = horizon//bucket_size + 2
+    labeler = {'bucket_size':bucket_size, 'horizon':horizon, 'bucket':None, 'fields':fields,
+        'sums':np.zeros((N_devices, len(feature_names))), 'counts':np.zeros((N_devices, len(feature_names)), dtype=int),
+        'repairs':[], 'last_issue_time':np.full((len(label_issues), N_devices), np.nan),
+        'records':np.full((N_devices, capacity, len(fields)), np.nan), 'head':np.zeros(N_devices, dtype=int),
+        'length':np.zeros(N_devices, dtype=int), 'N_records':0}
+    #telemetry sensor codes' feature columns, and issue codes' label rows, or -1
+    labeler['feature_index'] = np.array([feature_names.index(name) if (name in feature_names) else -1
+        for name in sensor_codes])
+    labeler['label_index'] = np.array([label_issues.index(name) if (name in label_issues) else -1
+        for name in issue_names + ['none']])
+    labeler['none_code'] = len(issue_names)
+    labeler['til'] = [fields.index('time_til_' + issue) for issue in label_issues]
+    labeler['since'] = [fields.index('time_since_' + issue) for issue in label_issues]
+    categories = {'issue':list(issue_names) + ['none']}
+    labeler['buffer'] = make_buffer(columns, params['buffer_size'], spill_prefix + 'training_' + params['strategy'] + '.spill',
+        categories)
+    return labeler
+
+#label the rows appended to sim's telemetry and repairs buffers as they are appended
+def attach_labeler(sim):
+    labeler = sim['labeler']
+    if (labeler is None):
+        return
+    sim['telemetry_buffer']['on_append'] += [lambda buffer, rows, N: add_telemetry(labeler, rows, N)]
+    sim['repairs_buffer']['on_append'] += [lambda buffer, rows, N: add_repairs(labeler, rows, N)]
+    return
+
+#get rows[column] as an array of N values
+def row_values(rows, column, N):
+    return np.broadcast_to(rows[column], (N,))
+
+#add N telemetry rows, which are in time order, to their devices' open buckets
+def add_telemetry(labeler, rows, N):
+    deviceIDs = row_values(rows, 'deviceID', N)
+    features = labeler['feature_index'][row_values(rows, 'sensor', N)]
+    keep = (deviceIDs > -1) & (features > -1)
+    if (keep.any() == False):
+        return
+    deviceIDs = deviceIDs[keep]
+    features = features[keep]
+    values = row_values(rows, 'value', N)[keep]
+    buckets = row_values(rows, 'time', N)[keep]//labeler['bucket_size']
+    #split the rows at bucket boundaries, which only the batch kernel's blocks of timesteps cross
+    starts = np.flatnonzero(np.diff(buckets)) + 1
+    sums = labeler['sums']
+    cells = deviceIDs*sums.shape[1] + features
+    for start, stop in zip(np.append(0, starts), np.append(starts, len(buckets))):
+        advance_bucket(labeler, buckets[start])
+        sums += np.bincount(cells[start:stop], weights=values[start:stop], minlength=sums.size).reshape(sums.shape)
+        labeler['counts'] += np.bincount(cells[start:stop], minlength=sums.size).reshape(sums.shape)
+    return
+
+#add N repairs rows to their bucket's repairs, which are merged into their devices' records
+def add_repairs(labeler, rows, N):
+    for idx in range(N):
+        row = {column:row_values(rows, column, N)[idx] for column in rows.keys()}
+        advance_bucket(labeler, row['time']//labeler['bucket_size'])
+        labeler['repairs'] += [row]
+    return
+
+#close the open bucket when rows of a later bucket arrive
+def advance_bucket(labeler, bucket):
+    if (labeler['bucket'] is None):
+        labeler['bucket'] = bucket
+    elif (bucket > labeler['bucket']):
+        close_bucket(labeler)
+        labeler['bucket'] = bucket
+    return
+
+#close the open bucket: every device having telemetry in it gets one record, or one per repair when it
+#was repaired, those records are buffered, the device's earlier records are labeled with their time
+#until the repaired issues, and records that are finished are appended to the training buffer
+def close_bucket(labeler):
+    fields = labeler['fields']
+    bucket = labeler['bucket']
+    time = bucket*labeler['bucket_size']
+    counts = labeler['counts']
+    deviceIDs = np.flatnonzero(counts.sum(axis=1) > 0)
+    repairs = {}
+    for repair in labeler['repairs']:
+        repairs.setdefault(int(repair['deviceID']), []).append(repair)
+    #records of the devices that weren't repaired, with the repairs of devices without telemetry dropped
+    #as in merge_telemetry_repairs
+    records = np.full((len(deviceIDs), len(fields)), np.nan)
+    records[:, fields.index('time_bucket')] = bucket
+    records[:, fields.index('time')] = time
+    with np.errstate(divide='ignore', invalid='ignore'):
+        records[:, [fields.index(name) for name in feature_names]] = labeler['sums'][deviceIDs]/counts[deviceIDs]
+    records[:, fields.index('technicianID')] = -1
+    records[:, fields.index('issue')] = labeler['none_code']
+    records[:, labeler['since']] = (time - labeler['last_issue_time'][:, deviceIDs]).T
+    repaired = np.array([(deviceID in repairs) for deviceID in deviceIDs], dtype=bool)
+    push_records(labeler, deviceIDs[~repaired], records[~repaired])
+    #records of repaired devices, one per repair in the order they were logged, with each repair
+    #starting its issue's time_since and ending its time_til, as label_records' fills do
+    for deviceID, record in zip(deviceIDs[repaired], records[repaired]):
+        for repair in repairs[deviceID]:
+            record = record.copy()
+            record[fields.index('technicianID')] = repair['technicianID']
+            record[fields.index('issue')] = repair['issue']
+            for name in fail_names:
+                record[fields.index(name + '_fail')] = repair[name]
+            label = labeler['label_index'][repair['issue']]
+            if (label > -1):
+                labeler['last_issue_time'][label, deviceID] = time
+            record[labeler['since']] = time - labeler['last_issue_time'][:, deviceID]
+            push_records(labeler, np.array([deviceID]), record[np.newaxis])
+            if (label > -1):
+                label_records(labeler, deviceID, label, time)
+    pop_records(labeler, time)
+    labeler['sums'][:] = 0.0
+    counts[:] = 0
+    labeler['repairs'] = []
+    return
+
+#append records to the rings of deviceIDs, which are distinct, doubling every ring's capacity first
+#when any of those rings is full
+def push_records(labeler, deviceIDs, records):
+    capacity = labeler['records'].shape[1]
+    if (labeler['length'][deviceIDs] == capacity).any():
+        grow_rings(labeler)
+        capacity = labeler['records'].shape[1]
+    slots = (labeler['head'][deviceIDs] + labeler['length'][deviceIDs])%capacity
+    labeler['records'][deviceIDs, slots] = records
+    labeler['length'][deviceIDs] += 1
+    return
+
+#double the capacity of the devices' rings, which is only needed when a device is repaired more often
+#than every time_bucket_size timesteps
+def grow_rings(labeler):
+    N_devices, capacity, N_fields = labeler['records'].shape
+    records = np.full((N_devices, 2*capacity, N_fields), np.nan)
+    slots = (labeler['head'][:, np.newaxis] + np.arange(capacity))%capacity
+    records[:, :capacity] = labeler['records'][np.arange(N_devices)[:, np.newaxis], slots]
+    labeler['records'] = records
+    labeler['head'][:] = 0
+    return
+
+#label deviceID's buffered records that don't yet know their time until the label issue, which
+#happened at time
+def label_records(labeler, deviceID, label, time):
+    capacity = labeler['records'].shape[1]
+    slots = (labeler['head'][deviceID] + np.arange(labeler['length'][deviceID]))%capacity
+    records = labeler['records'][deviceID]
+    til = labeler['til'][label]
+    unknown = slots[np.isnan(records[slots, til])]
+    records[unknown, til] = time - records[unknown, labeler['fields'].index('time')]
+    return
+
+#append the devices' oldest records to the training buffer while they are finished, ie all their labels
+#are known or they are at least horizon timesteps older than time, or all records when time is None
+def pop_records(labeler, time):
+    time_column = labeler['fields'].index('time')
+    while True:
+        deviceIDs = np.flatnonzero(labeler['length'] > 0)
+        heads = labeler['records'][deviceIDs, labeler['head'][deviceIDs]]
+        if (time is not None):
+            finished = ~np.isnan(heads[:, labeler['til']]).any(axis=1) | (time - heads[:, time_column] >= labeler['horizon'])
+            deviceIDs = deviceIDs[finished]
+        if (len(deviceIDs) == 0):
+            return
+        emit_heads(labeler, deviceIDs)
+
+#append the oldest records of deviceIDs to the training buffer, and drop them from their rings
+def emit_heads(labeler, deviceIDs):
+    capacity = labeler['records'].shape[1]
+    records = labeler['records'][deviceIDs, labeler['head'][deviceIDs]]
+    rows = {'deviceID':deviceIDs}
+    for idx, (column, dtype) in enumerate(labeler['buffer']['columns'][1:]):
+        rows[column] = records[:, idx]
+    append_rows(labeler['buffer'], rows)
+    labeler['head'][deviceIDs] = (labeler['head'][deviceIDs] + 1)%capacity
+    labeler['length'][deviceIDs] -= 1
+    labeler['N_records'] += len(deviceIDs)
+    return
+
+#close the last bucket and append every buffered record to the training buffer, with labels that are
+#still unknown left nan since those issues didn't recur before the run ended
+def finish_labeler(labeler):
+    if (labeler is None):
+        return
+    if (labeler['bucket'] is not None):
+        close_bucket(labeler)
+        labeler['bucket'] = None
+    pop_records(labeler, None)
+    print 'training records = ', labeler['N_records']
+    return
+
+#read the training records that a training_rows=True run wrote to training_file as the records dataframe
+#that prep_rtf_data returns, sorted by device and time
+def read_training_rows(training_file, issues):
+    from helper_fns import read_output_file
+    columns = [column for column, dtype in training_columns(issues)]
+    df = read_output_file(training_file, columns, None)
+    df['issue'] = df.issue.astype(str)
+    df = df.sort_values(['deviceID', 'time'], kind='mergesort').reset_index(drop=True)
+    return df
@@ -7,10 +7,12 @@
 #this executes the pdm demo
 
 
-#get commandline argument
+#get commandline arguments, with --resume continuing the run from its last checkpoint
+import sys
+resume = ('--resume' in sys.argv[1:])
+arguments = [argument for argument in sys.argv[1:] if (argument != '--resume')]
 try:
-    import sys
-    inputs_path = sys.argv[1]
+    inputs_path = arguments[0]
 except:
     inputs_path = 'inputs_rtf.py'
 
@@ -20,6 +22,47 @@ clock_start = tm.time()
 
 #read input parameters
 import numpy as np
+#default values of optional input parameters
+buffer_size = 1000000
+output_format = 'csv'
+partition_size = 5000
+pdm_inference = 'flat'
+pdm_threads = 1
+dispatch_policy = 'random'
+kernel = 'step'
+N_shards = 1
+shard_sync = 1
+output_folder = 'data/'
+rng = 'global'
+rng_block_size = 1000000
+batch_size = 100
+checkpoint_interval = 0
+warm_start = None
+instrument = False
+progress_interval = 0
+profile_file = None
+output_mode = 'rows'
+aggregate_window = 100
+output_writer = 'serial'
+output_codec = 'gzip'
+output_level = 9
+writer_queue_size = 4
+stream_address = None
+stream_format = 'json'
+stream_rate = 0
+stream_queue_size = 1000
+stream_policy = 'drop'
+stream_subscribers = 0
+model_folder = './'
+damage_engine = 'numpy'
+pdm_scoring = 'full'
+pdm_max_skip_time = 50
+pdm_rescore_safety = 0.25
+pdm_drift_limit = 0.1
+pdm_scoring_audit = False
+training_rows = False
+time_bucket_size = 20
+training_horizon = 1000
 execfile(inputs_path)
 print 'inputs_path = ', inputs_path
 print 'debug = ', debug
@@ -37,115 +80,159 @@ print 'repair_duration = ', repair_duration
 print 'maintenance_duration = ', maintenance_duration
 print 'rn_seed = ', rn_seed
 print 'issues = ', issues
+print 'buffer_size = ', buffer_size
+print 'output_format = ', output_format
+print 'partition_size = ', partition_size
+print 'pdm_inference = ', pdm_inference
+print 'pdm_threads = ', pdm_threads
+print 'dispatch_policy = ', dispatch_policy
+print 'kernel = ', kernel
+print 'N_shards = ', N_shards
+print 'shard_sync = ', shard_sync
+print 'output_folder = ', output_folder
+print 'rng = ', rng
+print 'rng_block_size = ', rng_block_size
+print 'batch_size = ', batch_size
+print 'checkpoint_interval = ', checkpoint_interval
+print 'warm_start = ', warm_start
+print 'resume = ', resume
+print 'instrument = ', instrument
+print 'progress_interval = ', progress_interval
+print 'profile_file = ', profile_file
+print 'output_mode = ', output_mode
+print 'aggregate_window = ', aggregate_window
+print 'output_writer = ', output_writer
+print 'output_codec = ', output_codec
+print 'output_level = ', output_level
+print 'writer_queue_size = ', writer_queue_size
+print 'stream_address = ', stream_address
+print 'stream_format = ', stream_format
+print 'stream_rate = ', stream_rate
+print 'stream_queue_size = ', stream_queue_size
+print 'stream_policy = ', stream_policy
+print 'stream_subscribers = ', stream_subscribers
+print 'model_folder = ', model_folder
+print 'damage_engine = ', damage_engine
+print 'pdm_scoring = ', pdm_scoring
+print 'pdm_max_skip_time = ', pdm_max_skip_time
+print 'pdm_rescore_safety = ', pdm_rescore_safety
+print 'pdm_drift_limit = ', pdm_drift_limit
+print 'pdm_scoring_audit = ', pdm_scoring_audit
+print 'training_rows = ', training_rows
+print 'time_bucket_size = ', time_bucket_size
+print 'training_horizon = ', training_horizon
+
+#collect the input parameters
+param_names = ['debug', 'N_devices', 'sensor_sigma', 'N_timesteps', 'time_start', 'output_interval', 'strategy',
+    'pdm_threshold_time', 'pdm_threshold_probability', 'pdm_skip_time', 'N_technicians', 'repair_duration',
+    'maintenance_duration', 'rn_seed', 'issues', 'buffer_size', 'output_format', 'partition_size', 'pdm_inference',
+    'pdm_threads', 'dispatch_policy', 'kernel', 'N_shards', 'shard_sync', 'output_folder', 'rng', 'rng_block_size',
+    'batch_size', 'checkpoint_interval', 'warm_start', 'instrument', 'progress_interval', 'profile_file',
+    'output_mode', 'aggregate_window', 'output_writer', 'output_codec', 'output_level', 'writer_queue_size',
+    'stream_address', 'stream_format', 'stream_rate', 'stream_queue_size', 'stream_policy', 'stream_subscribers',
+    'model_folder', 'damage_engine', 'pdm_scoring', 'pdm_max_skip_time', 'pdm_rescore_safety', 'pdm_drift_limit',
+    'pdm_scoring_audit', 'training_rows', 'time_bucket_size', 'training_horizon']
+params = {name:globals()[name] for name in param_names}
 
 #imports
 print 'setting up...'
-import numpy as np
-import pandas as pd
-
-#initialize values of each sensor on each device
-names = ['temperature', 'pressure', 'load']
-N_sensors = len(names)
-IDs = np.arange(N_sensors)
-values = np.zeros((N_devices, N_sensors))
-sensors = {'names':names, 'IDs':IDs, 'values':values}
-#initialize time of each sensor's next output
-np.random.seed(rn_seed)
-output_times = np.random.uniform(low=0, high=output_interval, size=values.shape).astype(int)
-sensors['output_times'] = output_times
-
-#initialize devices
-IDs = np.arange(N_devices)
-devices = {'IDs':IDs}
-devices['sensors'] = sensors
-for deviceID in devices['IDs']:
-    d = {'state':'operating', 'issue':'none', 'technicianID':-1, 'fail_time':-1, 'repair_start_time':-1, 'repair_complete_time':-1, 
-            'production_rate':0.0, 'production_rate_fail_time':0.0}
-    for issue in issues.keys():
-        if (issues[issue]['fatal'] == True):
-            d[issue + '_repair_time'] = time_start - 1
-    devices[deviceID] = d
-#initialize damage due to issues
-N_issues = len(issues)
-damage = np.zeros((N_issues, N_devices))
-devices['damage'] = damage
-
-#initialize technicians
-IDs = np.arange(N_technicians)
-technicians = {'IDs':IDs}
-for ID in IDs:
-    technicians[ID] = {'location':-1}
+import os
+from simulation import *
+from checkpoints import *
+from labeling import attach_labeler, finish_labeler
+if (N_shards > 1) and ((checkpoint_interval > 0) or resume or (warm_start is not None)):
+    raise ValueError('checkpoints, --resume, and warm_start require N_shards = 1')
+if (N_shards > 1) and (stream_address is not None):
+    raise ValueError('streaming to stream_address requires N_shards = 1')
+if (N_shards > 1) and (training_rows):
+    raise ValueError('training_rows requires N_shards = 1')
 
-#load pdm models as needed
-models = {}
-if (strategy == 'pdm'):
-    fatal_issues = [issue_name for issue_name, d in issues.iteritems() if (d['fatal'] == True)]
-    #model_folder = '/u01/bdcsce/tmp/'
-    model_folder = './'
-    for issue in fatal_issues:
-        y_col = issue + '_in_' + str(pdm_threshold_time)
-        model_file = model_folder + y_col + '_model.pkl'
-        print 'loading ' + model_file
-        with open(model_file, 'rb') as file:
-            import pickle as pkl
-            models[y_col] = pkl.load(file)
+#profile the simulation and the writing of its outputs with cProfile when profile_file is set
+if (profile_file is not None):
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
 
-#loop over all times
-repair_data = []
-telemetry_data= []
-from helper_fns import *
-times = range(time_start, time_start + N_timesteps)
-print 'operating devices...'
-for time in times:
-    
-    #update operating devices' sensors
-    update_sensors(devices, sensor_sigma)
+if (N_shards > 1):
+    #simulate the fleet in N_shards worker processes
+    from shards import run_shards
+    print 'operating devices...'
+    writer = start_writer(params)
+    repairs_buffer, telemetry_buffer, summary, aggregates = run_shards(params, N_shards, shard_sync, writer)
+    training_buffer = None
+else:
+    #initialize devices' sensors, states, and damage due to issues, the technicians and the queue of
+    #devices waiting for service, the pdm models, the telemetry and repairs buffers which spill to
+    #output_folder when full, and the event-driven kernel's hazards and scheduled events. Or restore
+    #all that from the run's last checkpoint when resuming, or copy the fleet from warm_start's checkpoint
+    path = checkpoint_path(params)
+    if (resume) and (os.path.exists(path)):
+        sim, time = resume_simulation(params, path)
+        print 'resuming from ' + path + ' at time = ', time
+    else:
+        if (resume):
+            print path + ' does not exist, starting from time_start'
+        sim = initialize_simulation(params, N_devices, rn_seed, output_folder)
+        if (warm_start is not None):
+            print 'warm starting from ' + warm_start
+            warm_start_simulation(sim, warm_start)
+        time = sim['time_start']
     
-    #update damage due to issues
-    crud_damage = update_damage(devices, issues)
+    #stream the buffers to their output files as they spill, when output_writer='background'
+    writer = start_writer(params)
+    for kind in ['repairs', 'telemetry']:
+        attach_writer(writer, sim[kind + '_buffer'], output_file(params, kind))
     
-    #update devices' production_rate
-    compute_production(devices, issues, crud_damage)
+    #label the models' training records as the telemetry and repairs are generated, when training_rows=True
+    attach_labeler(sim)
+    if (sim['labeler'] is not None):
+        attach_writer(writer, sim['labeler']['buffer'], output_file(params, 'training'))
     
-    #perform predictive maintenance if desired
-    if (strategy == 'pdm'):
-        if (time%pdm_skip_time == 0):
-            repair_data += pdm_check(devices, issues, time, technicians, models, maintenance_duration, 
-                pdm_threshold_time, pdm_threshold_probability, debug)
+    #report the time and memory that starting up took
+    resident, file_backed = resident_memory()
+    print 'startup time (sec) = ', round(tm.time() - clock_start, 3), '\tresident memory (MB) = ', round(resident, 1), \
+        '\tof which file-backed (MB) = ', round(file_backed, 1)
     
-    #flag any failed devices
-    check_devices(devices, issues, time, debug)
+    #publish the telemetry and repairs to subscribers as they are generated, when stream_address is set
+    sim['stream'] = open_stream(params, sim)
     
-    #send first available technicians to repair failed deviceIDs
-    repair_data += service_failed_devices(devices, technicians, time, repair_duration, debug)
+    #loop over all times, checkpointing every checkpoint_interval timesteps
+    print 'operating devices...'
+    clock_simulate = tm.time()
+    simulate_with_checkpoints(sim, time, sim['time_start'] + N_timesteps, checkpoint_interval, path)
+    simulation_time = tm.time() - clock_simulate
+    close_stream(sim['stream'])
+    finish_labeler(sim['labeler'])
+    training_buffer = None
+    if (sim['labeler'] is not None):
+        training_buffer = sim['labeler']['buffer']
+    repairs_buffer = sim['repairs_buffer']
+    telemetry_buffer = sim['telemetry_buffer']
+    summary = sim['summary']
+    aggregates = sim['aggregates']
+    print_instruments(sim)
 
-    #release devices and technicians when maintenance is complete
-    complete_maintenance(devices, issues, technicians, time, debug)
-    
-    #generate sensor and telemetry update output_times
-    telemetry_data += generate_telemetry(devices, technicians, time, output_interval)
-    
-    #increment time
-    time += 1
+#write repairs log and telemetry and any training records, one chunk at a time, and the aggregates
+clock_write = tm.time()
+write_output_buffers(params, repairs_buffer, telemetry_buffer, writer, training_buffer=training_buffer)
+if (aggregates is not None):
+    write_aggregates(params, aggregates)
+if (instrument):
+    write_time = tm.time() - clock_write
+    print 'write_output_buffers time (sec) = ', write_time
+    if (N_shards == 1):
+        write_instruments(sim, simulation_time, write_time)
 
-#convert repairs log to dataframe
-import os
-if (len(repair_data) > 0):
-    cols = ['time', 'deviceID', 'issue', 'technicianID'] + names + ['production_rate']
-    repairs = pd.DataFrame(data=repair_data)[cols]
-    print 'repairs.shape = ', repairs.shape
-    file = 'data/repairs_' + strategy + '.csv.gz'
-    repairs.to_csv(file, header=False, index=False, sep='|', compression='gzip')
-    print file + ' size (KB) = ', os.path.getsize(file)/(1024)
+#write the profile, and print its most expensive functions
+if (profile_file is not None):
+    import pstats
+    profiler.disable()
+    profiler.dump_stats(profile_file)
+    print 'profile written to ' + profile_file
+    pstats.Stats(profile_file).sort_stats('cumulative').print_stats(20)
 
-#convert telemetry to dataframe
-if (len(telemetry_data) > 0):
-    cols = ['time', 'deviceID', 'sensor', 'value']
-    telemetry = pd.DataFrame(data=telemetry_data)[cols]
-    print 'telemetry.shape = ', telemetry.shape
-    file = 'data/telemetry_' + strategy + '.csv.gz'
-    telemetry.to_csv(file, header=False, index=False, sep='|', compression='gzip')
-    print file + ' size (MB) = ', os.path.getsize(file)/(1024**2)
+#write the run's summary metrics
+write_summary(params, summary, tm.time() - clock_start)
 
 #done
 print 'execution time (min) = ', (tm.time() - clock_start)/60.0
@@ -0,0 +1,177 @@
+#prep_cache.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#a cache of prep_rtf_data's telemetry, repairs, and records dataframes, so that preparing the same
+#rtf run again is a matter of reading them back rather than parsing, pivoting, merging, and labeling
+#the telemetry. Entries are keyed by a hash of the telemetry and repairs files' contents together with
+#time_bucket_size, the issues, and time_range, and each entry stores every dataframe column as a .npy
+#file that is memory-mapped when read, with string columns stored as integer codes. The files' hashes
+#are remembered along with their sizes and modification times, so an unchanged file is only hashed
+#once. When the cache grows past cache_size MB the least recently used entries are evicted, and
+#invalidate_prep_cache() drops the entries of given files or the whole cache.
+
+
+#imports
+import os
+import json
+import shutil
+import hashlib
+import time as tm
+import numpy as np
+import pandas as pd
+
+#version of the cache's layout, which is part of every key so that a layout change misses old entries
+cache_version = 1
+
+#prep_rtf_data(), but reading its dataframes from cache_folder when the same inputs were prepared
+#before, with streaming=True preparing them with prep_rtf_data_streaming() within memory_budget MB
+def cached_prep_rtf_data(time_bucket_size, issues, telemetry_file, repairs_file, time_range=None,
+        cache_folder='data/prep_cache/', cache_size=10240, streaming=False, memory_budget=256):
+    index = read_cache_index(cache_folder)
+    inputs = [os.path.abspath(telemetry_file), os.path.abspath(repairs_file)]
+    description = {'cache_version':cache_version, 'streaming':streaming, 'time_bucket_size':time_bucket_size,
+        'issues':issues, 'time_range':time_range, 'files':[file_hash(index, file) for file in inputs]}
+    key = hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+    entry_folder = os.path.join(cache_folder, key)
+    if (key in index['entries']) and (os.path.exists(entry_folder)):
+        print 'reading prepared rtf data from ' + entry_folder + ' ...'
+        frames = [read_frame(os.path.join(entry_folder, name)) for name in ['telemetry', 'repairs', 'records']]
+        index['entries'][key]['last_used'] = tm.time()
+        write_cache_index(cache_folder, index)
+        return frames[0], frames[1], frames[2]
+    from helper_fns import prep_rtf_data, prep_rtf_data_streaming
+    if (streaming):
+        frames = prep_rtf_data_streaming(time_bucket_size, issues, telemetry_file, repairs_file, time_range=time_range,
+            memory_budget=memory_budget)
+    else:
+        frames = prep_rtf_data(time_bucket_size, issues, telemetry_file, repairs_file, time_range=time_range)
+    #write the entry to a temporary folder that is then renamed, so an interrupted write leaves no entry
+    temporary_folder = entry_folder + '.tmp'
+    if (os.path.exists(temporary_folder)):
+        shutil.rmtree(temporary_folder)
+    for name, df in zip(['telemetry', 'repairs', 'records'], frames):
+        write_frame(df, os.path.join(temporary_folder, name))
+    if (os.path.exists(entry_folder)):
+        shutil.rmtree(entry_folder)
+    os.rename(temporary_folder, entry_folder)
+    index['entries'][key] = {'inputs':inputs, 'bytes':folder_bytes(entry_folder), 'last_used':tm.time()}
+    print 'prepared rtf data cached in ' + entry_folder
+    evict_entries(cache_folder, index, cache_size, keep=key)
+    write_cache_index(cache_folder, index)
+    return frames
+
+#read cache_folder's index of entries and file hashes, or an empty index
+def read_cache_index(cache_folder):
+    index_file = os.path.join(cache_folder, 'index.json')
+    if (os.path.exists(index_file) == False):
+        return {'entries':{}, 'file_hashes':{}}
+    with open(index_file, 'r') as file:
+        return json.load(file)
+
+#write cache_folder's index
+def write_cache_index(cache_folder, index):
+    if (os.path.exists(cache_folder) == False):
+        os.makedirs(cache_folder)
+    index_file = os.path.join(cache_folder, 'index.json')
+    with open(index_file + '.tmp', 'w') as file:
+        json.dump(index, file, indent=4, sort_keys=True)
+    os.rename(index_file + '.tmp', index_file)
+    return
+
+#get the files of path, which is a file or a parquet dataset's folder, sorted by name
+def input_files(path):
+    if (os.path.isdir(path) == False):
+        return [path]
+    return sorted([os.path.join(folder, name) for folder, subfolders, names in os.walk(path) for name in names])
+
+#get the sha1 hash of path's contents, reusing the hash in index when path's size and modification
+#time are unchanged
+def file_hash(index, path):
+    files = input_files(path)
+    stats = [[file, os.path.getsize(file), os.path.getmtime(file)] for file in files]
+    known = index['file_hashes'].get(path)
+    if (known is not None) and (known['stats'] == stats):
+        return known['hash']
+    sha1 = hashlib.sha1()
+    for file in files:
+        sha1.update(os.path.relpath(file, path))
+        with open(file, 'rb') as input:
+            for block in iter(lambda: input.read(1024**2), ''):
+                sha1.update(block)
+    index['file_hashes'][path] = {'stats':stats, 'hash':sha1.hexdigest()}
+    return sha1.hexdigest()
+
+#total bytes of the files in folder
+def folder_bytes(folder):
+    return sum([os.path.getsize(file) for file in input_files(folder)])
+
+#write dataframe df to folder, one .npy file per column plus the index, with string columns stored
+#as codes whose names are recorded in frame.json
+def write_frame(df, folder):
+    os.makedirs(folder)
+    frame = {'columns':[], 'names':{}}
+    arrays = [('index', df.index.values)] + [(column, df[column].values) for column in df.columns]
+    for number, (column, values) in enumerate(arrays):
+        if (values.dtype == object):
+            codes, names = pd.factorize(values)
+            values = codes.astype(np.int32)
+            frame['names'][str(number)] = list(names)
+        np.save(os.path.join(folder, str(number) + '.npy'), values)
+        frame['columns'] += [column]
+    with open(os.path.join(folder, 'frame.json'), 'w') as file:
+        json.dump(frame, file)
+    return
+
+#read the dataframe that write_frame() wrote to folder, with each column memory-mapped
+def read_frame(folder):
+    with open(os.path.join(folder, 'frame.json'), 'r') as file:
+        frame = json.load(file)
+    arrays = []
+    for number, column in enumerate(frame['columns']):
+        values = np.load(os.path.join(folder, str(number) + '.npy'), mmap_mode='r')
+        names = frame['names'].get(str(number))
+        if (names is not None):
+            #code -1 marks a missing value, which picks the nan appended to names
+            values = np.array([str(name) for name in names] + [np.nan], dtype=object)[values]
+        arrays += [values]
+    columns = [str(column) for column in frame['columns'][1:]]
+    return pd.DataFrame(dict(zip(columns, arrays[1:])), index=arrays[0], columns=columns)
+
+#evict the least recently used entries, other than keep, until the cache holds at most cache_size MB
+def evict_entries(cache_folder, index, cache_size, keep=None):
+    entries = index['entries']
+    total = sum([entry['bytes'] for entry in entries.values()])
+    for key in sorted(entries.keys(), key=lambda key: entries[key]['last_used']):
+        if (total <= cache_size*1024**2):
+            break
+        if (key == keep):
+            continue
+        total -= entries[key]['bytes']
+        remove_entry(cache_folder, index, key)
+    return
+
+#remove the entry whose key is key from the cache
+def remove_entry(cache_folder, index, key):
+    entry_folder = os.path.join(cache_folder, key)
+    if (os.path.exists(entry_folder)):
+        shutil.rmtree(entry_folder)
+    del index['entries'][key]
+    print 'removed ' + entry_folder
+    return
+
+#remove the cached entries that were prepared from any of files, or every entry when files is None
+def invalidate_prep_cache(cache_folder='data/prep_cache/', files=None):
+    index = read_cache_index(cache_folder)
+    paths = None
+    if (files is not None):
+        paths = [os.path.abspath(file) for file in files]
+    for key, entry in index['entries'].items():
+        if (paths is None) or (len(set(paths) & set(entry['inputs'])) > 0):
+            remove_entry(cache_folder, index, key)
+    for path in index['file_hashes'].keys():
+        if (paths is None) or (path in paths):
+            del index['file_hashes'][path]
+    write_cache_index(cache_folder, index)
+    return
@@ -0,0 +1,97 @@
+#scoring.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#the adaptive scheduler of pdm_check's risk scoring, used when pdm_scoring='adaptive'. Rather than
+#rescoring the whole fleet every pdm_skip_time timesteps, each device's last predicted probability of
+#suffering each fatal issue is cached along with the sensor values it was scored on, and the device is
+#given its own next rescore time. That time is later when the device's risk is far below
+#pdm_threshold_probability and has been changing slowly, and sooner when its risk is near the threshold
+#or its sensors have drifted quickly since its previous scoring: the rescore interval is the smallest of
+#    pdm_rescore_safety*(pdm_threshold_probability - risk)/(risk's rate of change),
+#    pdm_rescore_safety*(pdm_threshold_probability - risk)*N_trees*pdm_skip_time,
+#    pdm_drift_limit/(sensors' rate of drift), and
+#    pdm_max_skip_time,
+#rounded down to a multiple of pdm_skip_time. The second bound is there because a forest of N_trees
+#trees moves its probability in jumps of up to 1/N_trees, so a risk that hasn't moved yet says little
+#about when it next will. A device is also rescored as soon as it returns from a
+#repair or maintenance, which resets its features. Every pdm check only scores the operating devices
+#that are due, and uses the cached probabilities of the others. The run's summary counts the device
+#scorings done, and those saved relative to rescoring every operating device, and only with
+#pdm_scoring_audit=True does every pdm check also score the whole fleet and count the at-risk decisions
+#that differ from full rescoring, so the accuracy cost can be checked.
+
+
+#imports
+import numpy as np
+
+#pdm scoring modes
+pdm_scorings = ['full', 'adaptive']
+
+#initialize the scheduler's state for N_devices devices having N_sensors sensors, with every device due
+#at time, or get None when the run's pdm checks rescore the whole fleet
+def initialize_scoring(params, N_devices, N_sensors, time):
+    if (params['pdm_scoring'] not in pdm_scorings):
+        raise ValueError('pdm_scoring = ' + str(params['pdm_scoring']) + ' is not one of ' + str(pdm_scorings))
+    if (params['strategy'] != 'pdm') or (params['pdm_scoring'] == 'full'):
+        return None
+    N_fatal = len([issue for issue in params['issues'].keys() if (params['issues'][issue]['fatal'] == True)])
+    scoring = {'probs':np.zeros((N_fatal, N_devices)), 'values':np.zeros((N_devices, N_sensors)), 'risk_rate':np.zeros(N_devices),
+        'score_time':np.zeros(N_devices, dtype=int) + (time - 1), 'rescore_time':np.zeros(N_devices, dtype=int) + time,
+        'skip_time':params['pdm_skip_time'], 'max_skip_time':max(params['pdm_max_skip_time'], params['pdm_skip_time']),
+        'safety':params['pdm_rescore_safety'], 'drift_limit':params['pdm_drift_limit'],
+        'threshold':params['pdm_threshold_probability'], 'audit':params['pdm_scoring_audit']}
+    return scoring
+
+#get the operating deviceIDs that are due to be rescored at time, which are those whose rescore time
+#has come and those that were repaired or maintained since they were last scored
+def due_deviceIDs(scoring, deviceIDs, operating, repair_time, time):
+    reset = (repair_time.max(axis=0) >= scoring['score_time'])
+    due = operating & ((scoring['rescore_time'] <= time) | reset)
+    return deviceIDs[due]
+
+#cache the probs (N_fatal, len(deviceIDs)) predicted at time for deviceIDs having sensor_values,
+#and schedule those devices' next rescore, where N_trees holds the number of trees in each fatal
+#issue's forest
+def schedule_rescores(scoring, deviceIDs, probs, sensor_values, repair_time, time, N_trees):
+    skip_time = scoring['skip_time']
+    elapsed = (time - scoring['score_time'][deviceIDs]).astype(float)
+    #devices scored before without a repair since have a history that their rates are measured over
+    history = (repair_time[:, deviceIDs].max(axis=0) < scoring['score_time'][deviceIDs])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        risk_rate = np.abs(probs - scoring['probs'][:, deviceIDs]).max(axis=0)/elapsed
+        #the forests' probabilities change in steps, so the risk's rate is the larger of its latest rate
+        #and half its previous rate
+        risk_rate[history == False] = 0.0
+        risk_rate = np.maximum(risk_rate, 0.5*scoring['risk_rate'][deviceIDs])
+        drift_rate = np.sqrt(((sensor_values - scoring['values'][deviceIDs])**2).sum(axis=1))/elapsed
+        margin = scoring['threshold'] - probs.max(axis=0)
+        interval = np.minimum(scoring['safety']*margin/risk_rate, scoring['drift_limit']/drift_rate)
+    interval[np.isnan(interval)] = np.inf
+    interval = np.minimum(interval, scoring['max_skip_time'])
+    #a risk that hasn't moved yet has a near-zero rate, but a forest's probability jumps by up to one tree's
+    #vote when a tree's leaf changes, so the interval is also at most safety*skip_time per vote of margin
+    #that the device has left, and is skip_time when that is under one skip_time
+    votes = ((scoring['threshold'] - probs)*np.array(N_trees)[:, np.newaxis]).min(axis=0)
+    interval = np.minimum(interval, np.floor(scoring['safety']*votes)*skip_time)
+    interval[(history == False) | (margin <= 0.0)] = skip_time
+    interval = np.maximum((interval//skip_time)*skip_time, skip_time).astype(int)
+    scoring['probs'][:, deviceIDs] = probs
+    scoring['values'][deviceIDs] = sensor_values
+    scoring['risk_rate'][deviceIDs] = risk_rate
+    scoring['score_time'][deviceIDs] = time
+    scoring['rescore_time'][deviceIDs] = time + interval
+    return
+
+#count into summary the device scorings done and saved at a pdm check, and, when auditing, the devices
+#that full rescoring flags as at risk but the cached probs don't (missed) and vice versa (added)
+def count_scorings(summary, N_scored, N_full, probs=None, full_probs=None, operating=None, threshold=None):
+    summary['N_scored'] += N_scored
+    summary['N_scores_saved'] += N_full - N_scored
+    if (full_probs is not None):
+        at_risk = operating & (probs > threshold)
+        full_at_risk = operating & (full_probs > threshold)
+        summary['N_decisions_missed'] += int((full_at_risk & ~at_risk).sum())
+        summary['N_decisions_added'] += int((at_risk & ~full_at_risk).sum())
+    return
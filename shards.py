@@ -0,0 +1,224 @@
+#shards.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#sharded simulation, used by pdm.py when N_shards > 1. The fleet's deviceIDs are split into N_shards
+#contiguous slices, and each slice is simulated by a worker process that owns that slice's sensor,
+#damage, and state arrays. Technicians are shared by all shards: every shard_sync timesteps the
+#coordinator collects every shard's idle technicians and hands them out again, first to the shards
+#whose failed devices are waiting for service and then to all shards in proportion to their number
+#of devices. A technician stays with its shard while it is busy. When the run is done, the shards'
+#outputs are merged into the same repairs and telemetry files that pdm.py writes.
+#
+#How a sharded run relates to the single-process run having the same rn_seed:
+#    - run_shards with N_shards=1 reproduces the single-process output exactly.
+#    - with N_shards > 1, shard 0 is seeded with rn_seed and shard k with [rn_seed, k], so each
+#      shard draws its own random numbers and the run is a different realization of the same
+#      simulation. Results are not identical to the single-process run, but agree statistically.
+#      A sharded run is reproducible for the same rn_seed, N_shards, and shard_sync.
+#    - with rng='counter' every device draws from its own streams keyed by its fleet-wide deviceID,
+#      so each device sees the same random numbers however the fleet is sharded, and devices'
+#      trajectories agree exactly with the single-process run for as long as technicians are
+#      dispatched to them at the same times.
+#    - an idle technician can only be dispatched within the shard that holds it until the next
+#      sync, so when technicians are scarce a failed device can wait up to shard_sync timesteps
+#      longer than it would in the single-process run. shard_sync=1 minimizes that difference and
+#      larger shard_sync trades it for less coordination.
+#    - deviceIDs in the merged output are global, with shard k's device j being device
+#      bounds[k] + j, and the fleet counts are summed over shards. debug output printed by the
+#      workers shows shard-local deviceIDs.
+
+
+#imports
+import numpy as np
+from simulation import *
+
+#the random number seed of shard
+def shard_seed(rn_seed, shard):
+    if (shard == 0):
+        return rn_seed
+    return [rn_seed, shard]
+
+#prefix of shard's spill files
+def shard_spill_prefix(params, shard):
+    return params['output_folder'] + 'shard' + str(shard) + '_'
+
+#add technicianIDs to the technicians that shard owns
+def grant_technicians(technicians, technicianIDs):
+    technicians['location'][technicianIDs] = -1
+    for technicianID in technicianIDs:
+        pool_add(technicians['idle'], technicianID)
+    technicians['IDs'] = np.union1d(technicians['IDs'], technicianIDs).astype(int)
+    return
+
+#remove shard's idle technicians, whose location is set to -2 so that they can't be dispatched,
+#and return their technicianIDs in pool order
+def release_idle_technicians(technicians):
+    technicianIDs = list(technicians['idle']['members'])
+    for technicianID in technicianIDs:
+        pool_remove(technicians['idle'], technicianID)
+    technicians['location'][technicianIDs] = -2
+    technicians['IDs'] = np.setdiff1d(technicians['IDs'], technicianIDs).astype(int)
+    return technicianIDs
+
+#hand idle technicianIDs out to shards, first one per waiting failed device with shards taking turns,
+#then the rest in proportion to shards' N_devices, with any remainder going round-robin from shard=first
+def allocate_technicians(technicianIDs, N_waiting, N_devices, first):
+    N_shards = len(N_waiting)
+    grants = [[] for shard in range(N_shards)]
+    waiting = list(N_waiting)
+    idx = 0
+    while (idx < len(technicianIDs)) and (sum(waiting) > 0):
+        for shard in range(N_shards):
+            if (waiting[shard] > 0) and (idx < len(technicianIDs)):
+                grants[shard] += [technicianIDs[idx]]
+                waiting[shard] -= 1
+                idx += 1
+    N_spare = len(technicianIDs) - idx
+    shares = [(N_spare*n)//sum(N_devices) for n in N_devices]
+    for shard in range(N_shards):
+        grants[shard] += technicianIDs[idx:idx + shares[shard]]
+        idx += shares[shard]
+    shard = first%N_shards
+    while (idx < len(technicianIDs)):
+        grants[shard] += [technicianIDs[idx]]
+        idx += 1
+        shard = (shard + 1)%N_shards
+    return grants
+
+#worker process that simulates shard's N_devices devices, running the timesteps that it receives via conn
+def run_shard(params, shard, N_devices, device_offset, conn):
+    sim = initialize_simulation(params, N_devices, shard_seed(params['rn_seed'], shard),
+        shard_spill_prefix(params, shard), device_offset=device_offset)
+    technicians = sim['technicians']
+    release_idle_technicians(technicians)
+    while True:
+        command, times, technicianIDs = conn.recv()
+        if (command == 'run'):
+            grant_technicians(technicians, technicianIDs)
+            simulate_times(sim, times)
+            N_failed = np.count_nonzero(sim['devices']['state'] == FAILED)
+            conn.send((release_idle_technicians(technicians), N_failed))
+        else:
+            print_instruments(sim, 'shard ' + str(shard) + ': ')
+            spill_buffer(sim['repairs_buffer'])
+            spill_buffer(sim['telemetry_buffer'])
+            conn.send((sim['repairs_buffer']['N_spilled'], sim['telemetry_buffer']['N_spilled'], sim['summary'],
+                sim['aggregates']))
+            conn.close()
+            return
+
+#receive a message from shard's worker
+def receive(conn, shard):
+    try:
+        return conn.recv()
+    except EOFError:
+        raise RuntimeError('shard ' + str(shard) + ' worker exited unexpectedly')
+
+#sum the fleet-count rows (deviceID=-1) of the telemetry arrays that have the same time and sensor
+def sum_fleet_counts(arrays, columns):
+    fleet = (arrays['deviceID'] < 0)
+    keys = arrays['time'][fleet].astype(np.int64)*256 + arrays['sensor'][fleet]
+    keys, inverse = np.unique(keys, return_inverse=True)
+    counts = {'time':keys//256, 'deviceID':-1, 'sensor':keys%256,
+        'value':np.bincount(inverse, weights=arrays['value'][fleet])}
+    summed = {}
+    for column, dtype in columns:
+        value = np.broadcast_to(counts[column], keys.shape).astype(dtype)
+        summed[column] = np.concatenate([arrays[column][~fleet], value])
+    return summed
+
+#append the shards' buffers to buffer in time order, window timesteps at a time, with shard k's
+#deviceIDs offset by bounds[k] and with fleet counts summed over shards. Within a timestep, rows
+#are ordered by shard and fleet counts come last, as generate_telemetry does
+def merge_shard_buffers(shard_buffers, bounds, buffer, times, window):
+    columns = buffer['columns']
+    segments = [(segment, offset) for shard_buffer, offset in zip(shard_buffers, bounds)
+        for segment in buffer_segments(shard_buffer)]
+    for start in range(times[0], times[-1] + 1, window):
+        parts = {column:[np.zeros(0, dtype=dtype)] for column, dtype in columns}
+        for segment, offset in segments:
+            lo, hi = np.searchsorted(segment['time'], [start, start + window])
+            for column, dtype in columns:
+                parts[column] += [np.array(segment[column][lo:hi])]
+            deviceIDs = parts['deviceID'][-1]
+            deviceIDs[deviceIDs >= 0] += offset
+        arrays = {column:np.concatenate(parts[column]) for column, dtype in columns}
+        if ('sensor' in arrays):
+            arrays = sum_fleet_counts(arrays, columns)
+        order = np.argsort(arrays['time'].astype(np.int64)*2 + (arrays['deviceID'] < 0), kind='mergesort')
+        append_rows(buffer, {column:arrays[column][order] for column, dtype in columns})
+    return
+
+#simulate the fleet in N_shards worker processes that sync their technicians every shard_sync
+#timesteps, and return the merged repairs and telemetry buffers and the summed summary and aggregates,
+#with the merged buffers streamed to their output files by writer when it is not None
+def run_shards(params, N_shards, shard_sync, writer=None):
+    from multiprocessing import Process, Pipe
+    bounds = np.linspace(0, params['N_devices'], N_shards + 1).astype(int)
+    N_devices = list(np.diff(bounds))
+    conns = []
+    workers = []
+    for shard in range(N_shards):
+        conn, worker_conn = Pipe()
+        worker = Process(target=run_shard, args=(params, shard, N_devices[shard], bounds[shard], worker_conn))
+        worker.start()
+        worker_conn.close()
+        conns += [conn]
+        workers += [worker]
+
+    #run shard_sync timesteps at a time, handing out idle technicians before each batch
+    times = range(params['time_start'], params['time_start'] + params['N_timesteps'])
+    idle_technicianIDs = range(params['N_technicians'])
+    N_waiting = [0]*N_shards
+    for batch, start in enumerate(range(0, len(times), shard_sync)):
+        grants = allocate_technicians(idle_technicianIDs, N_waiting, N_devices, batch)
+        for conn, technicianIDs in zip(conns, grants):
+            conn.send(('run', times[start:start + shard_sync], technicianIDs))
+        idle_technicianIDs = []
+        N_waiting = []
+        for shard, conn in enumerate(conns):
+            technicianIDs, N_failed = receive(conn, shard)
+            idle_technicianIDs += technicianIDs
+            N_waiting += [N_failed]
+
+    #collect the workers' spilled outputs, summaries, and aggregates
+    N_spilled = []
+    summary = initialize_summary()
+    aggregates = None
+    for shard, conn in enumerate(conns):
+        conn.send(('finish', None, None))
+        N_repairs, N_telemetry, shard_summary, shard_aggregates = receive(conn, shard)
+        N_spilled += [(N_repairs, N_telemetry)]
+        for key in summary.keys():
+            summary[key] += shard_summary[key]
+        if (shard_aggregates is not None):
+            if (aggregates is None):
+                aggregates = initialize_aggregates(params, shard_aggregates['issue_names'])
+            merge_aggregates(aggregates, shard_aggregates)
+    for worker in workers:
+        worker.join()
+
+    #merge the shards' outputs into buffers that spill to output_folder, as single-process runs do
+    strategy = params['strategy']
+    buffer_size = params['buffer_size']
+    issues = params['issues']
+    issue_names = sorted(issues.keys(), key=lambda issue: issues[issue]['ID'])
+    kinds = [('repairs', repairs_columns, {'issue':issue_names}),
+        ('telemetry', telemetry_columns, {'sensor':telemetry_sensor_names(sensor_names, state_names)})]
+    merged = []
+    for kind, columns, categories in kinds:
+        shard_buffers = [open_spilled_buffer(columns, shard_spill_prefix(params, shard) + kind + '_' + strategy + '.spill',
+            categories, N_spilled[shard][len(merged)]) for shard in range(N_shards)]
+        N_rows = sum([buffer_length(shard_buffer) for shard_buffer in shard_buffers])
+        window = max(1, (buffer_size*len(times))//max(N_rows, 1))
+        print 'merging ' + str(N_shards) + ' shards of ' + kind + '...'
+        buffer = make_buffer(columns, buffer_size, params['output_folder'] + kind + '_' + strategy + '.spill', categories)
+        attach_writer(writer, buffer, output_file(params, kind))
+        merge_shard_buffers(shard_buffers, bounds, buffer, times, window)
+        for shard_buffer in shard_buffers:
+            delete_spill_files(shard_buffer)
+        merged += [buffer]
+    repairs_buffer, telemetry_buffer = merged
+    return repairs_buffer, telemetry_buffer, summary, aggregates
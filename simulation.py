@@ -0,0 +1,273 @@
+#simulation.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#the simulation's state and its timestep, which are shared by pdm.py and the shard workers in shards.py.
+#params is the dict of pdm.py's input parameters.
+
+
+#imports
+import time as tm
+import numpy as np
+from helper_fns import *
+from buffers import *
+from events import *
+from instruments import *
+from aggregates import *
+from writer import *
+from streaming import *
+from scoring import initialize_scoring
+from labeling import initialize_labeler
+
+#sensor names
+sensor_names = ['temperature', 'pressure', 'load']
+
+#load the pdm models in model_folder for strategy='pdm', and flatten their forests for batch inference as needed,
+#or with pdm_inference='mmap' memory-map their forest artifact rather than unpickling the models
+def load_models(params):
+    models = {}
+    forest = None
+    if (params['strategy'] == 'pdm'):
+        issues = params['issues']
+        pdm_threshold_time = params['pdm_threshold_time']
+        fatal_issues = [issue_name for issue_name, d in issues.iteritems() if (d['fatal'] == True)]
+        model_folder = params['model_folder']
+        if (params['pdm_inference'] == 'mmap'):
+            from forest_inference import load_forest_artifact
+            y_cols = [issue + '_in_' + str(pdm_threshold_time) for issue in fatal_issues]
+            forest = load_forest_artifact(model_folder, y_cols, pdm_threshold_time, n_threads=params['pdm_threads'])
+            return models, forest
+        for issue in fatal_issues:
+            y_col = issue + '_in_' + str(pdm_threshold_time)
+            model_file = model_folder + y_col + '_model.pkl'
+            print 'loading ' + model_file
+            with open(model_file, 'rb') as file:
+                import pickle as pkl
+                models[y_col] = pkl.load(file)
+        if (params['pdm_inference'] == 'flat'):
+            from forest_inference import flatten_forests
+            y_cols = [issue + '_in_' + str(pdm_threshold_time) for issue in fatal_issues]
+            forest = flatten_forests(models, y_cols, n_threads=params['pdm_threads'])
+    return models, forest
+
+#get sim's pdm models and forest, which are loaded on the first pdm check so that runs start quickly,
+#reporting the time that loading took and this process' resident memory afterwards
+def pdm_models(sim):
+    if (sim['models'] is None):
+        clock = tm.time()
+        sim['models'], sim['forest'] = load_models(sim['params'])
+        resident, file_backed = resident_memory()
+        print 'pdm models loaded in (sec) = ', round(tm.time() - clock, 3), '\tresident memory (MB) = ', \
+            round(resident, 1), '\tof which file-backed (MB) = ', round(file_backed, 1)
+    return sim['models'], sim['forest']
+
+#seed the random number generator with rn_seed, then initialize N_devices devices and the technicians,
+#dispatcher, output buffers, training records' labeler, and scheduled events that the simulation needs, with
+#buffers spilling to spill_prefix + '<kind>_<strategy>.spill' and the pdm models loaded by the first pdm check. When rng='counter' the devices draw from
+#counter-based streams seeded by params['rn_seed'] instead, with the devices' fleet-wide deviceIDs
+#starting at device_offset
+def initialize_simulation(params, N_devices, rn_seed, spill_prefix, device_offset=0):
+    np.random.seed(rn_seed)
+    if (params['kernel'] == 'batch') and (params['rng'] != 'counter'):
+        raise ValueError("kernel='batch' requires rng='counter'")
+    sim = {'params':params}
+    streams = None
+    if (params['rng'] == 'counter'):
+        from streams import make_streams
+        streams = make_streams(params['rn_seed'], device_offset + np.arange(N_devices), params['rng_block_size'])
+    sim['devices'] = devices = initialize_devices(N_devices, sensor_names, params['issues'],
+        params['output_interval'], params['time_start'], streams=streams)
+    sim['technicians'] = initialize_technicians(params['N_technicians'])
+    sim['dispatch'] = initialize_dispatch(params['dispatch_policy'])
+    sim['scoring'] = initialize_scoring(params, N_devices, len(sensor_names), params['time_start'])
+    sim['models'] = sim['forest'] = None
+    buffer_size = params['buffer_size']
+    strategy = params['strategy']
+    categories = {'sensor':telemetry_sensor_names(sensor_names, state_names)}
+    sim['telemetry_buffer'] = make_buffer(telemetry_columns, buffer_size, spill_prefix + 'telemetry_' + strategy + '.spill',
+        categories)
+    categories = {'issue':devices['issue_names']}
+    sim['repairs_buffer'] = make_buffer(repairs_columns, buffer_size, spill_prefix + 'repairs_' + strategy + '.spill',
+        categories)
+    sim['labeler'] = initialize_labeler(params, N_devices, devices['issue_names'],
+        telemetry_sensor_names(sensor_names, state_names), spill_prefix)
+    sim['events'] = None
+    if (params['kernel'] == 'event'):
+        sim['events'] = initialize_events(devices, params['issues'], params['time_start'])
+    sim['summary'] = initialize_summary()
+    sim['aggregates'] = initialize_aggregates(params, devices['issue_names'])
+    sim['batch_length'] = params['batch_size']
+    sim['time_start'] = params['time_start']
+    sim['instruments'] = initialize_instruments(params)
+    sim['stream'] = None
+    return sim
+
+#initialize the run's summary, whose entries are summed over timesteps and shards: the devices'
+#production_rate, the number of busy technicians, the number of failures, failure repairs, and pdm
+#maintenances, and the adaptive pdm scoring's device scorings done and saved and its at-risk decisions
+#that differ from full rescoring
+def initialize_summary():
+    summary = {'production':0.0, 'busy_technicians':0, 'N_failures':0, 'N_repairs':0, 'N_maintenance':0,
+        'N_scored':0, 'N_scores_saved':0, 'N_decisions_missed':0, 'N_decisions_added':0}
+    return summary
+
+#advance the simulation over times, which are consecutive timesteps
+def simulate_times(sim, times):
+    if (sim['params']['kernel'] == 'batch'):
+        from batch import simulate_batch
+        time = times[0]
+        while (time <= times[-1]):
+            time_next = simulate_batch(sim, time, times[-1] + 1)
+            report_progress(sim, time, time_next)
+            serve_stream(sim['stream'])
+            time = time_next
+    else:
+        for time in times:
+            simulate_timestep(sim, time)
+            report_progress(sim, time, time + 1)
+            serve_stream(sim['stream'])
+    return
+
+#advance the simulation by one timestep
+def simulate_timestep(sim, time):
+    params = sim['params']
+    devices = sim['devices']
+    technicians = sim['technicians']
+    dispatch = sim['dispatch']
+    events = sim['events']
+    summary = sim['summary']
+    aggregates = sim['aggregates']
+    issues = params['issues']
+    debug = params['debug']
+    event_kernel = (params['kernel'] == 'event')
+    timing = phase_times(sim)
+    clock = start_lap(timing)
+
+    #update operating devices' sensors
+    if (event_kernel):
+        update_operating_sensors(devices, params['sensor_sigma'], time)
+    else:
+        update_sensors(devices, params['sensor_sigma'], time)
+    clock = lap(timing, 'update_sensors', clock)
+
+    #update damage due to issues
+    crud_damage = update_damage(devices, issues, engine=params['damage_engine'])
+    clock = lap(timing, 'update_damage', clock)
+
+    #update devices' production_rate
+    compute_production(devices, issues, crud_damage)
+    clock = lap(timing, 'compute_production', clock)
+
+    #perform predictive maintenance if desired
+    if (params['strategy'] == 'pdm'):
+        if (time%params['pdm_skip_time'] == 0):
+            models, forest = pdm_models(sim)
+            repairs = pdm_check(devices, issues, time, technicians, models, params['maintenance_duration'],
+                params['pdm_threshold_time'], params['pdm_threshold_probability'], debug, forest=forest,
+                dispatch=dispatch, scoring=sim['scoring'], summary=summary)
+            append_records(sim['repairs_buffer'], repairs)
+            summary['N_maintenance'] += len(repairs)
+            if (aggregates is not None):
+                add_issues(aggregates, 'N_maintenance', time, repair_issueIDs(devices, repairs))
+            if (event_kernel):
+                schedule_repairs(events, devices, repairs)
+            clock = lap(timing, 'pdm_check', clock)
+
+    #flag any failed devices
+    if (event_kernel):
+        failed_deviceIDs = check_hazards(devices, issues, time, debug, dispatch=dispatch)
+    else:
+        failed_deviceIDs = check_devices(devices, issues, time, debug, dispatch=dispatch)
+    summary['N_failures'] += len(failed_deviceIDs)
+    if (aggregates is not None):
+        add_issues(aggregates, 'N_failures', time, devices['issue'][failed_deviceIDs])
+    clock = lap(timing, 'check_devices', clock)
+
+    #send first available technicians to repair failed deviceIDs
+    repairs = service_failed_devices(devices, technicians, time, params['repair_duration'], debug, dispatch=dispatch)
+    append_records(sim['repairs_buffer'], repairs)
+    summary['N_repairs'] += len(repairs)
+    if (aggregates is not None):
+        add_issues(aggregates, 'N_repairs', time, repair_issueIDs(devices, repairs))
+    if (event_kernel):
+        schedule_repairs(events, devices, repairs)
+    clock = lap(timing, 'service_failed_devices', clock)
+
+    #release devices and technicians when maintenance is complete
+    if (event_kernel):
+        complete_due_repairs(events, devices, issues, technicians, time, debug)
+    else:
+        complete_maintenance(devices, issues, technicians, time, debug)
+    clock = lap(timing, 'complete_maintenance', clock)
+
+    #generate sensor and telemetry update output_times, unless only aggregates are output
+    if (aggregates is None):
+        if (event_kernel):
+            generate_due_telemetry(events, devices, technicians, time, params['output_interval'], sim['telemetry_buffer'])
+        else:
+            generate_telemetry(devices, technicians, time, params['output_interval'], sim['telemetry_buffer'])
+    clock = lap(timing, 'generate_telemetry', clock)
+
+    #accumulate the summary's production and busy technicians
+    production = devices['production_rate'].sum()
+    busy_technicians = len(technicians['IDs']) - pool_size(technicians['idle'])
+    summary['production'] += production
+    summary['busy_technicians'] += busy_technicians
+    if (aggregates is not None):
+        add_timestep(aggregates, time, production, busy_technicians, devices['state_counts'])
+    clock = lap(timing, 'summary', clock)
+    return
+
+#write the repairs and telemetry buffers, and the training records' buffer when training_rows=True, to
+#output_folder, one chunk at a time, or wait for the background writer to finish streaming them there
+def write_output_buffers(params, repairs_buffer, telemetry_buffer, writer=None, training_buffer=None):
+    import os
+    chunk_size = params['buffer_size']
+    codec = params['output_codec']
+    kinds = [('repairs', repairs_buffer), ('telemetry', telemetry_buffer)]
+    if (training_buffer is not None):
+        kinds += [('training', training_buffer)]
+    if (writer is not None):
+        finish_writer(writer, [buffer for kind, buffer in kinds])
+    for kind, buffer in kinds:
+        if (buffer_length(buffer) > 0):
+            print kind + '.shape = ', (buffer_length(buffer), len(buffer['columns']))
+            path = output_file(params, kind)
+            if (params['output_format'] == 'parquet'):
+                if (writer is None):
+                    write_buffer_parquet(buffer, path, chunk_size, params['partition_size'], codec)
+                size = sum([os.path.getsize(os.path.join(folder, f)) for folder, subfolders, files in os.walk(path) for f in files])
+            else:
+                if (writer is None):
+                    write_buffer_csv(buffer, path, chunk_size, codec, params['output_level'])
+                size = os.path.getsize(path)
+            print path + ' size (MB) = ', size/(1024.0**2)
+    #the spill files are kept until all outputs are written, so a run that is interrupted while
+    #writing can still be resumed from its final checkpoint
+    for kind, buffer in kinds:
+        delete_spill_files(buffer)
+    return
+
+#write the run's summary metrics, whose mean_production is per device and timestep and whose
+#technician_utilization is the fraction of technicians that are busy, to output_folder/summary_<strategy>.json
+def write_summary(params, summary, wall_time):
+    import json
+    N_device_timesteps = params['N_devices']*params['N_timesteps']
+    N_technician_timesteps = max(params['N_technicians']*params['N_timesteps'], 1)
+    metrics = {'mean_production':summary['production']/N_device_timesteps,
+        'technician_utilization':float(summary['busy_technicians'])/N_technician_timesteps,
+        'N_failures':summary['N_failures'], 'N_repairs':summary['N_repairs'],
+        'N_maintenance':summary['N_maintenance'], 'wall_time':wall_time}
+    if (params['strategy'] == 'pdm') and (params['pdm_scoring'] == 'adaptive'):
+        keys = ['N_scored', 'N_scores_saved']
+        #the at-risk decisions that differ from full rescoring are only counted by an audit
+        if (params['pdm_scoring_audit']):
+            keys += ['N_decisions_missed', 'N_decisions_added']
+        for key in keys:
+            metrics[key] = summary[key]
+    file = params['output_folder'] + 'summary_' + params['strategy'] + '.json'
+    with open(file, 'w') as output:
+        json.dump(metrics, output, indent=4, sort_keys=True)
+    print file + ' = ', metrics
+    return metrics
@@ -0,0 +1,225 @@
+#streaming.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#publishes the telemetry rows and repairs to subscribers as they are generated, used by pdm.py when
+#stream_address is set. Subscribers connect to stream_address, either host:port for a TCP socket or a
+#path for a unix socket, and are first sent a json line that describes the stream, after which every
+#batch of rows that the simulation appends to its telemetry or repairs buffer is sent either as
+#newline-delimited json records or, when stream_format='binary', as a frame holding a 5-byte header
+#(struct '<BI' = kind code and number of rows) followed by the packed little-endian rows. Each subscriber
+#has a queue of at most stream_queue_size batches, and a subscriber whose queue is full either loses
+#the batch when stream_policy='drop' or makes the simulation wait for it when stream_policy='block'.
+#When stream_rate > 0 the simulation is paced so that at most stream_rate rows are published per
+#second of wall time. The sockets are non-blocking and are serviced with select between timesteps,
+#so the stream needs no thread, message broker, or asyncio, which python 2.7 lacks.
+
+
+#imports
+import os
+import time as tm
+import errno
+import json
+import select
+import socket
+import struct
+import numpy as np
+from collections import deque
+
+#codes of the kinds of rows in the binary frames' headers
+stream_kinds = ['telemetry', 'repairs']
+
+#open the socket that subscribers connect to, attach the stream to sim's buffers, and wait for
+#stream_subscribers subscribers to connect, or return None when stream_address is not set
+def open_stream(params, sim):
+    address = params['stream_address']
+    if (address is None):
+        return None
+    if (params['stream_format'] not in ['json', 'binary']):
+        raise ValueError("stream_format = " + str(params['stream_format']) + " is not one of ['json', 'binary']")
+    if (params['stream_policy'] not in ['drop', 'block']):
+        raise ValueError("stream_policy = " + str(params['stream_policy']) + " is not one of ['drop', 'block']")
+    if (':' in address):
+        host, port = address.rsplit(':', 1)
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, int(port)))
+    else:
+        if (os.path.exists(address)):
+            os.remove(address)
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(address)
+    listener.listen(16)
+    listener.setblocking(0)
+    stream = {'address':address, 'listener':listener, 'format':params['stream_format'],
+        'rate':params['stream_rate'], 'queue_size':params['stream_queue_size'], 'policy':params['stream_policy'],
+        'subscribers':[], 'N_published':0, 'N_batches':0, 'clock_start':None}
+    buffers = {kind:sim[kind + '_buffer'] for kind in stream_kinds}
+    stream['hello'] = describe_stream(stream, buffers)
+    for kind, buffer in buffers.iteritems():
+        buffer['on_append'] += [lambda buffer, rows, N, kind=kind: publish_rows(stream, kind, buffer, rows, N)]
+    print 'streaming to ' + address
+    while (len(stream['subscribers']) < params['stream_subscribers']):
+        print 'waiting for ' + str(params['stream_subscribers'] - len(stream['subscribers'])) + ' subscribers...'
+        pump_stream(stream, None)
+    stream['clock_start'] = tm.time()
+    return stream
+
+#get the json line that every subscriber gets first, with the kinds and columns of the published rows,
+#the names that the categorical columns' codes refer to, and the numpy dtypes of the binary frames'
+#rows, and store the dtypes and json templates that the rows are encoded with
+def describe_stream(stream, buffers):
+    hello = {'format':stream['format'], 'kinds':stream_kinds, 'columns':{}, 'categories':{}}
+    stream['dtypes'] = {}
+    stream['templates'] = {}
+    stream['quoted_names'] = {}
+    for kind, buffer in buffers.iteritems():
+        dtype = np.dtype([(column, np.dtype(column_dtype).newbyteorder('<')) for column, column_dtype in buffer['columns']])
+        stream['dtypes'][kind] = dtype
+        hello['columns'][kind] = [[column, dtype[column].str] for column, column_dtype in buffer['columns']]
+        hello['categories'][kind] = buffer['categories']
+        #json records are formatted with %-templates, with categorical codes replaced by quoted names
+        #and floats formatted by repr so they keep full precision
+        fields = ['"kind":"' + kind + '"']
+        for column, column_dtype in buffer['columns']:
+            if (column in buffer['categories']):
+                fields += ['"' + column + '":%s']
+            elif (np.issubdtype(column_dtype, np.floating)):
+                fields += ['"' + column + '":%r']
+            else:
+                fields += ['"' + column + '":%d']
+        stream['templates'][kind] = '{' + ','.join(fields) + '}\n'
+        stream['quoted_names'][kind] = {column:[json.dumps(name) for name in names]
+            for column, names in buffer['categories'].iteritems()}
+    return json.dumps(hello) + '\n'
+
+#encode the N rows that were just appended to buffer as a json or binary batch, and queue it for the
+#subscribers
+def publish_rows(stream, kind, buffer, rows, N):
+    if (N == 0):
+        return
+    arrays = {}
+    for column, dtype in buffer['columns']:
+        value = rows[column]
+        if (np.ndim(value) == 0):
+            arrays[column] = np.full(N, value, dtype=dtype)
+        else:
+            arrays[column] = np.asarray(value, dtype=dtype)
+    if (stream['format'] == 'json'):
+        values = []
+        for column, dtype in buffer['columns']:
+            column_values = arrays[column].tolist()
+            if (column in buffer['categories']):
+                quoted_names = stream['quoted_names'][kind][column]
+                column_values = [quoted_names[code] for code in column_values]
+            values += [column_values]
+        template = stream['templates'][kind]
+        batch = ''.join([template % row for row in zip(*values)])
+    else:
+        records = np.empty(N, dtype=stream['dtypes'][kind])
+        for column, dtype in buffer['columns']:
+            records[column] = arrays[column]
+        batch = struct.pack('<BI', stream_kinds.index(kind), N) + records.tobytes()
+    stream['N_published'] += N
+    stream['N_batches'] += 1
+    for subscriber in list(stream['subscribers']):
+        if (len(subscriber['queue']) >= stream['queue_size']):
+            if (stream['policy'] == 'drop'):
+                subscriber['N_dropped'] += N
+                continue
+            while (subscriber['open']) and (len(subscriber['queue']) >= stream['queue_size']):
+                pump_stream(stream, 1.0)
+        if (subscriber['open']):
+            subscriber['queue'].append((batch, N))
+    return
+
+#accept any new subscribers and send queued batches to those subscribers whose sockets are writable,
+#waiting at most timeout seconds for a socket to become ready, or indefinitely when timeout is None
+def pump_stream(stream, timeout):
+    listener = stream['listener']
+    writers = [subscriber['socket'] for subscriber in stream['subscribers'] if (len(subscriber['queue']) > 0)]
+    readable, writable, failed = select.select([listener], writers, [], timeout)
+    if (listener in readable):
+        accept_subscribers(stream)
+    for subscriber in list(stream['subscribers']):
+        if (subscriber['socket'] in writable):
+            send_batches(stream, subscriber)
+    return
+
+#accept pending connections, sending each new subscriber the stream's hello line
+def accept_subscribers(stream):
+    while True:
+        try:
+            connection, address = stream['listener'].accept()
+        except socket.error as e:
+            if (e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]):
+                return
+            raise
+        connection.setblocking(0)
+        subscriber = {'socket':connection, 'queue':deque([(stream['hello'], 0)]), 'offset':0, 'N_sent':0,
+            'N_dropped':0, 'open':True}
+        stream['subscribers'] += [subscriber]
+        print 'stream subscriber ' + str(len(stream['subscribers'])) + ' connected'
+
+#send subscriber's queued batches until its socket would block, dropping the subscriber if it has
+#disconnected
+def send_batches(stream, subscriber):
+    queue = subscriber['queue']
+    while (len(queue) > 0):
+        batch, N = queue[0]
+        try:
+            N_bytes = subscriber['socket'].send(memoryview(batch)[subscriber['offset']:])
+        except socket.error as e:
+            if (e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]):
+                return
+            close_subscriber(stream, subscriber)
+            return
+        subscriber['offset'] += N_bytes
+        if (subscriber['offset'] < len(batch)):
+            return
+        queue.popleft()
+        subscriber['offset'] = 0
+        subscriber['N_sent'] += N
+    return
+
+#close subscriber's socket and stop publishing to it
+def close_subscriber(stream, subscriber):
+    subscriber['socket'].close()
+    subscriber['open'] = False
+    stream['subscribers'].remove(subscriber)
+    print 'stream subscriber disconnected after ' + str(subscriber['N_sent']) + ' rows, ' + \
+        str(subscriber['N_dropped']) + ' dropped'
+    return
+
+#service the subscribers between timesteps, pausing as needed so that no more than stream_rate rows
+#per second are published
+def serve_stream(stream):
+    if (stream is None):
+        return
+    pump_stream(stream, 0)
+    if (stream['rate'] > 0):
+        wait = stream['N_published']/float(stream['rate']) - (tm.time() - stream['clock_start'])
+        while (wait > 0):
+            pump_stream(stream, wait)
+            wait = stream['N_published']/float(stream['rate']) - (tm.time() - stream['clock_start'])
+    return
+
+#send the subscribers their remaining batches, close their sockets and the listener, and print the
+#rows published and dropped
+def close_stream(stream):
+    if (stream is None):
+        return
+    while (sum([len(subscriber['queue']) for subscriber in stream['subscribers']]) > 0):
+        pump_stream(stream, 1.0)
+    elapsed = max(tm.time() - stream['clock_start'], 1.0e-9)
+    print 'streamed rows = ', stream['N_published'], '\tbatches = ', stream['N_batches'], \
+        '\trows/sec = ', int(stream['N_published']/elapsed)
+    for subscriber in list(stream['subscribers']):
+        print 'stream subscriber sent ' + str(subscriber['N_sent']) + ' rows, ' + str(subscriber['N_dropped']) + ' dropped'
+        subscriber['socket'].close()
+    stream['subscribers'] = []
+    stream['listener'].close()
+    if (':' not in stream['address']) and (os.path.exists(stream['address'])):
+        os.remove(stream['address'])
+    return
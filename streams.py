@@ -0,0 +1,127 @@
+#streams.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#counter-based random streams, used when rng='counter'. Every draw is a hash of rn_seed, the draw's
+#purpose, a deviceID or technicianID, and a counter that is usually the timestep, computed via the
+#splitmix64 generator. So every device and purpose has an independent stream, and a device's draws do
+#not depend on the fleet's size, on how the fleet is sharded, or on the order that draws are made in.
+#The draws that every device needs every timestep are generated in blocks that span many timesteps.
+
+
+#imports
+import numpy as np
+
+#the purposes that draws are made for, each having its own streams. The technicians purposes are
+#keyed by technicianID and the others by deviceID
+purposes = ['output_times', 'sensors', 'failures', 'hazard', 'dispatch', 'maintenance', 'technicians',
+    'maintenance_technicians']
+technician_purposes = ['technicians', 'maintenance_technicians']
+
+#splitmix64 constants
+gamma = 0x9e3779b97f4a7c15
+mask = 2**64 - 1
+
+#splitmix64 hash of python integer x
+def mix_int(x):
+    x = (x ^ (x >> 30))*0xbf58476d1ce4e5b9 & mask
+    x = (x ^ (x >> 27))*0x94d049bb133111eb & mask
+    return x ^ (x >> 31)
+
+#splitmix64 hash of uint64 array x, in place
+def mix(x):
+    x ^= (x >> np.uint64(30))
+    x *= np.uint64(0xbf58476d1ce4e5b9)
+    x ^= (x >> np.uint64(27))
+    x *= np.uint64(0x94d049bb133111eb)
+    x ^= (x >> np.uint64(31))
+    return x
+
+#initialize the streams of deviceIDs, which are the devices' fleet-wide IDs, with each block of
+#pregenerated draws holding about block_size draws
+def make_streams(rn_seed, deviceIDs, block_size):
+    streams = {'deviceIDs':np.asarray(deviceIDs, dtype=np.int64), 'block_size':block_size, 'blocks':{}}
+    streams['keys'] = {}
+    for idx, purpose in enumerate(purposes):
+        streams['keys'][purpose] = mix_int(mix_int(rn_seed & mask) ^ (idx + 1))
+    return streams
+
+#get the starting states of the purpose streams of IDs
+def stream_states(streams, purpose, IDs):
+    if (purpose not in technician_purposes):
+        IDs = streams['deviceIDs'][IDs]
+    states = np.asarray(IDs).astype(np.uint64) ^ np.uint64(streams['keys'][purpose])
+    return mix(states)
+
+#convert hashes to uniform draws in [0, 1)
+def hash_uniforms(x):
+    return (x >> np.uint64(11)).view(np.int64)*(2.0**-53)
+
+#convert hashes to pairs of standard normal draws, via the Box-Muller transform of each hash's upper
+#and lower 32 bits, with the cosine and sine draws concatenated along axis
+def hash_normals(x, axis):
+    u1 = ((x >> np.uint64(32)).view(np.int64) + 0.5)*(2.0**-32)
+    u2 = (x & np.uint64(0xffffffff)).view(np.int64)*(2.0*np.pi*2.0**-32)
+    r = np.sqrt(-2.0*np.log(u1))
+    return np.concatenate([r*np.cos(u2), r*np.sin(u2)], axis=axis)
+
+#draw hashes from the purpose streams of IDs, with draw number counter*N_lanes + lane, with IDs, counter, and lane broadcast
+def stream_hashes(streams, purpose, IDs, counter, lane, N_lanes):
+    draws = np.asarray(counter, dtype=np.int64)*N_lanes + lane
+    #uint64 arithmetic wraps around, as the hash intends
+    with np.errstate(over='ignore'):
+        x = stream_states(streams, purpose, IDs) + draws.astype(np.uint64)*np.uint64(gamma)
+    return mix(x)
+
+#uniform draws in [0, 1) from the purpose streams of IDs
+def stream_uniforms(streams, purpose, IDs, counter, lane=0, N_lanes=1):
+    return hash_uniforms(stream_hashes(streams, purpose, IDs, counter, lane, N_lanes))
+
+#return IDs in a random order that is drawn from their purpose streams at time
+def random_order(streams, purpose, IDs, time):
+    return IDs[np.argsort(stream_hashes(streams, purpose, IDs, time, 0, 1), kind='mergesort')]
+
+#get every device's N_lanes draws of kind='uniform' or 'normal' from the purpose streams at the
+#N_times timesteps starting at time, with shape (N_times, N_lanes, N_devices) so that each lane is contiguous
+def stream_block(streams, purpose, kind, time, N_times, N_lanes):
+    N_devices = len(streams['deviceIDs'])
+    #each hash yields two normal draws
+    N_hashes = N_lanes
+    if (kind == 'normal'):
+        N_hashes = (N_lanes + 1)//2
+    times = np.arange(time, time + N_times).reshape(N_times, 1, 1)
+    lanes = np.arange(N_hashes).reshape(1, N_hashes, 1)
+    deviceIDs = np.arange(N_devices).reshape(1, 1, N_devices)
+    x = stream_hashes(streams, purpose, deviceIDs, times, lanes, N_hashes)
+    if (kind == 'normal'):
+        return hash_normals(x, 1)[:, 0:N_lanes, :]
+    return hash_uniforms(x)
+
+#get every device's N_lanes draws of kind='uniform' or 'normal' from the purpose streams at time,
+#with shape (N_devices, N_lanes). Draws are served from a block of pregenerated draws spanning
+#several timesteps, and the next block is generated when time passes the end of the current block
+def block_draws(streams, purpose, kind, time, N_lanes):
+    block = streams['blocks'].get(purpose)
+    if (block is None) or (time < block['time']) or (time >= block['time'] + len(block['draws'])):
+        N_devices = len(streams['deviceIDs'])
+        N_times = max(1, streams['block_size']//max(N_devices*N_lanes, 1))
+        block = {'time':time, 'draws':stream_block(streams, purpose, kind, time, N_times, N_lanes)}
+        streams['blocks'][purpose] = block
+    return block['draws'][time - block['time']].T
+
+#get every device's N_lanes draws of kind from the purpose streams at the N_times timesteps starting
+#at time, with shape (N_times, N_lanes, N_devices), served from the same blocks that block_draws uses
+def block_range_draws(streams, purpose, kind, time, N_times, N_lanes):
+    draws = []
+    while (N_times > 0):
+        block_draws(streams, purpose, kind, time, N_lanes)
+        block = streams['blocks'][purpose]
+        start = time - block['time']
+        N = min(N_times, len(block['draws']) - start)
+        draws += [block['draws'][start:start + N]]
+        time += N
+        N_times -= N
+    if (len(draws) == 1):
+        return draws[0]
+    return np.concatenate(draws)
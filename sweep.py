@@ -0,0 +1,125 @@
+#sweep.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#this executes a parameter sweep, ie the grid of pdm.py runs that sweep_parameters spans, on
+#N_processes processes. Each run writes its inputs file, log, outputs, and summary into its own
+#folder inside sweep_folder, and the runs' summary metrics are collected into sweep_folder/results.csv.
+#A sweep is resumable: runs whose summary already exists are skipped, so rerunning an interrupted
+#sweep only executes the runs that did not complete, with runs that were checkpointed continuing
+#from their last checkpoint. Usage:
+#
+#    python sweep.py inputs_sweep.py
+
+
+#imports
+import os
+import sys
+import json
+import itertools
+import subprocess
+import time as tm
+
+#get the list of configurations spanned by sweep_parameters = {parameter:list of values},
+#with each configuration being a list of (parameter, value) pairs in sorted-parameter order
+def sweep_configurations(sweep_parameters):
+    names = sorted(sweep_parameters.keys())
+    values = [sweep_parameters[name] for name in names]
+    return [zip(names, config_values) for config_values in itertools.product(*values)]
+
+#name of the folder that config's run is stored in
+def run_name(config):
+    return '_'.join([name + '=' + str(value) for name, value in config])
+
+#the summary file that a complete run writes
+def run_summary_file(run_folder, strategy):
+    return os.path.join(run_folder, 'summary_' + strategy + '.json')
+
+#execute config's run of pdm.py in its own run_folder, which holds the base inputs overridden
+#by config and by output_folder=run_folder, and return the run's name and exit status
+def execute_run(base_inputs_path, sweep_folder, config, strategy):
+    name = run_name(config)
+    run_folder = os.path.join(sweep_folder, name) + '/'
+    if (os.path.exists(run_summary_file(run_folder, strategy))):
+        return name, 'skipped'
+    if (os.path.exists(run_folder) == False):
+        os.makedirs(run_folder)
+    inputs_path = run_folder + 'inputs.py'
+    with open(base_inputs_path, 'r') as file:
+        inputs = file.read()
+    inputs += '\n\n#sweep parameters\n'
+    for parameter, value in config + [('output_folder', run_folder)]:
+        inputs += parameter + ' = ' + repr(value) + '\n'
+    with open(inputs_path, 'w') as file:
+        file.write(inputs)
+    with open(run_folder + 'log.txt', 'w') as log:
+        status = subprocess.call([sys.executable, 'pdm.py', inputs_path, '--resume'], stdout=log, stderr=subprocess.STDOUT)
+    if (status != 0):
+        return name, 'failed with exit status ' + str(status) + ', see ' + run_folder + 'log.txt'
+    return name, 'complete'
+
+#collect the summaries of configs' complete runs into a dataframe
+def collect_results(sweep_folder, configs, strategy):
+    import pandas as pd
+    results = []
+    for config in configs:
+        summary_file = run_summary_file(os.path.join(sweep_folder, run_name(config)), strategy)
+        if (os.path.exists(summary_file)):
+            with open(summary_file, 'r') as file:
+                result = dict(config)
+                result.update(json.load(file))
+            results += [result]
+    columns = [name for name, value in configs[0]] + ['mean_production', 'technician_utilization', 'N_failures',
+        'N_repairs', 'N_maintenance', 'wall_time']
+    return pd.DataFrame(results, columns=columns)
+
+
+#get commandline argument
+try:
+    sweep_inputs_path = sys.argv[1]
+except:
+    sweep_inputs_path = 'inputs_sweep.py'
+
+#start time
+clock_start = tm.time()
+
+#read sweep parameters
+N_processes = 1
+execfile(sweep_inputs_path)
+print 'sweep_inputs_path = ', sweep_inputs_path
+print 'base_inputs_path = ', base_inputs_path
+print 'sweep_parameters = ', sweep_parameters
+print 'sweep_folder = ', sweep_folder
+print 'N_processes = ', N_processes
+
+#get the base inputs' strategy, which names the runs' summary files
+base_inputs = {}
+execfile(base_inputs_path, base_inputs)
+strategy = base_inputs['strategy']
+
+#execute the sweep's runs on a pool of N_processes, noting that each run is a separate pdm.py process
+#so the pool's threads only wait on those processes
+from multiprocessing.pool import ThreadPool
+configs = sweep_configurations(sweep_parameters)
+print 'executing ' + str(len(configs)) + ' runs...'
+def execute(config):
+    name, status = execute_run(base_inputs_path, sweep_folder, config, strategy)
+    print name + ' ' + status
+    return status
+pool = ThreadPool(N_processes)
+statuses = pool.map(execute, configs, chunksize=1)
+pool.close()
+
+#collect the results table
+results = collect_results(sweep_folder, configs, strategy)
+results_file = os.path.join(sweep_folder, 'results.csv')
+results.to_csv(results_file, index=False)
+print results_file + ' = '
+print results
+N_incomplete = len(configs) - len(results)
+if (N_incomplete > 0):
+    print str(N_incomplete) + ' runs are incomplete, rerun the sweep to resume them'
+
+#done
+print 'execution time (min) = ', (tm.time() - clock_start)/60.0
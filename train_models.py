@@ -0,0 +1,218 @@
+#train_models.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#this trains the pdm models that build_models.ipynb trains by hand. The rtf run's telemetry and repairs
+#are prepared with prep_rtf_data, then one RandomForestClassifier per fatal issue is fit for every
+#pdm_threshold_time in pdm_threshold_times and every forest size in n_estimators_grid, with the fits
+#executed N_processes at a time and each fit building its trees on n_jobs cores. Every execution
+#writes a new version of the models into model_folder/version_<k>/, with the models of each forest size
+#stored in their own n_estimators=<n>/ subfolder, which is where pdm.py's model_folder should point, along
+#with the forest_in_<pdm_threshold_time>/ artifacts that pdm_inference='mmap' memory-maps, and
+#with each model's train & test metrics and training time collected into metrics.csv. When training_file
+#is set, the records that an rtf run with training_rows=True labeled as it ran are read from that file
+#instead, which skips the preparation of the telemetry and repairs. Usage:
+#
+#    python train_models.py inputs_train.py
+
+
+#imports
+import os
+import sys
+import json
+import pickle as pkl
+import time as tm
+import numpy as np
+import pandas as pd
+from helper_fns import model_feature_columns
+
+#get the names of the feature columns, ordered as pdm.py's model features are, and of the target columns
+#that flag records whose device suffers a fatal issue within pdm_threshold_time
+def model_columns(issues, pdm_threshold_time):
+    x_cols, fatal_issues = model_feature_columns(issues)
+    y_cols = [issue + '_in_' + str(pdm_threshold_time) for issue in fatal_issues]
+    return x_cols, y_cols
+
+#get the records of operating devices that have no issue yet, with the pdm_threshold_time target columns
+#and without the records that lack any feature or target
+def training_records(records, issues, pdm_threshold_time):
+    df = records[(records.issue == 'none') & (records.production_rate > 0.1)].copy()
+    fatal_issues = model_feature_columns(issues)[1]
+    x_cols, y_cols = model_columns(issues, pdm_threshold_time)
+    for issue, y_col in zip(fatal_issues, y_cols):
+        df[y_col] = (df['time_til_' + issue] <= pdm_threshold_time).astype(int)
+    return df[~df[x_cols + y_cols].isna().any(axis=1)]
+
+#get the next version folder inside model_folder
+def next_version_folder(model_folder):
+    versions = [0]
+    if (os.path.exists(model_folder)):
+        versions += [int(name.split('_')[1]) for name in os.listdir(model_folder)
+            if name.startswith('version_') and name.split('_')[1].isdigit()]
+    return os.path.join(model_folder, 'version_' + str(max(versions) + 1)) + '/'
+
+#the model file that pdm.py loads from a model_folder
+def model_file(folder, y_col):
+    return folder + y_col + '_model.pkl'
+
+#accuracy, precision, recall, and area under the roc curve of model's predictions for x, y
+def model_metrics(model, x, y):
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, roc_auc_score
+    y_pred = model.predict(x)
+    metrics = {'accuracy':accuracy_score(y, y_pred), 'precision':precision_score(y, y_pred),
+        'recall':recall_score(y, y_pred), 'roc_auc':np.nan, 'N':len(y), 'N_positive':int(y.sum())}
+    if (len(np.unique(y)) == 2) and (len(model.classes_) == 2):
+        metrics['roc_auc'] = roc_auc_score(y, model.predict_proba(x)[:, 1])
+    return metrics
+
+#the train & test split of each pdm_threshold_time's records, which fork()ed pool processes inherit
+#rather than being sent with every job
+xy_splits = {}
+
+#fit the forest that job=(pdm_threshold_time, y_col, n_estimators) describes, save it in its forest
+#size's subfolder of version_folder, and return its metrics and training time
+def fit_model(job):
+    from sklearn.ensemble import RandomForestClassifier
+    pdm_threshold_time, y_col, n_estimators, x_cols, version_folder, n_jobs, rn_seed = job
+    xy_train, xy_test = xy_splits[pdm_threshold_time]
+    clock = tm.time()
+    model = RandomForestClassifier(n_estimators=n_estimators, random_state=rn_seed, n_jobs=n_jobs)
+    model.fit(xy_train[x_cols].values, xy_train[y_col].values)
+    training_time = tm.time() - clock
+    folder = version_folder + 'n_estimators=' + str(n_estimators) + '/'
+    if (os.path.exists(folder) == False):
+        os.makedirs(folder)
+    file = model_file(folder, y_col)
+    with open(file, 'wb') as output:
+        pkl.dump(model, output)
+    result = {'y_col':y_col, 'pdm_threshold_time':pdm_threshold_time, 'n_estimators':n_estimators,
+        'training_time':training_time, 'model_file':file}
+    for sample, xy in [('train', xy_train), ('test', xy_test)]:
+        for name, value in model_metrics(model, xy[x_cols].values, xy[y_col].values).iteritems():
+            result[sample + '_' + name] = value
+    print 'saved ' + file + ' in ' + str(round(training_time, 1)) + ' sec, test accuracy = ', result['test_accuracy']
+    return result
+
+
+#get commandline argument
+try:
+    train_inputs_path = sys.argv[1]
+except:
+    train_inputs_path = 'inputs_train.py'
+
+#start time
+clock_start = tm.time()
+
+#read training parameters
+N_processes = 1
+n_jobs = 1
+prep_cache_folder = None
+prep_cache_size = 10240
+training_file = None
+execfile(train_inputs_path)
+print 'train_inputs_path = ', train_inputs_path
+print 'base_inputs_path = ', base_inputs_path
+print 'telemetry_file = ', telemetry_file
+print 'repairs_file = ', repairs_file
+print 'time_bucket_size = ', time_bucket_size
+print 'pdm_threshold_times = ', pdm_threshold_times
+print 'n_estimators_grid = ', n_estimators_grid
+print 'test_size = ', test_size
+print 'model_folder = ', model_folder
+print 'N_processes = ', N_processes
+print 'n_jobs = ', n_jobs
+print 'prep_cache_folder = ', prep_cache_folder
+print 'prep_cache_size = ', prep_cache_size
+print 'training_file = ', training_file
+
+#get the base inputs' issues and rn_seed
+base_inputs = {}
+execfile(base_inputs_path, base_inputs)
+issues = base_inputs['issues']
+rn_seed = base_inputs['rn_seed']
+x_cols, fatal_issues = model_feature_columns(issues)
+print 'x_cols = ', x_cols
+print 'fatal_issues = ', fatal_issues
+
+#read the rtf run's labeled records from training_file, or prepare them, or read them from prep_cache_folder
+#when this rtf run was prepared before, and split each pdm_threshold_time's records into train & test samples
+from sklearn.model_selection import train_test_split
+if (training_file is not None):
+    from labeling import read_training_rows
+    print 'reading ' + training_file + ' ...'
+    telemetry = repairs = None
+    records = read_training_rows(training_file, issues)
+elif (prep_cache_folder is not None):
+    from prep_cache import cached_prep_rtf_data
+    telemetry, repairs, records = cached_prep_rtf_data(time_bucket_size, issues, telemetry_file, repairs_file,
+        cache_folder=prep_cache_folder, cache_size=prep_cache_size)
+else:
+    from helper_fns import prep_rtf_data
+    telemetry, repairs, records = prep_rtf_data(time_bucket_size, issues, telemetry_file, repairs_file)
+print 'records.shape = ', records.shape
+for pdm_threshold_time in pdm_threshold_times:
+    xy = training_records(records, issues, pdm_threshold_time)
+    xy_splits[pdm_threshold_time] = train_test_split(xy, test_size=test_size, random_state=rn_seed)
+    print 'pdm_threshold_time = ', pdm_threshold_time, '\txy_train.shape = ', xy_splits[pdm_threshold_time][0].shape, \
+        '\txy_test.shape = ', xy_splits[pdm_threshold_time][1].shape
+del telemetry, repairs, records
+
+#fit all models on a pool of N_processes processes, largest forests first, into the next version folder,
+#which is removed when any fit fails so that the next execution reuses its version number
+import shutil
+version_folder = next_version_folder(model_folder)
+jobs = []
+for pdm_threshold_time in pdm_threshold_times:
+    x_cols, y_cols = model_columns(issues, pdm_threshold_time)
+    for y_col in y_cols:
+        for n_estimators in n_estimators_grid:
+            jobs += [(pdm_threshold_time, y_col, n_estimators, x_cols, version_folder, n_jobs, rn_seed)]
+jobs = sorted(jobs, key=lambda job: -job[2])
+print 'fitting ' + str(len(jobs)) + ' models into ' + version_folder + '...'
+os.makedirs(version_folder)
+try:
+    if (N_processes > 1):
+        from multiprocessing import Pool
+        pool = Pool(N_processes)
+        results = pool.map(fit_model, jobs, chunksize=1)
+        pool.close()
+        pool.join()
+    else:
+        results = [fit_model(job) for job in jobs]
+except:
+    shutil.rmtree(version_folder, ignore_errors=True)
+    raise
+
+#write the forest artifact that pdm_inference='mmap' memory-maps, for each forest size and pdm_threshold_time
+from forest_inference import flatten_forests, forest_artifact_folder, write_forest_artifact
+for n_estimators in n_estimators_grid:
+    folder = version_folder + 'n_estimators=' + str(n_estimators) + '/'
+    for pdm_threshold_time in pdm_threshold_times:
+        x_cols, y_cols = model_columns(issues, pdm_threshold_time)
+        model_files = [model_file(folder, y_col) for y_col in y_cols]
+        models = {}
+        for y_col, file in zip(y_cols, model_files):
+            with open(file, 'rb') as input:
+                models[y_col] = pkl.load(input)
+        write_forest_artifact(flatten_forests(models, y_cols), forest_artifact_folder(folder, pdm_threshold_time), model_files)
+        print 'wrote forest artifact ' + forest_artifact_folder(folder, pdm_threshold_time)
+
+#write the models' metrics, and the version's training parameters
+columns = ['y_col', 'pdm_threshold_time', 'n_estimators', 'training_time'] + \
+    [sample + '_' + name for sample in ['train', 'test'] for name in ['N', 'N_positive', 'accuracy', 'precision',
+    'recall', 'roc_auc']] + ['model_file']
+metrics = pd.DataFrame(results, columns=columns).sort_values(['pdm_threshold_time', 'n_estimators', 'y_col'])
+metrics_file = version_folder + 'metrics.csv'
+metrics.to_csv(metrics_file, index=False)
+print metrics_file + ' = '
+print metrics
+version = {'telemetry_file':telemetry_file, 'repairs_file':repairs_file, 'time_bucket_size':time_bucket_size,
+    'pdm_threshold_times':pdm_threshold_times, 'n_estimators_grid':n_estimators_grid, 'test_size':test_size,
+    'rn_seed':rn_seed, 'fatal_issues':fatal_issues, 'created':tm.strftime('%Y-%m-%d %H:%M:%S'),
+    'wall_time':tm.time() - clock_start}
+with open(version_folder + 'version.json', 'w') as file:
+    json.dump(version, file, indent=4, sort_keys=True)
+
+#done
+print 'execution time (min) = ', (tm.time() - clock_start)/60.0
@@ -0,0 +1,128 @@
+#writer.py
+#
+#Copyright (c) 2018, Oracle and/or its affiliates. All rights reserved.
+#The Universal Permissive License (UPL), Version 1.0
+#
+#background writer of the telemetry and repairs outputs, used by pdm.py when output_writer='background'.
+#Whenever a buffer spills, the writer process is sent the range of rows that were just spilled, which it
+#reads back from the spill files via np.memmap, formats, compresses with output_codec at output_level,
+#and appends to the output file while the simulation fills the buffer again. Those messages pass through
+#a queue that holds at most writer_queue_size chunks, so a simulation that outpaces its writer waits
+#rather than piling up unwritten chunks. Since every chunk is compressed as a complete gzip member or a
+#flushed zstd block, the output files can be read while the run is still going. The writer is a process
+#rather than a thread because formatting the csv text holds the GIL.
+
+
+#imports
+import os
+import time as tm
+import multiprocessing as mp
+from Queue import Full
+from buffers import *
+
+#start the writer process, or return None when output_writer='serial' and the outputs are written
+#after the simulation is done
+def start_writer(params):
+    if (params['output_writer'] == 'serial'):
+        return None
+    if (params['output_writer'] != 'background'):
+        raise ValueError("output_writer = " + str(params['output_writer']) + " is not one of ['serial', 'background']")
+    #check the codec here, rather than in the writer process
+    if (params['output_format'] != 'parquet'):
+        csv_compressor(params['output_codec'], params['output_level'])
+    settings = {name:params[name] for name in ['output_format', 'output_codec', 'output_level', 'partition_size',
+        'buffer_size']}
+    queue = mp.Queue(maxsize=params['writer_queue_size'])
+    process = mp.Process(target=run_writer, args=(queue, settings))
+    process.daemon = True
+    process.start()
+    writer = {'process':process, 'queue':queue, 'wait_time':0.0}
+    return writer
+
+#put message on the writer's queue, waiting while the queue is full, and raise an error if the writer
+#process has died rather than waiting for it forever
+def send_message(writer, message):
+    clock = tm.time()
+    while True:
+        try:
+            writer['queue'].put(message, True, 1.0)
+            break
+        except Full:
+            if (writer['process'].is_alive() == False):
+                raise RuntimeError('the output writer exited with exitcode ' + str(writer['process'].exitcode))
+    writer['wait_time'] += tm.time() - clock
+    return
+
+#stream buffer's spilled rows to the output at path, starting with any rows that were spilled before
+#a resumed run's checkpoint
+def attach_writer(writer, buffer, path):
+    if (writer is None):
+        return
+    send_message(writer, ('open', buffer['spill_path'], buffer['columns'], buffer['categories'], path))
+    buffer['on_spill'] = lambda buffer, start, stop: send_message(writer, ('write', buffer['spill_path'], start, stop))
+    if (buffer['N_spilled'] > 0):
+        buffer['on_spill'](buffer, 0, buffer['N_spilled'])
+    return
+
+#spill the buffers' remaining rows, and wait for the writer to write them and close the outputs
+def finish_writer(writer, buffers):
+    for buffer in buffers:
+        spill_buffer(buffer)
+    send_message(writer, None)
+    clock = tm.time()
+    writer['process'].join()
+    writer['wait_time'] += tm.time() - clock
+    if (writer['process'].exitcode != 0):
+        raise RuntimeError('the output writer exited with exitcode ' + str(writer['process'].exitcode))
+    print 'time spent waiting on the output writer (sec) = ', writer['wait_time']
+    return
+
+#the writer process, which writes the spilled rows named by the queue's messages until it gets None
+def run_writer(queue, settings):
+    outputs = {}
+    while True:
+        message = queue.get()
+        if (message is None):
+            break
+        if (message[0] == 'open'):
+            spill_path, columns, categories, path = message[1:]
+            outputs[spill_path] = {'buffer':open_spilled_buffer(columns, spill_path, categories, 0), 'path':path,
+                'opened':False, 'file':None}
+        else:
+            spill_path, start, stop = message[1:]
+            write_spilled_rows(outputs[spill_path], settings, start, stop)
+    for output in outputs.values():
+        if (output['file'] is not None):
+            output['file'].write(output['finish']())
+            output['file'].close()
+    return
+
+#append the output's spilled rows start to stop to its file or parquet dataset, one chunk at a time,
+#creating the file when its first rows are written
+def write_spilled_rows(output, settings, start, stop):
+    import shutil
+    buffer = output['buffer']
+    path = output['path']
+    parquet = (settings['output_format'] == 'parquet')
+    if (output['opened'] == False):
+        if (parquet):
+            if (os.path.exists(path)):
+                shutil.rmtree(path)
+        else:
+            output['file'] = open(path, 'wb')
+            output['compress'], output['finish'] = csv_compressor(settings['output_codec'], settings['output_level'])
+        output['opened'] = True
+    buffer['N_spilled'] = stop
+    segment = buffer_segments(buffer)[0]
+    chunk_size = settings['buffer_size']
+    for chunk_start in range(start, stop, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, stop)
+        arrays = {column:segment[column][chunk_start:chunk_stop] for column, dtype in buffer['columns']}
+        df = columns_to_dataframe(buffer, arrays)
+        if (parquet):
+            write_parquet_chunk(df, path, settings['partition_size'], settings['output_codec'])
+        else:
+            output['file'].write(output['compress'](dataframe_to_csv(df)))
+    if (output['file'] is not None):
+        output['file'].flush()
+    return